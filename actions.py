@@ -0,0 +1,420 @@
+# actions.py
+import ast
+import io
+import logging
+import os
+import textwrap
+import tokenize
+from typing import Any, Dict, List, Optional, Set
+import metrics
+from agents.chunking import split_functions
+from gitpython import GitRepo, parse_unified_diff
+
+# Actions that change part of an existing file instead of rewriting it.
+PATCH_ACTIONS = ("replace_function", "apply_diff")
+
+
+class ActionError(Exception):
+    """Raised when an editor action cannot be applied or committed."""
+
+
+class ActionTransaction:
+    """
+    Applies editor actions to the working tree and commits them as one unit.
+
+    The original contents of every touched file are kept until the
+    transaction is committed, so a failing action (or a failing commit)
+    restores the working tree to its previous state.
+    """
+
+    def __init__(self, repo: GitRepo):
+        self.repo = repo
+        self._originals: Dict[str, Optional[bytes]] = {}
+
+    @property
+    def touched_paths(self) -> List[str]:
+        return list(self._originals)
+
+    def originals(self) -> Dict[str, Optional[str]]:
+        """The text of every touched file before the transaction (None if it was created)."""
+        return {
+            path: None if contents is None else contents.decode("utf-8", errors="replace")
+            for path, contents in self._originals.items()
+        }
+
+    def _remember(self, path: str):
+        """Keeps the current contents of `path` the first time it is touched."""
+        path = os.path.abspath(path)
+        if path in self._originals:
+            return
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self._originals[path] = f.read()
+        else:
+            self._originals[path] = None
+
+    def apply(self, action: Dict[str, Any], validate=False):
+        """
+        Applies a single action to the working tree.
+
+        If `validate` is True, Python files are compiled before being written
+        and an ActionError is raised on a syntax error. The result of a patch
+        action is always validated, since it is never seen whole by the editor.
+        """
+        action_type = action.get("type")
+        file_path = action.get("file_path")
+        if not file_path:
+            raise ActionError(f"Action '{action_type}' has no file_path.")
+
+        if action_type == "create_file" or action_type == "edit_file":
+            if action.get("file_contents") is None:
+                raise ActionError(f"Action '{action_type}' for {file_path} has no file_contents.")
+            if validate:
+                check_syntax(file_path, action["file_contents"])
+            with metrics.timer("file_write_seconds"):
+                self._remember(file_path)
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(action["file_contents"])
+            logging.info(f"Created or edited file {file_path}.")
+
+        elif action_type in PATCH_ACTIONS:
+            try:
+                # newline="" keeps CRLF files as they are.
+                with open(file_path, "r", encoding="utf-8", newline="") as f:
+                    current = f.read()
+            except FileNotFoundError:
+                raise ActionError(f"Action '{action_type}' targets missing file {file_path}.")
+            contents = patched_contents(action, current)
+            check_syntax(file_path, contents)
+            with metrics.timer("file_write_seconds"):
+                self._remember(file_path)
+                with open(file_path, "w", encoding="utf-8", newline="") as f:
+                    f.write(contents)
+            logging.info(f"Patched file {file_path} ({action_type}).")
+
+        elif action_type == "delete_file":
+            if os.path.exists(file_path):
+                self._remember(file_path)
+                os.remove(file_path)
+                logging.info(f"Deleted file {file_path}.")
+            else:
+                logging.warning(f"File {file_path} not found for deletion.")
+
+        else:
+            logging.warning(f"Skipping unknown action type '{action_type}'.")
+
+    def commit(self, message="Update") -> Optional[str]:
+        """
+        Commits every touched path in a single commit.
+
+        Raises:
+            ActionError: If the commit fails; the working tree is rolled back.
+        """
+        if not self._originals:
+            return None
+        with metrics.timer("git_commit_seconds"):
+            commit = self.repo.git_commit_paths(self.touched_paths, message)
+        if commit is None:
+            self.rollback()
+            raise ActionError("Committing the applied actions failed; changes rolled back.")
+        self._originals = {}
+        return commit
+
+    def rollback(self):
+        """Restores every touched file to its contents before the transaction."""
+        for path, contents in self._originals.items():
+            if contents is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(contents)
+        if self._originals:
+            logging.info(f"Rolled back {len(self._originals)} files.")
+        self._originals = {}
+
+
+def check_syntax(file_path: str, contents: str):
+    """Raises ActionError if `contents` of a Python file does not compile."""
+    if not file_path.endswith(".py"):
+        return
+    try:
+        compile(contents, file_path, "exec")
+    except SyntaxError as e:
+        raise ActionError(f"Edited {file_path} has a syntax error: {e}") from e
+
+
+def _newline(source: str) -> str:
+    """The line ending of a file: CRLF if its first line ends with one, else LF."""
+    first = source.find("\n")
+    return "\r\n" if first > 0 and source[first - 1] == "\r" else "\n"
+
+
+def _source_lines(source: str) -> List[str]:
+    """
+    The lines of Python source, endings included, split where the Python
+    tokenizer splits them; unlike str.splitlines, not at form feeds.
+    """
+    return io.StringIO(source, newline="").readlines()
+
+
+def _string_lines(code: str) -> Set[int]:
+    """
+    The numbers (from 0) of the lines that continue a multi-line string
+    literal; their leading whitespace is part of the string.
+    """
+    lines = set()
+    fstring_start = getattr(tokenize, "FSTRING_START", None)  # Python 3.12+
+    fstring_end = getattr(tokenize, "FSTRING_END", None)
+    fstrings = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.STRING:
+                lines.update(range(token.start[0], token.end[0]))
+            elif token.type == fstring_start:
+                fstrings.append(token.start[0])
+            elif token.type == fstring_end and fstrings:
+                lines.update(range(fstrings.pop(), token.end[0]))
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return lines
+
+
+def _reindent(code: str, indent: str) -> List[str]:
+    """
+    Moves `code` to the indentation `indent`, like textwrap.dedent followed
+    by textwrap.indent, but leaves the lines inside multi-line strings alone.
+    """
+    lines = [line.rstrip("\r\n") for line in _source_lines(code)]
+    strings = _string_lines(code)
+    margins = [
+        len(line) - len(line.lstrip())
+        for number, line in enumerate(lines)
+        if number not in strings and line.strip()
+    ]
+    margin = min(margins, default=0)
+    return [
+        line if number in strings else (indent + line[margin:] if line.strip() else "")
+        for number, line in enumerate(lines)
+    ]
+
+
+def _definition(code: str) -> Optional[ast.AST]:
+    """The first function definition in `code`, or None if it has none or does not parse."""
+    try:
+        tree = ast.parse(textwrap.dedent(code))
+    except SyntaxError:
+        return None
+    return next(
+        (node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))),
+        None,
+    )
+
+
+def _decorators(node: Optional[ast.AST]) -> List[str]:
+    return [ast.dump(decorator) for decorator in getattr(node, "decorator_list", [])]
+
+
+def replace_function(source: str, qualified_name: str, function_code: str) -> str:
+    """
+    Replaces a function or method, including its decorators, with
+    `function_code`, re-indented to the original's level. If `function_code`
+    has no decorators, the original ones are kept. A name defined more than
+    once (a property getter and setter, overloads) is only replaced if the
+    decorators of `function_code` single out one definition.
+
+    Raises:
+        ActionError: If the function is not found or is ambiguous, or the
+            result does not define it.
+    """
+    try:
+        chunks = [
+            chunk for chunk in split_functions(source) if chunk.qualified_name == qualified_name
+        ]
+    except SyntaxError as e:
+        raise ActionError(f"Cannot locate functions in a file that does not parse: {e}") from e
+    if not chunks:
+        raise ActionError(f"Function '{qualified_name}' not found.")
+
+    replacement_node = _definition(function_code)
+    chunk = chunks[0]
+    if len(chunks) > 1:
+        decorators = _decorators(replacement_node)
+        matching = [c for c in chunks if _decorators(_definition(c.source)) == decorators]
+        if len(matching) != 1:
+            raise ActionError(
+                f"'{qualified_name}' is defined {len(chunks)} times; give function_code "
+                "the decorators of the definition to replace, or use apply_diff."
+            )
+        chunk = matching[0]
+
+    code = "\n".join(_reindent(function_code.strip("\n"), ""))
+    original_node = _definition(chunk.source)
+    keep_decorators = (
+        replacement_node is not None
+        and not replacement_node.decorator_list
+        and original_node is not None
+    )
+    if keep_decorators:
+        # The original's decorator lines, comments between them included.
+        decorator_lines = _reindent(chunk.source, "")[: original_node.lineno - 1]
+        code = "\n".join(decorator_lines + [code]) if decorator_lines else code
+
+    newline = _newline(source)
+    lines = _source_lines(source)
+    first = lines[chunk.lineno - 1]
+    indent = first[: len(first) - len(first.lstrip())]
+    replacement = "".join(line + newline for line in _reindent(code, indent))
+    result = "".join(lines[: chunk.lineno - 1]) + replacement + "".join(lines[chunk.end_lineno :])
+
+    try:
+        replaced = {chunk.qualified_name for chunk in split_functions(result)}
+    except SyntaxError as e:
+        raise ActionError(f"Replacing '{qualified_name}' breaks the file: {e}") from e
+    if qualified_name not in replaced:
+        raise ActionError(f"The replacement code does not define '{qualified_name}'.")
+    return result
+
+
+def _find_block(lines: List[str], block: List[str], expected: int) -> Optional[int]:
+    """
+    Finds `block` in `lines`, trying the expected position first and then
+    positions further and further away; trailing whitespace is ignored.
+    """
+    if not block:
+        return min(max(expected, 0), len(lines))
+    block = [line.rstrip() for line in block]
+    last = len(lines) - len(block)
+    candidates = sorted(range(last + 1), key=lambda position: abs(position - expected))
+    for position in candidates:
+        if all(lines[position + i].rstrip() == text for i, text in enumerate(block)):
+            return position
+    return None
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """
+    Applies the hunks of a unified diff to `source`. Hunks whose line numbers
+    are off are located by their context lines. The file keeps its line
+    endings.
+
+    Raises:
+        ActionError: If the diff has no hunks or a hunk's context is not found.
+    """
+    hunks = parse_unified_diff(diff)
+    if not hunks:
+        raise ActionError("The diff contains no hunks.")
+    newline = _newline(source)
+    # Split like git: at "\n" only.
+    lines = source.split("\n")
+    final_newline = lines[-1] == ""
+    if final_newline:
+        lines.pop()
+    if newline == "\r\n":
+        lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+    drift = 0
+    for hunk in hunks:
+        old = [line[1:] for line in hunk.lines if line[:1] in (" ", "-")]
+        new = [line[1:].rstrip("\r") for line in hunk.lines if line[:1] in (" ", "+")]
+        # A pure insertion (-N,0) goes after line N.
+        expected = hunk.old_start - (1 if old else 0) + drift
+        position = _find_block(lines, old, expected)
+        if position is None:
+            raise ActionError(
+                f"Hunk @@ -{hunk.old_start},{hunk.old_lines} does not match the file."
+            )
+        if position + len(old) == len(lines):
+            final_newline = _final_newline(hunk.lines, final_newline)
+        lines[position : position + len(old)] = new
+        drift = position - (hunk.old_start - (1 if old else 0)) + len(new) - len(old)
+    if not lines:
+        return ""
+    return newline.join(lines) + (newline if final_newline else "")
+
+
+def _final_newline(hunk_lines: List[str], current: bool) -> bool:
+    """
+    Whether a file ends with a newline after a hunk that reaches its end.
+    "\\ No newline at end of file" after a line marks the side(s) that line
+    belongs to; without such markers the file keeps what it had.
+    """
+    old_missing = new_missing = False
+    previous = None
+    for line in hunk_lines:
+        if line.startswith("\\"):
+            old_missing = old_missing or previous in (" ", "-")
+            new_missing = new_missing or previous in (" ", "+")
+        previous = line[:1]
+    if old_missing != new_missing:
+        return old_missing
+    return current
+
+
+def patched_contents(action: Dict[str, Any], current: str) -> str:
+    """Returns the contents of a file after a replace_function or apply_diff action."""
+    action_type = action.get("type")
+    if action_type == "replace_function":
+        if not action.get("qualified_name") or not action.get("function_code"):
+            raise ActionError("replace_function needs a qualified_name and function_code.")
+        return replace_function(current, action["qualified_name"], action["function_code"])
+    if action_type == "apply_diff":
+        if not action.get("diff"):
+            raise ActionError("apply_diff needs a diff.")
+        return apply_unified_diff(current, action["diff"])
+    raise ActionError(f"'{action_type}' is not a patch action.")
+
+
+def validate_actions(actions: List[Dict[str, Any]]):
+    """
+    Checks a set of actions without touching the working tree: every edited
+    Python file must compile, and every patch must apply, in order.
+
+    Raises:
+        ActionError: For the first action that would fail.
+    """
+    pending: Dict[str, Optional[str]] = {}
+    for action in actions:
+        action_type = action.get("type")
+        file_path = action.get("file_path")
+        if not file_path:
+            continue
+        path = os.path.abspath(file_path)
+        if action_type in ("create_file", "edit_file"):
+            check_syntax(file_path, action.get("file_contents") or "")
+            pending[path] = action.get("file_contents") or ""
+        elif action_type in PATCH_ACTIONS:
+            if path in pending:
+                current = pending[path]
+                if current is None:
+                    raise ActionError(f"Action '{action_type}' targets deleted file {file_path}.")
+            else:
+                try:
+                    with open(file_path, "r", encoding="utf-8", newline="") as f:
+                        current = f.read()
+                except FileNotFoundError:
+                    raise ActionError(f"Action '{action_type}' targets missing file {file_path}.")
+            try:
+                contents = patched_contents(action, current)
+            except ActionError as e:
+                raise ActionError(f"{file_path}: {e}") from e
+            check_syntax(file_path, contents)
+            pending[path] = contents
+        elif action_type == "delete_file":
+            pending[path] = None
+
+
+def apply_actions(actions: List[Dict[str, Any]], repo: GitRepo, message="Update") -> Optional[str]:
+    """
+    Applies all actions and commits them together, rolling back on any failure.
+
+    Returns:
+        The commit id, or None if no file was touched.
+    """
+    transaction = ActionTransaction(repo)
+    try:
+        for action in actions:
+            transaction.apply(action)
+    except Exception:
+        transaction.rollback()
+        raise
+    return transaction.commit(message)
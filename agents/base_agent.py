@@ -1,7 +1,18 @@
 # agents/base_agent.py
-from api.api import API
+import logging
+import time
+from api.api import API, last_usage, reset_usage
+from api.budget import RequestPlan, plan_request
 from abc import ABC, abstractmethod
-from xml.etree import ElementTree
+from typing import Optional
+from agents.prompt_template import (
+    PromptTemplate,
+    get_template,
+    load_role_description,
+    load_structure,
+)
+import metrics
+import prompt_trace
 
 
 class BaseAgent(ABC):
@@ -9,34 +20,102 @@ class BaseAgent(ABC):
     An abstract base class for agents in the system.
     """
 
-    def __init__(self, api: API, role_path: str, structure_path: str):
+    AGENT_NAME = "agent"
+
+    def __init__(
+        self,
+        api: API,
+        role_path: str,
+        structure_path: str,
+        tracer: Optional[prompt_trace.TraceWriter] = None,
+    ):
         self.api = api
+        self.tracer = tracer or prompt_trace.get_tracer()
         self.structure_prefix = """Output Structure Instructions:
 1. The LLM must adhere strictly to the schema provided.
 2. The LLM must use the XML format provided.
         """
         self.role_description = self._load_role_description(role_path)
+        self.structure_path = structure_path
         self.structure = self._load_output_structure(self.structure_prefix, structure_path)
 
     def _load_role_description(self, role_path: str) -> str:
         """
         Loads the role description for this agent from role.xml
+        (read once per process).
         """
-        tree = ElementTree.parse(role_path)
-        root = tree.getroot()
-        description = root.find("description").text
-        return description
+        return load_role_description(role_path)
 
     def _load_output_structure(self, prefix: str, structure_path: str) -> str:
         """
         Loads the output structure for this agent from structure.xml
+        (read once per process).
+        """
+        return prefix + load_structure(structure_path)
+
+    def prompt_template(self, instructions: str) -> PromptTemplate:
+        """
+        Returns the template whose static prefix is this agent's role,
+        structure and `instructions`, shared by every prompt it sends.
+        """
+        return get_template(
+            self.AGENT_NAME, self.role_description, self.structure, instructions
+        )
+
+    def plan(self, prompt: str, min_output_tokens: int = 1024) -> RequestPlan:
+        """
+        Plans the token budget of a request before sending it.
+
+        Raises:
+            ContextWindowExceeded: If the request cannot fit the model's limits.
         """
-        with open(structure_path, "r", encoding="utf-8") as xml:
-            content = xml.read()  # Read the entire file content
-        return prefix + content
+        return plan_request(self.api, prompt, min_output_tokens=min_output_tokens)
+
+    def _trace(self, file_path: str, prompt: str, response, started: float, error=None):
+        """Hands a prompt/response pair to the trace writer, if sampled."""
+        usage = last_usage()
+        provider = getattr(self.api, "api_name", "unknown")
+        metrics.observe(
+            "provider_latency_seconds",
+            time.perf_counter() - started,
+            agent=self.AGENT_NAME,
+            provider=provider,
+        )
+        metrics.record_usage(usage, agent=self.AGENT_NAME, provider=provider)
+        if error is not None:
+            metrics.inc("provider_errors_total", agent=self.AGENT_NAME, provider=provider)
+        if usage and usage.get("prompt_tokens"):
+            logging.info(
+                f"{self.AGENT_NAME}: {usage['cached_tokens']} of {usage['prompt_tokens']} "
+                f"prompt tokens served from the provider's prompt cache."
+            )
+        if self.tracer is None or not self.tracer.sampled():
+            return
+        self.tracer.record(
+            agent=self.AGENT_NAME,
+            file=file_path,
+            prompt=prompt,
+            response=response,
+            elapsed=time.perf_counter() - started,
+            usage=usage,
+            error=error,
+        )
+
+    async def _generate(self, prompt: str, file_path: str, **kwargs):
+        """Calls the API and traces the prompt, response, usage and timing."""
+        started = time.perf_counter()
+        reset_usage()
+        try:
+            response = await self.api.generate_text(prompt, **kwargs)
+        except Exception as e:
+            self._trace(file_path, prompt, None, started, error=str(e))
+            raise
+        self._trace(file_path, prompt, response, started)
+        return response
 
     def set_prefix(self, prefix: str):
         self.structure_prefix = prefix
+        self.structure = self._load_output_structure(prefix, self.structure_path)
 
     @abstractmethod
     def _load_instructions(self) -> str:
@@ -0,0 +1,102 @@
+# agents/chunking.py
+import ast
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class FunctionChunk:
+    """
+    A single function or method extracted from a script.
+    """
+
+    name: str
+    qualified_name: str
+    lineno: int
+    end_lineno: int
+    source: str
+    class_name: Optional[str] = None
+
+
+def _segment(lines: List[str], start: int, end: int) -> str:
+    """Returns the source lines [start, end] (1-based, inclusive)."""
+    return "".join(lines[start - 1 : end])
+
+
+def _first_line(node: ast.AST) -> int:
+    """Returns the first line of a node, including its decorators."""
+    decorators = getattr(node, "decorator_list", None) or []
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def split_functions(source: str) -> List[FunctionChunk]:
+    """
+    Splits a script into its top-level functions and class methods.
+
+    Nested classes are walked as well; functions defined inside other
+    functions stay part of their enclosing function.
+
+    Raises:
+        SyntaxError: If the script cannot be parsed.
+    """
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    chunks = []
+
+    def visit(body, prefix: str, class_name: Optional[str]):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                start = _first_line(node)
+                chunks.append(
+                    FunctionChunk(
+                        name=node.name,
+                        qualified_name=prefix + node.name,
+                        lineno=start,
+                        end_lineno=node.end_lineno,
+                        source=_segment(lines, start, node.end_lineno),
+                        class_name=class_name,
+                    )
+                )
+            elif isinstance(node, ast.ClassDef):
+                visit(node.body, f"{prefix}{node.name}.", prefix + node.name)
+
+    visit(tree.body, "", None)
+    return chunks
+
+
+def _class_signature(node: ast.ClassDef, lines: List[str]) -> str:
+    """Returns the class statement and its non-function body statements."""
+    start = _first_line(node)
+    body_start = node.body[0].lineno if node.body else node.end_lineno + 1
+    header = _segment(lines, start, body_start - 1)
+    for item in node.body:
+        if isinstance(item, (ast.Assign, ast.AnnAssign)):
+            header += _segment(lines, item.lineno, item.end_lineno)
+    return header
+
+
+def build_header(source: str, class_name: Optional[str] = None) -> str:
+    """
+    Builds the minimal shared context sent alongside a single function:
+    the module imports, module-level globals and, for methods, the signature
+    of the enclosing class.
+    """
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    parts = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign)):
+            parts.append(_segment(lines, node.lineno, node.end_lineno))
+
+    if class_name:
+        body = tree.body
+        for name in class_name.split("."):
+            node = next(
+                (n for n in body if isinstance(n, ast.ClassDef) and n.name == name),
+                None,
+            )
+            if node is None:
+                break
+            parts.append(_class_signature(node, lines))
+            body = node.body
+    return "".join(parts)
@@ -1,8 +1,18 @@
 # agents/function_analyzer/function_analyzer.py
 import asyncio
 import logging
+import re
+import metrics
+from typing import List, Optional
 from agents.base_agent import BaseAgent
-from api.api import API
+from agents.chunking import FunctionChunk, build_header, split_functions
+from api.api import API, run_sync
+from api.budget import ContextWindowExceeded, RequestPlan
+
+
+_FUNCTION_ANALYSIS_RE = re.compile(
+    r"<function_analysis>.*?</function_analysis>", re.DOTALL
+)
 
 
 class FunctionAnalyzer(BaseAgent):
@@ -12,30 +22,60 @@ class FunctionAnalyzer(BaseAgent):
     improvements.
     """
 
-    def __init__(self, api: API):
+    AGENT_NAME = "function_analyzer"
+
+    def __init__(self, api: API, chunked: bool = False, max_concurrency: int = 8):
         """
         Initialize the ScriptFunctionAnalyzer.
+
+        Args:
+            api: The API used for text generation.
+            chunked: If True, analyze each function in its own request.
+            max_concurrency: Maximum number of per-function requests in flight.
         """
         super().__init__(
             api,
             role_path="agents/function_analyzer/role.xml",
             structure_path="agents/function_analyzer/structure.xml",
         )
+        self.chunked = chunked
+        self.max_concurrency = max_concurrency
 
     def _load_instructions(self) -> str:
         return """
         Analyze the function in the original script to identify potential issues and propose targeted improvements.
         """
 
+    def _load_chunk_instructions(self) -> str:
+        return """
+        Analyze only the function named in function_name. The rest of the original script is a shared
+        header (imports, module globals and the enclosing class signature) provided as context; do not analyze it.
+        Report line numbers relative to the full script, starting at the given line.
+        """
+
     def load_file(self, file_path: str) -> str:
         with open(file_path, "r") as file:
             return file.read()
-        
+
     def run_agent(
         self,
         original_script: str,
+        functions: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Synchronous entry point; runs `run_agent_async` in a fresh event loop.
+        """
+        return run_sync(self.api, self.run_agent_async(original_script, functions))
+
+    async def run_agent_async(
+        self,
+        original_script: str,
+        functions: Optional[List[str]] = None,
     ) -> str:
         """
+        If `functions` is given, only those qualified names are analyzed,
+        each in its own request.
+
         The main workflow:
           1) Parse the analysis report and locate the corresponding functions
              in the original Python script.
@@ -47,25 +87,115 @@ class FunctionAnalyzer(BaseAgent):
         if not original_script:
             raise ValueError(f"Could not find the script at '{original_script}'.")
 
-        # Create the root element
-        prompt = "<function_analyzer>"
-        # Add subelements
-        prompt += f"<instructions>{self._load_instructions()}</instructions>"
-        prompt += f"<original_script path='{original_script}'>{self.load_file(original_script)}</original_script>"
-        prompt += f"<role_description>{self.role_description}</role_description>"
-        prompt += f"<structure>{self.structure}</structure>"
-        prompt += "</function_analyzer>"
-        # logging.info(f"Editing function with prompt: {prompt}")
-
-        # Log the prompt to a file
-        with open(
-            "function_analyzer_sent_prompts.log", "a", encoding="utf-8"
-        ) as log_file:
-            log_file.write(f"Prompt Sent:\n{prompt}\n\n")
-
-        response = asyncio.run(self.api.generate_text(prompt))
+        source = self.load_file(original_script)
+        if self.chunked or functions is not None:
+            chunks = self._split(original_script, source)
+            if functions is not None and chunks:
+                selected = set(functions)
+                chunks = [chunk for chunk in chunks if chunk.qualified_name in selected]
+                if not chunks:
+                    return merge_reports([])
+            if chunks:
+                return await self._run_chunked(original_script, source, chunks)
+
+        # Static role, structure and instructions first, then the script.
+        with metrics.timer("prompt_build_seconds", agent=self.AGENT_NAME):
+            prompt = self.prompt_template(self._load_instructions()).render(
+                ("original_script", source, {"path": original_script})
+            )
+        try:
+            plan = self.plan(prompt)
+        except ContextWindowExceeded as e:
+            chunks = self._split(original_script, source)
+            if not chunks:
+                raise
+            logging.info(
+                f"{original_script} does not fit in one request ({e}). "
+                f"Analyzing it per function instead."
+            )
+            return await self._run_chunked(original_script, source, chunks)
+
+        response = await self._generate(
+            prompt, original_script, max_tokens=plan.max_output_tokens
+        )
         return response
 
+    def _split(self, original_script: str, source: str) -> List[FunctionChunk]:
+        """Splits the script into functions, or returns [] if it does not parse."""
+        try:
+            return split_functions(source)
+        except SyntaxError as e:
+            logging.warning(f"Could not split {original_script} into functions: {e}")
+            return []
+
+    def _build_chunk_prompt(
+        self, original_script: str, header: str, chunk: FunctionChunk
+    ) -> str:
+        """Builds the prompt for a single function and its shared header."""
+        return self.prompt_template(self._load_chunk_instructions()).render(
+            ("function_name", chunk.qualified_name, {"line": chunk.lineno}),
+            ("original_script", f"{header}\n{chunk.source}", {"path": original_script}),
+        )
+
+    async def _run_chunked(
+        self, original_script: str, source: str, chunks: List[FunctionChunk]
+    ) -> str:
+        """
+        Analyzes every function in its own request, running the requests
+        concurrently, and merges the results into a single report.
+        """
+        headers = {}
+        for chunk in chunks:
+            if chunk.class_name not in headers:
+                headers[chunk.class_name] = build_header(source, chunk.class_name)
+
+        # Plan every request first, so an oversize function fails the file
+        # before anything is sent.
+        requests = []
+        for chunk in chunks:
+            with metrics.timer("prompt_build_seconds", agent=self.AGENT_NAME):
+                prompt = self._build_chunk_prompt(
+                    original_script, headers[chunk.class_name], chunk
+                )
+            try:
+                plan = self.plan(prompt)
+            except ContextWindowExceeded as e:
+                raise ContextWindowExceeded(
+                    f"{chunk.qualified_name} in {original_script} is too large: {e}"
+                ) from e
+            requests.append((prompt, plan))
+
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def analyze(prompt: str, plan: RequestPlan) -> Optional[str]:
+            async with semaphore:
+                return await self._generate(
+                    prompt, original_script, max_tokens=plan.max_output_tokens
+                )
+
+        logging.info(
+            f"Analyzing {len(chunks)} functions of {original_script} in parallel."
+        )
+        responses = await asyncio.gather(*(analyze(*request) for request in requests))
+        with metrics.timer("xml_parse_seconds", agent=self.AGENT_NAME):
+            return merge_reports(responses)
+
+
+def merge_reports(responses: List[Optional[str]]) -> str:
+    """
+    Merges per-function analysis responses into a single report that follows
+    the analyzer's structure.xml schema.
+    """
+    blocks = []
+    for response in responses:
+        if not response:
+            continue
+        found = _FUNCTION_ANALYSIS_RE.findall(response)
+        if not found:
+            logging.warning("Analyzer response contained no function_analysis block.")
+        blocks.extend(found)
+    return "<structure>\n" + "\n".join(blocks) + "\n</structure>"
+
 
 if __name__ == "__main__":
     from api.google_api import GoogleAPI
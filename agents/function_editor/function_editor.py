@@ -1,10 +1,32 @@
 # agents/function_editor/function_editor.py
 import asyncio
 import logging
+import time
+import metrics
+from actions import ActionError, validate_actions
 from agents.base_agent import BaseAgent
-from api.api import API
+from api.api import API, reset_usage, run_sync
+from api.budget import ContextWindowExceeded, RequestPlan, estimate_tokens
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Any
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+
+# Output budget that must be available for patch actions on a large file.
+PATCH_OUTPUT_TOKENS = 4096
+
+# Optional child elements of <action>, copied into the action dictionary.
+ACTION_FIELDS = ("file_path", "file_contents", "qualified_name", "function_code", "diff")
+
+# Temperature range spread over best-of-N candidates, so they differ.
+CANDIDATE_TEMPERATURES = (0.2, 1.0)
+
+
+def candidate_temperatures(count: int) -> List[float]:
+    """Returns `count` temperatures spread evenly over CANDIDATE_TEMPERATURES."""
+    low, high = CANDIDATE_TEMPERATURES
+    if count <= 1:
+        return [low]
+    return [round(low + (high - low) * i / (count - 1), 2) for i in range(count)]
 
 
 class FunctionEditorAgent(BaseAgent):
@@ -12,9 +34,16 @@ class FunctionEditorAgent(BaseAgent):
     Editing functions in a Python script.
     """
 
-    def __init__(self, api: API):
+    AGENT_NAME = "function_editor"
+
+    def __init__(self, api: API, candidates: int = 1, temperatures: Optional[Sequence[float]] = None):
         """
         Initialize the FunctionEditorAgent.
+
+        :param candidates: Number of concurrent generations per edit; the
+                           first one whose actions validate is used.
+        :param temperatures: Temperature of each candidate (cycled), spread
+                             over CANDIDATE_TEMPERATURES by default.
         """
         super().__init__(
             api,
@@ -29,10 +58,16 @@ class FunctionEditorAgent(BaseAgent):
 4. Replace '<' and '>' characters with '&lt;' and '&gt;' respectively.
         """
         )
+        self.candidates = max(1, candidates)
+        self.temperatures = list(temperatures or candidate_temperatures(self.candidates))
 
     def _load_instructions(self) -> str:
         return """
         Edit the functions in the original script to fix the issues identified in the analysis report.
+        Prefer the smallest action that expresses a change: use replace_function with the complete
+        new definition of one function or method (named by its qualified name, e.g. Class.method),
+        or apply_diff with a unified diff for changes outside functions. Use edit_file only when
+        most of the file changes.
         """
 
     def load_file(self, file_path: str) -> str:
@@ -43,7 +78,17 @@ class FunctionEditorAgent(BaseAgent):
         self,
         original_script: str,
         analysis_report: str,
-    ) -> str:
+    ) -> List[Dict[str, Any]]:
+        """
+        Synchronous entry point; runs `run_agent_async` in a fresh event loop.
+        """
+        return run_sync(self.api, self.run_agent_async(original_script, analysis_report))
+
+    async def run_agent_async(
+        self,
+        original_script: str,
+        analysis_report: str,
+    ) -> List[Dict[str, Any]]:
         """
         The main workflow:
           1) Parse the analysis report and locate the corresponding functions
@@ -53,31 +98,159 @@ class FunctionEditorAgent(BaseAgent):
           3) Produce a finalized version of the Python script that reflects all approved
              changes, preserving unchanged functionality in other areas of the script.
         """
+        with metrics.timer("prompt_build_seconds", agent=self.AGENT_NAME):
+            prompt = self._build_prompt(original_script, analysis_report)
+        plan = self._plan_edit(original_script, prompt)
+        if self.candidates > 1:
+            return await self._best_of(original_script, prompt, plan)
+        response = await self._generate(
+            prompt, original_script, max_tokens=plan.max_output_tokens
+        )
+        with metrics.timer("xml_parse_seconds", agent=self.AGENT_NAME):
+            return self.parse_actions(response)
+
+    async def _best_of(
+        self, original_script: str, prompt: str, plan: RequestPlan
+    ) -> List[Dict[str, Any]]:
+        """
+        Runs `candidates` generations concurrently and returns the actions of
+        the first one that parses and validates, cancelling the others. The
+        extra spend is bounded by the number of candidates, and a single bad
+        response no longer wastes the edit.
+        """
+        temperatures = [
+            self.temperatures[i % len(self.temperatures)] for i in range(self.candidates)
+        ]
+        tasks = [
+            asyncio.ensure_future(self._candidate(original_script, prompt, plan, temperature))
+            for temperature in temperatures
+        ]
+        error = None
+        rejected = False
+        try:
+            for future in asyncio.as_completed(tasks):
+                try:
+                    actions = await future
+                except Exception as e:
+                    error = e
+                    metrics.inc("editor_candidates_total", agent=self.AGENT_NAME, outcome="failed")
+                    logging.warning(f"Editor candidate for {original_script} failed: {e}")
+                    continue
+                if actions:
+                    metrics.inc("editor_candidates_total", agent=self.AGENT_NAME, outcome="accepted")
+                    return actions
+                rejected = True
+                metrics.inc("editor_candidates_total", agent=self.AGENT_NAME, outcome="rejected")
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            metrics.inc("editor_candidates_total", len(pending), agent=self.AGENT_NAME, outcome="cancelled")
+        if error is not None and not rejected:
+            raise error
+        return []
+
+    async def _candidate(
+        self, original_script: str, prompt: str, plan: RequestPlan, temperature: float
+    ) -> List[Dict[str, Any]]:
+        """Generates one candidate; returns its actions, or [] if they are unusable."""
+        response = await self._generate(
+            prompt, original_script, max_tokens=plan.max_output_tokens, temperature=temperature
+        )
+        with metrics.timer("xml_parse_seconds", agent=self.AGENT_NAME):
+            actions = self.parse_actions(response)
+        if not actions:
+            return []
+        try:
+            # Compiling and patching are CPU-bound; keep them off the event loop.
+            await asyncio.to_thread(validate_actions, actions)
+        except ActionError as e:
+            logging.info(f"Rejected editor candidate (temperature {temperature}): {e}")
+            return []
+        return actions
+
+    def _plan_edit(self, original_script: str, prompt: str) -> RequestPlan:
+        """
+        Plans the edit request. The response is a list of actions: a small
+        file may still be rewritten whole with edit_file, so its output budget
+        must hold the script, while larger files are edited with
+        replace_function and apply_diff, which need at most
+        PATCH_OUTPUT_TOKENS.
+
+        Raises:
+            ContextWindowExceeded: If even that budget does not fit the model.
+        """
+        script_tokens = estimate_tokens(self.load_file(original_script))
+        min_output = min(script_tokens, PATCH_OUTPUT_TOKENS) + 512
+        try:
+            return self.plan(prompt, min_output_tokens=min_output)
+        except ContextWindowExceeded as e:
+            raise ContextWindowExceeded(f"Cannot edit {original_script}: {e}") from e
+
+    def _build_prompt(self, original_script: str, analysis_report: str) -> str:
+        """Builds the editor prompt."""
         if not original_script:
             raise ValueError(f"Could not find the script at '{original_script}'.")
         if not analysis_report:
             raise ValueError(
                 f"Could not find the analysis report at '{analysis_report}'."
             )
-        # Create the root element
-        prompt = "<function_editor>"
-        # Add subelements
-        prompt += f"<instructions>{self._load_instructions()}</instructions>"
-        prompt += f"<original_script path='{original_script}'>{self.load_file(original_script)}</original_script>"
-        prompt += f"<analysis_report>{analysis_report}</analysis_report>"
-        prompt += f"<role_description>{self.role_description}</role_description>"
-        prompt += f"<structure>{self.structure}</structure>"
-        prompt += "</function_editor>"
-        # logging.info(f"Editing function with prompt: {prompt}")
-
-        # Log the prompt to a file
-        with open(
-            "function_editor_sent_prompts.log", "a", encoding="utf-8"
-        ) as log_file:
-            log_file.write(f"Prompt Sent:\n{prompt}\n\n")
-
-        response = asyncio.run(self.api.generate_text(prompt))
-        return self.parse_actions(response)
+        # Static role, structure and instructions first, then the variable parts.
+        return self.prompt_template(self._load_instructions()).render(
+            ("original_script", self.load_file(original_script), {"path": original_script}),
+            ("analysis_report", analysis_report),
+        )
+
+    async def stream_actions(
+        self,
+        original_script: str,
+        analysis_report: str,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams the editor response and yields each action as soon as its
+        closing </action> tag arrives, while the rest is still generating.
+
+        Raises:
+            ActionError: If the response is not valid XML or ends before its
+                root element is closed, e.g. when it hit the output limit.
+                Actions yielded before that must be rolled back.
+        """
+        with metrics.timer("prompt_build_seconds", agent=self.AGENT_NAME):
+            prompt = self._build_prompt(original_script, analysis_report)
+        plan = self._plan_edit(original_script, prompt)
+        parser = ActionStreamParser()
+        chunks = []
+        started = time.perf_counter()
+        parse_time = 0.0
+        error = None
+        reset_usage()
+        try:
+            async for chunk in self.api.stream_text(
+                prompt, max_tokens=plan.max_output_tokens
+            ):
+                if not chunks:
+                    metrics.observe(
+                        "provider_ttft_seconds",
+                        time.perf_counter() - started,
+                        agent=self.AGENT_NAME,
+                        provider=getattr(self.api, "api_name", "unknown"),
+                    )
+                chunks.append(chunk)
+                parse_started = time.perf_counter()
+                completed = parser.feed(chunk)
+                parse_time += time.perf_counter() - parse_started
+                for action in completed:
+                    yield action
+                if parser.done:
+                    break
+            parser.close()
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            metrics.observe("xml_parse_seconds", parse_time, agent=self.AGENT_NAME)
+            self._trace(original_script, prompt, "".join(chunks), started, error=error)
 
     def parse_actions(self, xml_string: str) -> List[Dict[str, Any]]:
         """
@@ -91,40 +264,109 @@ class FunctionEditorAgent(BaseAgent):
             and its associated data (type, file path, file contents, metadata).
             Returns an empty list if no actions are found or if the input is invalid.
         """
-        print(xml_string)
+        logging.debug(xml_string)
         try:
             root = ET.fromstring(xml_string)
-        except ET.ParseError:
-            print("Error: Invalid XML format.")
+        except ET.ParseError as e:
+            logging.error(f"Invalid XML in the editor response: {e}")
             return []
 
         actions = []
         for action_element in root.findall("action"):
-            action_type = action_element.find("type")
-            file_path = action_element.find("file_path")
-            file_contents = action_element.find("file_contents")
+            action_data = action_from_element(action_element)
+            if action_data is not None:
+                actions.append(action_data)
+
+        return actions
+
 
-            if action_type is None:
-                print("Warning: Missing action type.")
-                continue
+def action_from_element(action_element: ET.Element) -> Optional[Dict[str, Any]]:
+    """
+    Converts an <action> element into an action dictionary, or returns None
+    if the element has no type.
+    """
+    action_type = action_element.find("type")
 
-            action_data: Dict[str, Any] = {"type": action_type.text}
+    if action_type is None:
+        logging.warning("Skipping an action without a type.")
+        return None
 
-            if file_path is not None:
-                action_data["file_path"] = file_path.text
-            if file_contents is not None:
-                action_data["file_contents"] = file_contents.text
+    action_data: Dict[str, Any] = {"type": action_type.text}
 
-            actions.append(action_data)
+    for name in ACTION_FIELDS:
+        element = action_element.find(name)
+        if element is not None:
+            text = element.text
+            if name in ("file_path", "qualified_name") and text:
+                text = text.strip()
+            action_data[name] = text
 
-        return actions
+    return action_data
 
 
-if __name__ == "__main__":
-    from api.google_api import GoogleAPI
+class ActionStreamParser:
+    """
+    Incremental parser for editor responses.
+
+    Text fed before the first '<' (such as a markdown fence) is skipped, and
+    anything after the root element is closed is ignored. `close` tells a
+    complete response from a truncated one.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._depth = 0
+        self._started = False
+        self.done = False
+        # Whether the root element was closed.
+        self.complete = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Feeds a chunk of text and returns the actions it completed.
+
+        Raises:
+            ActionError: If the text inside the root element is not valid XML.
+        """
+        if self.done or not chunk:
+            return []
+        if not self._started:
+            start = chunk.find("<")
+            if start < 0:
+                return []
+            chunk = chunk[start:]
+            self._started = True
+
+        actions = []
+        try:
+            self._parser.feed(chunk)
+            for event, element in self._parser.read_events():
+                if event == "start":
+                    self._depth += 1
+                    continue
+                self._depth -= 1
+                if element.tag == "action":
+                    action_data = action_from_element(element)
+                    if action_data is not None:
+                        actions.append(action_data)
+                    element.clear()
+                if self._depth == 0:
+                    self.done = True
+                    self.complete = True
+                    break
+        except ET.ParseError as e:
+            self.done = True
+            # Trailing text after the root (e.g. a closing fence) ends the stream.
+            if not self.complete:
+                raise ActionError(f"Invalid XML in the streamed response: {e}") from e
+        return actions
+
+    def close(self):
+        """
+        Raises:
+            ActionError: If the response ended before its root element was closed.
+        """
+        self.done = True
+        if not self.complete:
+            raise ActionError("The streamed response ended before its actions were complete.")
 
-    api = GoogleAPI()
-    agent = FunctionEditorAgent(api)
-    with open("example/load_dic.py", "r", encoding="utf-8") as file:
-        script = file.read()
-    print(agent.run_agent(script, "load dic uses eval and it's not safe"))
@@ -0,0 +1,76 @@
+# agents/prompt_template.py
+import functools
+import os
+from typing import Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+# Agent resource paths such as "agents/function_editor/role.xml" are relative to here.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resolve_path(path: str) -> str:
+    """Resolves a resource path against the project root instead of the CWD."""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(PROJECT_ROOT, path)
+
+
+@functools.lru_cache(maxsize=None)
+def load_role_description(role_path: str) -> str:
+    """
+    Loads the role description from role.xml, once per process.
+    """
+    root = ElementTree.parse(resolve_path(role_path)).getroot()
+    return root.find("description").text
+
+
+@functools.lru_cache(maxsize=None)
+def load_structure(structure_path: str) -> str:
+    """
+    Loads the output structure from structure.xml, once per process.
+    """
+    with open(resolve_path(structure_path), "r", encoding="utf-8") as xml:
+        return xml.read()
+
+
+def _element(tag: str, text: str, attributes: Optional[dict] = None) -> str:
+    attrs = "".join(f" {name}='{value}'" for name, value in (attributes or {}).items())
+    return f"<{tag}{attrs}>{text}</{tag}>"
+
+
+class PromptTemplate:
+    """
+    A prompt whose static sections are rendered once into a fixed prefix.
+
+    Every prompt rendered from the same template starts with byte-identical
+    text (role, structure and instructions), and the per-request sections
+    follow it, so providers can serve the prefix from their prompt cache.
+    """
+
+    def __init__(self, root: str, static_sections: Sequence[Tuple[str, str]]):
+        self.root = root
+        self.prefix = f"<{root}>" + "".join(_element(tag, text) for tag, text in static_sections)
+        self.suffix = f"</{root}>"
+
+    def render(self, *sections) -> str:
+        """
+        Renders the prompt. Each section is a (tag, text) or
+        (tag, text, attributes) tuple and is emitted after the static prefix.
+        """
+        parts = [self.prefix]
+        parts.extend(_element(*section) for section in sections)
+        parts.append(self.suffix)
+        return "".join(parts)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(root: str, role_description: str, structure: str, instructions: str) -> PromptTemplate:
+    """Returns the process-wide template for these static sections."""
+    return PromptTemplate(
+        root,
+        [
+            ("role_description", role_description),
+            ("structure", structure),
+            ("instructions", instructions),
+        ],
+    )
@@ -0,0 +1,281 @@
+# agents/triage.py
+import ast
+import asyncio
+import concurrent.futures
+import multiprocessing
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional
+from xml.sax.saxutils import quoteattr
+
+# Marks a generated file in its first lines; such files are never analyzed.
+_GENERATED_RE = re.compile(r"@generated|do not edit|auto-?generated", re.IGNORECASE)
+_GENERATED_HEADER_LINES = 5
+
+_BRANCHES = (ast.If, ast.IfExp, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler, ast.Assert)
+
+
+@dataclass
+class TriageThresholds:
+    """
+    A function is sent to the analyzer if it reaches any size threshold or
+    has a smell. Smells are flagged when a metric reaches its threshold
+    (nested loops, repeated lookups) or occurs at all (eval, string
+    concatenation in a loop).
+    """
+
+    lines: int = 25
+    complexity: int = 6
+    loop_depth: int = 2
+    repeated_lookups: int = 3
+
+
+@dataclass
+class FunctionMetrics:
+    """Static metrics of one function or method."""
+
+    qualified_name: str
+    lineno: int
+    lines: int
+    complexity: int
+    loop_depth: int
+    repeated_lookups: int
+    string_concat_in_loop: int
+    eval_calls: int
+    smells: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TriageResult:
+    """The metrics of a file's functions and the names selected for analysis."""
+
+    path: str
+    functions: List[FunctionMetrics] = field(default_factory=list)
+    selected: List[str] = field(default_factory=list)
+    generated: bool = False
+    error: Optional[str] = None
+
+    def report(self) -> str:
+        """The metrics as XML, for the analysis report."""
+        lines = ["<static_metrics>"]
+        for metrics in self.functions:
+            if metrics.qualified_name not in self.selected:
+                continue
+            lines.append(
+                f"<function name={quoteattr(metrics.qualified_name)} line='{metrics.lineno}' "
+                f"lines='{metrics.lines}' complexity='{metrics.complexity}' "
+                f"loop_depth='{metrics.loop_depth}' repeated_lookups='{metrics.repeated_lookups}' "
+                f"string_concat_in_loop='{metrics.string_concat_in_loop}' "
+                f"eval_calls='{metrics.eval_calls}' smells={quoteattr(','.join(metrics.smells))}/>"
+            )
+        lines.append("</static_metrics>")
+        return "\n".join(lines)
+
+
+def _dotted(node: ast.AST) -> Optional[str]:
+    """Returns "a.b.c" for an attribute chain on a name, else None."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name) or not parts:
+        return None
+    return ".".join([node.id] + parts[::-1])
+
+
+def _is_string(node: ast.AST, string_names) -> bool:
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str)
+    if isinstance(node, ast.JoinedStr):
+        return True
+    if isinstance(node, ast.Name):
+        return node.id in string_names
+    if isinstance(node, ast.Call):
+        return isinstance(node.func, ast.Name) and node.func.id in ("str", "repr", "format")
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return _is_string(node.left, string_names) or _is_string(node.right, string_names)
+    return False
+
+
+class _FunctionVisitor(ast.NodeVisitor):
+    """Collects the metrics of one function body, nested functions included."""
+
+    def __init__(self):
+        self.complexity = 1
+        self.loop_depth = 0
+        self.max_loop_depth = 0
+        self.repeated_lookups = 0
+        self.string_concat_in_loop = 0
+        self.eval_calls = 0
+        self.string_names = set()
+
+    def generic_visit(self, node):
+        if isinstance(node, _BRANCHES):
+            self.complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            self.complexity += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            self.complexity += 1 + len(node.ifs)
+        super().generic_visit(node)
+
+    def _visit_loop(self, node):
+        self.loop_depth += 1
+        self.max_loop_depth = max(self.max_loop_depth, self.loop_depth)
+        if self.loop_depth == 1:
+            lookups = Counter(
+                name
+                for child in ast.walk(node)
+                if isinstance(child, ast.Attribute) and isinstance(child.ctx, ast.Load)
+                for name in [_dotted(child)]
+                if name is not None
+            )
+            if lookups:
+                self.repeated_lookups = max(self.repeated_lookups, max(lookups.values()))
+        self.generic_visit(node)
+        self.loop_depth -= 1
+
+    visit_For = visit_AsyncFor = visit_While = _visit_loop
+
+    def _visit_comprehension_owner(self, node):
+        # Each `for` clause of a comprehension is a loop level.
+        depth = self.loop_depth
+        self.loop_depth += len(node.generators)
+        self.max_loop_depth = max(self.max_loop_depth, self.loop_depth)
+        self.generic_visit(node)
+        self.loop_depth = depth
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension_owner
+
+    def visit_Assign(self, node):
+        if _is_string(node.value, self.string_names):
+            self.string_names.update(t.id for t in node.targets if isinstance(t, ast.Name))
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if (
+            self.loop_depth
+            and isinstance(node.op, ast.Add)
+            and (
+                _is_string(node.value, self.string_names)
+                or (isinstance(node.target, ast.Name) and node.target.id in self.string_names)
+            )
+        ):
+            self.string_concat_in_loop += 1
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id in ("eval", "exec"):
+            self.eval_calls += 1
+        self.generic_visit(node)
+
+
+def function_metrics(
+    node: ast.AST, qualified_name: str, thresholds: TriageThresholds
+) -> FunctionMetrics:
+    """Computes the metrics and smells of a function node."""
+    visitor = _FunctionVisitor()
+    for statement in node.body:
+        visitor.visit(statement)
+    metrics = FunctionMetrics(
+        qualified_name,
+        node.lineno,
+        node.end_lineno - node.lineno + 1,
+        visitor.complexity,
+        visitor.max_loop_depth,
+        visitor.repeated_lookups,
+        visitor.string_concat_in_loop,
+        visitor.eval_calls,
+    )
+    if metrics.eval_calls:
+        metrics.smells.append("eval")
+    if metrics.string_concat_in_loop:
+        metrics.smells.append("string_concat_in_loop")
+    if metrics.loop_depth >= thresholds.loop_depth:
+        metrics.smells.append("nested_loops")
+    if metrics.repeated_lookups >= thresholds.repeated_lookups:
+        metrics.smells.append("repeated_lookups")
+    return metrics
+
+
+def triage_source(
+    source: str, path: str = "<string>", thresholds: Optional[TriageThresholds] = None
+) -> TriageResult:
+    """
+    Computes the metrics of every function and method of a script, with the
+    same qualified names as agents.chunking, and selects the ones worth an
+    LLM request.
+    """
+    thresholds = thresholds or TriageThresholds()
+    result = TriageResult(path)
+    header = "\n".join(source.splitlines()[:_GENERATED_HEADER_LINES])
+    result.generated = bool(_GENERATED_RE.search(header))
+    try:
+        tree = ast.parse(source, path)
+    except SyntaxError as e:
+        result.error = str(e)
+        return result
+
+    def visit(body, prefix: str):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                visit(node.body, f"{prefix}{node.name}.")
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                result.functions.append(function_metrics(node, prefix + node.name, thresholds))
+
+    visit(tree.body, "")
+    if not result.generated:
+        result.selected = [
+            metrics.qualified_name
+            for metrics in result.functions
+            if metrics.smells
+            or metrics.lines >= thresholds.lines
+            or metrics.complexity >= thresholds.complexity
+        ]
+    return result
+
+
+def triage_file(path: str, thresholds: Optional[TriageThresholds] = None) -> TriageResult:
+    """Reads and triages a script; runs in a worker process."""
+    with open(path, "r", encoding="utf-8") as f:
+        return triage_source(f.read(), path, thresholds)
+
+
+class Triage:
+    """
+    Runs the static triage of files in a process pool, so parsing large
+    files runs in parallel and never blocks the event loop.
+    """
+
+    def __init__(self, thresholds: Optional[TriageThresholds] = None, max_workers: Optional[int] = None):
+        self.thresholds = thresholds or TriageThresholds()
+        self.max_workers = max_workers
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def _executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers only import this module; forking a process
+            # that runs threads is unsafe.
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def run(self, path: str) -> TriageResult:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), triage_file, path, self.thresholds)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def add_metrics_to_report(report: str, result: TriageResult) -> str:
+    """Inserts the static metrics into an analyzer report, inside its root element."""
+    metrics = result.report()
+    closing = report.rfind("</structure>")
+    if closing < 0:
+        return f"{report}\n{metrics}"
+    return f"{report[:closing]}{metrics}\n{report[closing:]}"
+
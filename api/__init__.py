@@ -5,6 +5,17 @@ import importlib
 _api_registry = {}
 _apis_discovered = False # Added a discovery flag
 
+# Provider name -> module that registers it. Listed statically so that a run
+# only imports the SDK of the provider it actually uses.
+_PROVIDER_MODULES = {
+    "alibaba-qwen": "api.alibaba_qwen_api",
+    "deepseek": "api.deepseek_api",
+    "google": "api.google_api",
+    "mock": "api.mock_api",
+    "openai": "api.openai_api",
+    "router": "api.router_api",
+}
+
 
 def register_api(name):
     """
@@ -12,6 +23,7 @@ def register_api(name):
     """
     def decorator(cls):
         _api_registry[name] = cls
+        cls.api_name = name
         return cls
     return decorator
 
@@ -36,8 +48,33 @@ def _discover_apis(api_dir):
     _apis_discovered = True
 
 
+def available_apis():
+    """
+    Returns the names of all known providers without importing them.
+    """
+    return sorted(set(_PROVIDER_MODULES) | set(_api_registry))
+
+
+def _load_api(api_type):
+    """
+    Imports the module of a single provider on first use.
+
+    Args:
+        api_type (str): The name of the API type.
+
+    Raises:
+        ValueError: If the provider's module or one of its dependencies is missing.
+    """
+    if api_type in _api_registry or api_type not in _PROVIDER_MODULES:
+        return
+    module_path = _PROVIDER_MODULES[api_type]
+    try:
+        importlib.import_module(module_path)
+    except ModuleNotFoundError as e:
+        raise ValueError(f"Could not import {module_path}. Error: {e}")
+
 
-def create_api_instance(api_type, api_key=None, api_dir=None):
+def create_api_instance(api_type, api_key=None, api_dir=None, **options):
     """
     Creates an instance of the specified API class.
 
@@ -45,6 +82,7 @@ def create_api_instance(api_type, api_key=None, api_dir=None):
         api_type (str): The name of the API type.
         api_key (str, optional): The API key or path to key.
         api_dir (str, optional): The directory where API files are located.
+        **options: Provider-specific constructor options, e.g. base_url.
 
     Returns:
         API: An instance of the API class.
@@ -52,10 +90,11 @@ def create_api_instance(api_type, api_key=None, api_dir=None):
     Raises:
         ValueError: If the API type is invalid.
     """
-    if not api_dir:
-       api_dir = os.path.join(os.path.dirname(__file__))
-    _discover_apis(api_dir)
+    if api_dir:
+        _discover_apis(api_dir)
+    else:
+        _load_api(api_type)
     api_class = _api_registry.get(api_type)
     if not api_class:
         raise ValueError(f"Invalid API type: {api_type}")
-    return api_class(api_key=api_key)
\ No newline at end of file
+    return api_class(api_key=api_key, **options)
\ No newline at end of file
@@ -1,7 +1,61 @@
 # api/api.py
+import asyncio
+import contextvars
 import os
 from abc import ABC, abstractmethod
-from dotenv import load_dotenv
+
+# Token usage of the most recent request made in the current task.
+_last_usage = contextvars.ContextVar("last_usage", default=None)
+
+
+def last_usage():
+    """
+    Returns the token usage reported for the latest request of the current
+    task, as a dict with prompt_tokens, completion_tokens and cached_tokens,
+    or None if the provider did not report any.
+    """
+    return _last_usage.get()
+
+
+def reset_usage():
+    """Clears the usage of the current task before a new request."""
+    _last_usage.set(None)
+
+
+def run_sync(api, coroutine):
+    """
+    Runs `coroutine` in a fresh event loop, closing the pooled clients of
+    `api` before the loop is closed; their connections are bound to it.
+    """
+
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            close = getattr(api, "aclose", None)
+            if close is not None:
+                await close()
+
+    return asyncio.run(run())
+
+
+class APIError(Exception):
+    """Raised when a provider request fails."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TransientAPIError(APIError):
+    """
+    A failure worth retrying: rate limiting, a server error or a connection
+    problem. `retry_after` is the wait the provider asked for, if any.
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message, status_code)
+        self.retry_after = retry_after
 
 
 class API(ABC):
@@ -9,6 +63,12 @@ class API(ABC):
     Abstract base class for API interactions.
     """
 
+    # Providers that need no credentials (mock, router) set this to False.
+    REQUIRES_KEY = True
+    # Temperature a request is sampled with when it sets none. Responses are
+    # only reproducible (and cached by default) at temperature 0.
+    DEFAULT_TEMPERATURE = 1.0
+
     def __init__(self, api_key=None, **kwargs):
         """
         Initializes the API object.
@@ -31,7 +91,7 @@ class API(ABC):
         if not api_key and kwargs.get("api_env"):
             self.api_key = self._load_api_key_from_env(kwargs.get("api_env"))
 
-        if not self.api_key:
+        if not self.api_key and self.REQUIRES_KEY:
             raise ValueError(
                 "No valid API key found. Provide it as a string, file path, "
                 "or set it in the environment."
@@ -62,6 +122,9 @@ class API(ABC):
         :return: The API key as a string.
         :raises ValueError: If the API key is not found in the environment variables.
         """
+        # Imported here so providers that never read the environment skip it.
+        from dotenv import load_dotenv
+
         dotenv_path = os.path.join(os.getcwd(), ".env")
         load_dotenv(dotenv_path)
 
@@ -70,6 +133,34 @@ class API(ABC):
             raise ValueError(f"{api_env} not found in environment variables.")
         return api_key
 
+    def record_usage(self, prompt_tokens, completion_tokens, cached_tokens=0):
+        """
+        Records the token usage a provider reported for a request, both for
+        the current task (see `last_usage`) and in this instance's totals.
+        """
+        usage = {
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+        }
+        _last_usage.set(usage)
+        totals = self.usage_totals
+        for key, value in usage.items():
+            totals[key] += value
+        totals["requests"] += 1
+
+    @property
+    def usage_totals(self) -> dict:
+        """Token usage accumulated over all requests of this instance."""
+        if "_usage_totals" not in self.__dict__:
+            self._usage_totals = {
+                "requests": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
+            }
+        return self._usage_totals
+
     @abstractmethod
     async def generate_text(self, prompt, **kwargs):
         """
@@ -83,3 +174,20 @@ class API(ABC):
             str: The generated text.
         """
         pass
+
+    async def stream_text(self, prompt, **kwargs):
+        """
+        Generates text from a given prompt, yielding it in chunks as it arrives.
+
+        Providers without native streaming yield the complete response once.
+
+        Args:
+            prompt (str): The input prompt for text generation.
+            **kwargs: Additional keyword arguments for the API call.
+
+        Yields:
+            str: Chunks of the generated text.
+        """
+        text = await self.generate_text(prompt, **kwargs)
+        if text:
+            yield text
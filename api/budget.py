@@ -0,0 +1,129 @@
+# api/budget.py
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ModelCapabilities:
+    """Token limits of a provider's model."""
+
+    context_window: int
+    max_output_tokens: int
+
+
+# (provider, model) -> limits. A model of None is the provider-wide fallback.
+MODEL_CAPABILITIES = {
+    ("openai", "chatgpt-4o-latest"): ModelCapabilities(128_000, 16_384),
+    ("openai", None): ModelCapabilities(128_000, 16_384),
+    ("deepseek", "deepseek-chat"): ModelCapabilities(64_000, 8_192),
+    ("deepseek", "deepseek-reasoner"): ModelCapabilities(64_000, 8_192),
+    ("alibaba-qwen", "qwen-max-2025-01-25"): ModelCapabilities(32_768, 8_192),
+    ("alibaba-qwen", None): ModelCapabilities(32_768, 8_192),
+    ("google", "models/gemini-2.0-flash-thinking-exp"): ModelCapabilities(1_048_576, 65_536),
+    ("google", None): ModelCapabilities(1_048_576, 8_192),
+    ("mock", None): ModelCapabilities(1_000_000, 100_000),
+}
+
+DEFAULT_CAPABILITIES = ModelCapabilities(32_768, 8_192)
+
+# Used when tiktoken is not installed; deliberately pessimistic for source code.
+CHARS_PER_TOKEN = 3.0
+
+_encoding = None
+
+
+class ContextWindowExceeded(ValueError):
+    """Raised before sending a request that cannot fit the model's limits."""
+
+
+@dataclass
+class RequestPlan:
+    """Token budget chosen for a single request."""
+
+    prompt_tokens: int
+    max_output_tokens: int
+    context_window: int
+
+
+def get_capabilities(provider: Optional[str], model: Optional[str]) -> ModelCapabilities:
+    """Returns the limits of a provider's model, falling back to conservative defaults."""
+    return (
+        MODEL_CAPABILITIES.get((provider, model))
+        or MODEL_CAPABILITIES.get((provider, None))
+        or DEFAULT_CAPABILITIES
+    )
+
+
+def capabilities_for(api, model: Optional[str] = None) -> ModelCapabilities:
+    """
+    Returns the limits of the model `api` will use. Composite providers
+    such as the router declare their own through `model_capabilities`.
+    """
+    override = getattr(api, "model_capabilities", None)
+    if override is not None and model is None:
+        return override
+    return get_capabilities(
+        getattr(api, "api_name", None), model or getattr(api, "MODEL_NAME", None)
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in `text`.
+
+    Uses tiktoken when it is installed and a character-based estimate otherwise.
+    """
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def plan_request(
+    api,
+    prompt: str,
+    min_output_tokens: int = 1024,
+    desired_output_tokens: Optional[int] = None,
+    safety_margin: int = 256,
+    model: Optional[str] = None,
+) -> RequestPlan:
+    """
+    Chooses the output budget for a request before it is sent.
+
+    Args:
+        api: The provider the request is for.
+        prompt: The complete prompt.
+        min_output_tokens: The smallest output budget that can hold a useful answer.
+        desired_output_tokens: Preferred output budget; defaults to the model maximum.
+        safety_margin: Tokens reserved for estimation error and message framing.
+        model: The model to use, if not the provider default.
+
+    Raises:
+        ContextWindowExceeded: If the prompt leaves less than `min_output_tokens`
+            of room, or the model cannot produce that many tokens.
+    """
+    capabilities = capabilities_for(api, model)
+    prompt_tokens = estimate_tokens(prompt)
+    available = capabilities.context_window - prompt_tokens - safety_margin
+    output_tokens = min(
+        desired_output_tokens or capabilities.max_output_tokens,
+        capabilities.max_output_tokens,
+        available,
+    )
+    if output_tokens < min_output_tokens:
+        raise ContextWindowExceeded(
+            f"Request needs ~{prompt_tokens} prompt tokens and at least {min_output_tokens} "
+            f"output tokens, but the model allows {capabilities.context_window} in total "
+            f"and {capabilities.max_output_tokens} of output."
+        )
+    return RequestPlan(prompt_tokens, output_tokens, capabilities.context_window)
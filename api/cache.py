@@ -0,0 +1,254 @@
+# api/cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from api.api import API
+
+
+DEFAULT_CACHE_PATH = os.path.join(".pyimprove", "responses.sqlite3")
+
+# Arguments that change how a request is sent but not what is generated.
+_NON_SEMANTIC_KWARGS = {"timeout"}
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed store for generated responses, backed by SQLite.
+
+    Entries are evicted once they are older than `max_age` seconds, and the
+    least recently used entries are dropped when the stored responses exceed
+    `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_age: float = 30 * 24 * 3600,
+        max_bytes: int = 512 * 1024 * 1024,
+        evict_every: int = 100,
+    ):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(provider: str, model: Optional[str], params: dict, prompt) -> str:
+        """
+        Builds the cache key from the provider, model, sampling params and a
+        hash of the prompt.
+        """
+        prompt_text = prompt if isinstance(prompt, str) else json.dumps(prompt, sort_keys=True)
+        payload = {
+            "provider": provider,
+            "model": model,
+            "params": {
+                k: v for k, v in sorted(params.items()) if k not in _NON_SEMANTIC_KWARGS
+            },
+            "prompt": hashlib.sha256(prompt_text.encode("utf-8")).hexdigest(),
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Stores a response, evicting old entries periodically."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict()
+
+    def evict(self):
+        """Removes expired entries and trims the store to `max_bytes`."""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        self._conn.execute(
+            "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+        )
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            )
+            stale = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                stale.append((key,))
+                excess -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self._conn.commit()
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the size of the store."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedAPI(API):
+    """
+    Wraps another API and memoizes its `generate_text` responses in a ResponseCache.
+
+    Args:
+        api: The provider to wrap.
+        cache: The response store.
+        bypass: If True, neither read from nor write to the cache.
+        refresh: If True, always call the provider and overwrite cached entries.
+        cache_sampled: If True, also cache requests sampled at a temperature
+            above 0. Their responses are not reproducible, so by default they
+            always go to the provider; otherwise best-of-N candidates would
+            replay one response.
+    """
+
+    def __init__(
+        self, api: API, cache: ResponseCache, bypass=False, refresh=False, cache_sampled=False
+    ):
+        # The wrapped provider already resolved its key; no key loading here.
+        self.api = api
+        self.api_key = api.api_key
+        self.cache = cache
+        self.bypass = bypass
+        self.refresh = refresh
+        self.cache_sampled = cache_sampled
+        self.provider = getattr(api, "api_name", type(api).__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+    @property
+    def usage_totals(self) -> dict:
+        return self.api.usage_totals
+
+    def _params(self, kwargs) -> dict:
+        """The request's parameters, with the provider's default temperature filled in."""
+        params = {k: v for k, v in kwargs.items() if k != "model"}
+        if params.get("temperature") is None:
+            params["temperature"] = getattr(self.api, "DEFAULT_TEMPERATURE", API.DEFAULT_TEMPERATURE)
+        return params
+
+    def _cacheable(self, kwargs) -> bool:
+        return not self.bypass and (self.cache_sampled or not self._params(kwargs)["temperature"])
+
+    def _lookup(self, prompt, kwargs):
+        """Returns the cache key for a request and the cached response, if any."""
+        model = kwargs.get("model") or getattr(self.api, "MODEL_NAME", None)
+        key = ResponseCache.make_key(self.provider, model, self._params(kwargs), prompt)
+        if self.refresh:
+            return key, None
+        cached = self.cache.get(key)
+        if cached is not None:
+            logging.info(f"Response cache hit ({self.provider}, {model}).")
+        return key, cached
+
+    async def generate_text(self, prompt, **kwargs):
+        """
+        Returns the cached response for this request, generating and storing
+        it on a miss. Sampled requests bypass the cache unless `cache_sampled`.
+        """
+        if not self._cacheable(kwargs):
+            return await self.api.generate_text(prompt, **kwargs)
+
+        key, cached = self._lookup(prompt, kwargs)
+        if cached is not None:
+            return cached
+
+        response = await self.api.generate_text(prompt, **kwargs)
+        if response is not None:
+            self.cache.put(key, response)
+        return response
+
+    async def stream_text(self, prompt, **kwargs):
+        """
+        Yields the cached response in one chunk on a hit; otherwise streams
+        from the provider and stores the complete response once it finishes.
+        """
+        if not self._cacheable(kwargs):
+            async for chunk in self.api.stream_text(prompt, **kwargs):
+                yield chunk
+            return
+
+        key, cached = self._lookup(prompt, kwargs)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for chunk in self.api.stream_text(prompt, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.cache.put(key, "".join(chunks))
+
+
+if __name__ == "__main__":
+    import sys
+
+    cache = ResponseCache(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CACHE_PATH)
+    print(cache.stats())
@@ -1,9 +1,14 @@
 # api/google_api.py
+import asyncio
+import logging
 import os
 import re
-from api.api import API
+from api.api import API, APIError, TransientAPIError
 from api import register_api
+from api.budget import estimate_tokens
+from api.scheduling import get_scheduler, parse_retry_after
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 @register_api("google")
 class GoogleAPI(API):
@@ -28,6 +33,34 @@ class GoogleAPI(API):
             )
         genai.configure(api_key=self.api_key)
 
+    def _translate_error(self, error: Exception) -> APIError:
+        """Classifies an SDK error as transient (worth retrying) or permanent."""
+        if isinstance(error, google_exceptions.GoogleAPICallError):
+            status = error.code
+            if status is not None and (status == 429 or status >= 500):
+                response = getattr(error, "response", None)
+                return TransientAPIError(
+                    f"Google API returned HTTP {status}",
+                    status_code=status,
+                    retry_after=parse_retry_after(getattr(response, "headers", None)),
+                )
+            return APIError(f"Google API returned HTTP {status}: {error}", status)
+        if isinstance(error, (google_exceptions.RetryError, ConnectionError, TimeoutError)):
+            return TransientAPIError(f"Google API connection error: {error}")
+        return APIError(f"Google API request failed: {error}")
+
+    async def _generate(self, model, prompt, timeout):
+        """Sends one blocking request in a worker thread, translating SDK errors."""
+        try:
+            # Retries are done by the scheduler, which shares backoff across requests.
+            return await asyncio.to_thread(
+                model.generate_content,
+                prompt,
+                request_options={"timeout": timeout, "retry": None},
+            )
+        except (google_exceptions.GoogleAPIError, ConnectionError, TimeoutError) as e:
+            raise self._translate_error(e) from e
+
     async def generate_text(self, prompt, timeout=10, **kwargs):
         """
         Generates text using the Google API.
@@ -41,25 +74,33 @@ class GoogleAPI(API):
             str: The generated text.
 
         Raises:
-             NotImplementedError: This method is not yet implemented for Google API.
+            TransientAPIError: If rate limiting or server errors outlast the retries.
+            APIError: If the provider rejects the request.
+
+        The SDK call is blocking, so it runs in a worker thread; it is paced
+        and retried by the provider's scheduler, with the SDK's own retries off.
         """
         model = genai.GenerativeModel(self.MODEL_NAME)
         try:
-            response = model.generate_content(prompt)
-            return extract_xml_from_markdown(response.text)
-        except Exception as e:
-            print(f"Error generating text with Google API: {e}")
+            response = await get_scheduler(self.api_name).run(
+                lambda: self._generate(model, prompt, timeout),
+                tokens=estimate_tokens(str(prompt)),
+            )
+        except APIError as e:
+            logging.error(f"Error generating text with Google API: {e}")
             raise
+        return extract_xml_from_markdown(response.text)
 
     def list_models(self):
-        print("List of models that support generateContent:\n")
-        for m in genai.list_models():
-            if "generateContent" in m.supported_generation_methods:
-                print(m.name)
+        """Returns the names of the models that support generateContent."""
+        return [
+            m.name
+            for m in genai.list_models()
+            if "generateContent" in m.supported_generation_methods
+        ]
 
     def get_model_info(self, model: str):
-        model_info = genai.get_model(model)
-        print(model_info)
+        return genai.get_model(model)
 
 
 def extract_xml_from_markdown(markdown_response: str) -> str:
@@ -82,4 +123,6 @@ def extract_xml_from_markdown(markdown_response: str) -> str:
 
 if __name__ == "__main__":
     api = GoogleAPI()
-    api.list_models()
\ No newline at end of file
+    print("List of models that support generateContent:\n")
+    for name in api.list_models():
+        print(name)
\ No newline at end of file
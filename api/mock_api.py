@@ -1,22 +1,69 @@
 # api/mock_api.py
-from api.api import API
+from api.api import API, TransientAPIError
 from api import register_api
+from api.budget import estimate_tokens
+import ast
 import asyncio
+import os
+import random
+import re
+from xml.sax.saxutils import escape
+
+# The variable section of analyzer and editor prompts (see PromptTemplate.render).
+_SCRIPT_RE = re.compile(
+    r"<original_script path='(?P<path>[^']*)'>(?P<source>.*)</original_script>", re.DOTALL
+)
+_FUNCTION_RE = re.compile(r"<function_name line='(?P<line>\d+)'>(?P<name>[^<]*)</function_name>")
+_DEF_RE = re.compile(r"^[ \t]*(?:async[ \t]+)?def[ \t]+(\w+)", re.MULTILINE)
+
+# Appended once by the mock editor, so repeated runs keep the file stable.
+MOCK_EDIT_MARKER = "# Reviewed by pyimprove (mock)."
 
 
 @register_api("mock")
 class MockAPI(API):
     """
     Mock implementation of the API class for testing without real API calls.
+
+    For analyzer and editor prompts it answers with XML that follows their
+    structure.xml schemas, derived deterministically from the script in the
+    prompt, so the whole pipeline can run and be timed offline. Latency,
+    jitter, failure rate and response size are configurable through the
+    constructor or PYIMPROVE_MOCK_* environment variables.
     """
 
-    def __init__(self, api_key=None):
+    REQUIRES_KEY = False
+    # Responses are derived deterministically from the prompt.
+    DEFAULT_TEMPERATURE = 0.0
+
+    def __init__(
+        self,
+        api_key=None,
+        latency=None,
+        jitter=None,
+        failure_rate=None,
+        response_size=None,
+        seed=None,
+    ):
         """
         Initializes the MockAPI object.
 
         :param api_key: Can be either an actual API key string or a path to a file containing the API key.
+        :param latency: Median response time in seconds (PYIMPROVE_MOCK_LATENCY, default 0).
+        :param jitter: Sigma of the log-normal spread around `latency`
+                       (PYIMPROVE_MOCK_JITTER, default 0 for a constant latency).
+        :param failure_rate: Fraction of requests failing with a transient 503
+                             (PYIMPROVE_MOCK_FAILURE_RATE, default 0).
+        :param response_size: Extra characters of description per analyzed function
+                              (PYIMPROVE_MOCK_RESPONSE_SIZE, default 0).
+        :param seed: Seed for latency and failures (PYIMPROVE_MOCK_SEED).
         """
         super().__init__(api_key)
+        self.latency = _setting(latency, "LATENCY", float, 0.0)
+        self.jitter = _setting(jitter, "JITTER", float, 0.0)
+        self.failure_rate = _setting(failure_rate, "FAILURE_RATE", float, 0.0)
+        self.response_size = _setting(response_size, "RESPONSE_SIZE", int, 0)
+        self.random = random.Random(_setting(seed, "SEED", int, None))
 
     async def generate_text(self, prompt, timeout=10, **kwargs):
         """
@@ -25,14 +72,141 @@ class MockAPI(API):
         :param prompt: The input prompt for the mock API.
         :param timeout: Timeout for the mock response (default is 10 seconds).
         :param kwargs: Additional parameters (ignored in this mock implementation).
-        :return: The mocked response (either a review or a book).
+        :return: Analyzer or editor XML for pipeline prompts, otherwise a fixed answer.
+        :raises TransientAPIError: For the configured fraction of requests.
         """
-        try:
+        await self._simulate_request()
+        response = self.respond(prompt)
+        self.record_usage(estimate_tokens(prompt), estimate_tokens(response))
+        return response
+
+    async def stream_text(self, prompt, timeout=10, chunk_size=256, **kwargs):
+        """Streams the response of `generate_text` in chunks of `chunk_size` characters."""
+        await self._simulate_request()
+        response = self.respond(prompt)
+        self.record_usage(estimate_tokens(prompt), estimate_tokens(response))
+        for start in range(0, len(response), chunk_size):
+            yield response[start:start + chunk_size]
+            await asyncio.sleep(0)
+
+    async def _simulate_request(self):
+        delay = self.latency
+        if self.jitter and delay:
+            delay *= self.random.lognormvariate(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise TransientAPIError("Mock provider failure", status_code=503)
+
+    def respond(self, prompt: str) -> str:
+        """Returns the deterministic answer to `prompt`."""
+        match = _SCRIPT_RE.search(prompt)
+        if match is None:
             response = "The capital of France is **Paris**. Known for its rich history, iconic landmarks such as the Eiffel Tower, and vibrant culture, Paris is one of the most famous cities in the world."
-            # Default behavior: echo the prompt
             return f"Mock response for prompt {prompt}: {response}"
-        except Exception as e:
-            return f"An unexpected error occurred: {e}"
+        path, source = match.group("path"), match.group("source")
+        if prompt.startswith("<function_editor>"):
+            return self._edit(path, source)
+        return self._analyze(prompt, source)
+
+    def _analyze(self, prompt: str, source: str) -> str:
+        function = _FUNCTION_RE.search(prompt)
+        if function is not None:
+            targets = [(function.group("name"), int(function.group("line")))]
+        else:
+            targets = [
+                (m.group(1), source.count("\n", 0, m.start()) + 1)
+                for m in _DEF_RE.finditer(source)
+            ]
+        padding = "x" * self.response_size
+        blocks = [
+            f"""<function_analysis>
+<function_name>{escape(name)}</function_name>
+<line_number>{line}</line_number>
+<identified_issues>
+<issue><type>code_smell</type><description>{escape(name)} lacks a docstring.{padding}</description></issue>
+</identified_issues>
+<actionable_suggestions>
+<suggestion><description>Document what {escape(name)} returns.</description></suggestion>
+</actionable_suggestions>
+<highlighted_best_practices>
+<practice><description>Small, single-purpose function.</description></practice>
+</highlighted_best_practices>
+</function_analysis>"""
+            for name, line in targets
+        ]
+        return "<structure>\n" + "\n".join(blocks) + "\n</structure>"
+
+    def _edit(self, path: str, source: str) -> str:
+        patch = _add_docstring(source)
+        if patch is not None:
+            qualified_name, code = patch
+            return f"""<functions>
+<action>
+<type>replace_function</type>
+<file_path>{escape(path)}</file_path>
+<qualified_name>{escape(qualified_name)}</qualified_name>
+<function_code><![CDATA[{code.replace("]]>", "]]]]><![CDATA[>")}]]></function_code>
+</action>
+</functions>"""
+        # Everything is documented (or the script does not parse): rewrite the file.
+        if MOCK_EDIT_MARKER not in source:
+            source = source.rstrip("\n") + "\n\n" + MOCK_EDIT_MARKER + "\n"
+        contents = source.replace("]]>", "]]]]><![CDATA[>")
+        return f"""<functions>
+<action>
+<type>edit_file</type>
+<file_path>{escape(path)}</file_path>
+<file_contents><![CDATA[{contents}]]></file_contents>
+</action>
+</functions>"""
+
+
+def _add_docstring(source: str):
+    """
+    Returns (qualified name, new code) for the first function without a
+    docstring, with one added, or None if there is no such function.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    lines = source.splitlines(keepends=True)
+
+    def visit(body, prefix):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                found = visit(node.body, f"{prefix}{node.name}.")
+                if found:
+                    return found
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if ast.get_docstring(node) is None:
+                    return prefix + node.name, node
+        return None
+
+    found = visit(tree.body, "")
+    if found is None:
+        return None
+    qualified_name, node = found
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    first = node.body[0]
+    if first.lineno == node.lineno:
+        return None  # Single-line definition; leave it alone.
+    indent = " " * first.col_offset
+    code = (
+        "".join(lines[start - 1 : first.lineno - 1])
+        + f'{indent}"""Mock-reviewed {node.name}."""\n'
+        + "".join(lines[first.lineno - 1 : node.end_lineno])
+    )
+    return qualified_name, code
+
+
+def _setting(value, name, convert, default):
+    """Returns `value`, or PYIMPROVE_MOCK_<name> from the environment, or `default`."""
+    if value is not None:
+        return convert(value)
+    raw = os.environ.get(f"PYIMPROVE_MOCK_{name}")
+    return convert(raw) if raw else default
 
 
 if __name__ == "__main__":
@@ -0,0 +1,282 @@
+# api/openai_compatible_api.py
+import asyncio
+import httpx
+import logging
+import os
+import openai
+from api.api import API, APIError, TransientAPIError, run_sync
+from api.budget import capabilities_for, estimate_tokens
+from api.scheduling import get_scheduler, parse_retry_after
+from openai import AsyncOpenAI
+
+
+class OpenAICompatibleAPI(API):
+    """
+    Shared base class for providers that speak the OpenAI chat-completions protocol.
+
+    Requests go through an ``AsyncOpenAI`` client backed by a persistent,
+    size-limited ``httpx`` connection pool with keep-alive, so many
+    ``generate_text`` calls can be awaited concurrently from one process.
+    Every request is paced by the provider's shared ``RequestScheduler``,
+    which also retries rate limits and transient server errors.
+    """
+
+    API_ENV = None
+    API_URL = None
+    MODEL_NAME = None
+    PROVIDER_LABEL = "OpenAI-compatible"
+
+    def __init__(
+        self,
+        api_key=None,
+        max_connections=20,
+        max_keepalive_connections=10,
+        keepalive_expiry=30.0,
+        base_url=None,
+        timeout=600.0,
+    ):
+        """
+        Initializes the provider and its connection pool settings.
+
+        :param api_key: Can be either an actual API key string or
+                        a path to a file containing the API key.
+        :param max_connections: Upper bound on open connections to the provider.
+        :param max_keepalive_connections: Idle connections kept open for reuse.
+        :param keepalive_expiry: Seconds an idle connection is kept alive.
+        :param base_url: Endpoint to use instead of API_URL, e.g. a local stand-in
+                         server; defaults to PYIMPROVE_<PROVIDER>_BASE_URL if set.
+        :param timeout: Default timeout in seconds of a request, used when a call
+                        passes none.
+        """
+        super().__init__(api_key, api_env=self.API_ENV)
+        if not self.api_key:
+            raise ValueError(
+                f"No valid {self.PROVIDER_LABEL} API key found. Provide it as a string, "
+                f"file path, or set {self.API_ENV} in the environment."
+            )
+        self.api_url = base_url or os.environ.get(self._env_name("BASE_URL")) or self.API_URL
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self._client = None
+        self._client_loop = None
+
+    @classmethod
+    def _env_name(cls, setting: str) -> str:
+        return f"PYIMPROVE_{cls.api_name.upper().replace('-', '_')}_{setting}"
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """
+        Returns the pooled async client for the running event loop.
+
+        httpx connection pools are bound to the loop that opened them, so a
+        new client is built when the agents start a fresh loop (``asyncio.run``)
+        and the previous one is closed. Within one loop every request shares
+        the same pool.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._discard_client()
+            http_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            # Retries are done by the scheduler, which shares backoff across requests.
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.api_url,
+                http_client=http_client,
+                max_retries=0,
+                timeout=self.timeout,
+            )
+            self._client_loop = loop
+        return self._client
+
+    def _discard_client(self):
+        """
+        Closes the client of another event loop on that loop: scheduled there
+        if it is still running elsewhere. The connections of a loop that was
+        already closed cannot be closed any more; `run_sync` and `aclose`
+        close the client before its loop ends to avoid that.
+        """
+        client, loop = self._client, self._client_loop
+        self._client = None
+        self._client_loop = None
+        if client is None or loop is None:
+            return
+        if loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+        else:
+            logging.debug(f"{self.PROVIDER_LABEL}: dropped the client of a finished event loop.")
+
+    async def aclose(self):
+        """Closes the pooled client, on its own event loop if that is another one."""
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            client = self._client
+            self._client = None
+            self._client_loop = None
+            await client.close()
+        else:
+            self._discard_client()
+
+    def _build_messages(self, prompt):
+        """
+        Converts a plain string prompt into a "system" message.
+        If `prompt` is a list, assume it's already in the correct chat format.
+        """
+        if isinstance(prompt, str):
+            return [{"role": "system", "content": prompt}]
+        if not isinstance(prompt, list):
+            raise TypeError(
+                "Prompt must be either a string or a list of messages (JSON)."
+            )
+        return prompt
+
+    @property
+    def scheduler(self):
+        """The rate limiter and retry loop shared by every instance of this provider."""
+        return get_scheduler(self.api_name)
+
+    def _request_tokens(self, messages) -> int:
+        """Estimated prompt tokens, reserved against the provider's tokens-per-minute."""
+        return sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+
+    def _translate_error(self, error: Exception) -> APIError:
+        """Classifies an SDK error as transient (worth retrying) or permanent."""
+        if isinstance(error, openai.APIConnectionError):
+            # Includes APITimeoutError.
+            return TransientAPIError(f"{self.PROVIDER_LABEL} connection error: {error}")
+        if isinstance(error, openai.APIStatusError):
+            status = error.status_code
+            if status == 429 or status >= 500:
+                return TransientAPIError(
+                    f"{self.PROVIDER_LABEL} returned HTTP {status}",
+                    status_code=status,
+                    retry_after=parse_retry_after(error.response.headers),
+                )
+            return APIError(f"{self.PROVIDER_LABEL} returned HTTP {status}: {error}", status)
+        return APIError(f"{self.PROVIDER_LABEL} request failed: {error}")
+
+    async def _create(self, **params):
+        """Sends one chat-completions request, translating SDK errors."""
+        try:
+            return await self.client.chat.completions.create(**params)
+        except openai.OpenAIError as e:
+            raise self._translate_error(e) from e
+
+    def _record_response_usage(self, usage):
+        """Records prompt, completion and prompt-cache token counts of a response."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+        if cached is None:
+            # DeepSeek reports prefix-cache hits in its own field.
+            cached = getattr(usage, "prompt_cache_hit_tokens", 0)
+        self.record_usage(usage.prompt_tokens, usage.completion_tokens, cached)
+
+    async def generate_text(
+        self,
+        prompt,
+        model=None,
+        max_tokens=None,
+        temperature=1.0,
+        timeout=None,
+        **kwargs,
+    ):
+        """
+        Generates text using the provider's chat-completions endpoint.
+
+        Args:
+            prompt (str): The input prompt for text generation.
+            model (str): The model to use. Defaults to the provider's MODEL_NAME.
+            max_tokens (int): The maximum number of tokens for the generated text.
+                Defaults to the model's maximum output.
+            temperature (float): The sampling temperature.
+            timeout (float): Timeout in seconds for the API call. Defaults to
+                the provider's `timeout`.
+            **kwargs: Additional keyword arguments for the API call.
+
+        Returns:
+            str: The generated text.
+
+        Raises:
+            TransientAPIError: If rate limiting or server errors outlast the retries.
+            APIError: If the provider rejects the request.
+        """
+        messages = self._build_messages(prompt)
+        response = await self.scheduler.run(
+            lambda: self._create(
+                model=model or self.MODEL_NAME,
+                messages=messages,
+                stream=False,
+                max_tokens=max_tokens or capabilities_for(self, model).max_output_tokens,
+                temperature=temperature,
+                timeout=timeout or self.timeout,
+                **kwargs,
+            ),
+            tokens=self._request_tokens(messages),
+        )
+        self._record_response_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def stream_text(
+        self,
+        prompt,
+        model=None,
+        max_tokens=None,
+        temperature=1.0,
+        timeout=None,
+        **kwargs,
+    ):
+        """
+        Streams text from the provider's chat-completions endpoint.
+
+        Args:
+            prompt (str): The input prompt for text generation.
+            model (str): The model to use. Defaults to the provider's MODEL_NAME.
+            max_tokens (int): The maximum number of tokens for the generated text.
+                Defaults to the model's maximum output.
+            temperature (float): The sampling temperature.
+            timeout (float): Timeout in seconds for the API call. Defaults to
+                the provider's `timeout`.
+            **kwargs: Additional keyword arguments for the API call.
+
+        Yields:
+            str: Content deltas as the provider produces them.
+
+        Raises:
+            APIError: As for ``generate_text``. Only opening the stream is
+                retried; a stream that breaks after the first delta is not.
+        """
+        messages = self._build_messages(prompt)
+        stream = await self.scheduler.run(
+            lambda: self._create(
+                model=model or self.MODEL_NAME,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                max_tokens=max_tokens or capabilities_for(self, model).max_output_tokens,
+                temperature=temperature,
+                timeout=timeout or self.timeout,
+                **kwargs,
+            ),
+            tokens=self._request_tokens(messages),
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self._record_response_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.OpenAIError as e:
+            raise self._translate_error(e) from e
+
+    def test_api(self):
+        """
+        A simple test method to verify the API setup by making a single request.
+        """
+        prompt = "You are a helpful assistant. What is the capital of France?"
+        result = run_sync(self, self.generate_text(prompt))
+        print("Test API result:", result)
@@ -0,0 +1,353 @@
+# api/router_api.py
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from api.api import API, APIError
+from api import create_api_instance, register_api
+from api.budget import ModelCapabilities, capabilities_for
+
+# Providers tried by default, in order of preference before any latency is known.
+# Override with PYIMPROVE_ROUTER_PROVIDERS="deepseek,openai".
+DEFAULT_PROVIDERS = ("openai", "deepseek", "alibaba-qwen", "google")
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile of `values` (0 < fraction <= 1)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Stops routing to a provider after `failure_threshold` consecutive failures.
+
+    After `cooldown` seconds the breaker is half-open and lets a single
+    trial request through; its outcome closes the breaker or reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allows(self) -> bool:
+        """Whether a request may be sent now (without claiming the trial)."""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.trial_running)
+
+    def begin(self):
+        """Marks the start of a request; claims the trial when half-open."""
+        if self.state == "half-open":
+            self.trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_running:
+                logging.warning(
+                    f"Router: circuit breaker for {self.name} opened after "
+                    f"{self.failures} consecutive failures."
+                )
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+    def release(self):
+        """Ends a request that was cancelled before it had an outcome."""
+        self.trial_running = False
+
+
+class ProviderStats:
+    """Rolling latency and error rate of one provider over its last `window` requests."""
+
+    def __init__(self, window: int = 100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.wins = 0
+        self.cancelled = 0
+
+    def record(self, latency: Optional[float], ok: bool):
+        self.requests += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def latency(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        return percentile(self.latencies, fraction)
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "wins": self.wins,
+            "cancelled": self.cancelled,
+            "error_rate": round(self.error_rate, 3),
+            "p50": self.latency(0.5),
+            "p95": self.latency(0.95),
+        }
+
+
+@register_api("router")
+class RouterAPI(API):
+    """
+    Routes each request to the fastest healthy provider of several.
+
+    Providers are ranked by their rolling median latency, penalized by their
+    error rate. When the chosen provider has not answered within its own
+    p95, a hedged duplicate goes to the next provider; the first answer
+    wins and the other request is cancelled. Failures fail over to the next
+    provider, and a provider that keeps failing is skipped by its circuit
+    breaker until its cooldown expires.
+    """
+
+    REQUIRES_KEY = False
+
+    def __init__(
+        self,
+        api_key=None,
+        providers: Optional[List[str]] = None,
+        hedge: bool = True,
+        hedge_after: float = 30.0,
+        min_samples: int = 5,
+        window: int = 100,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+    ):
+        """
+        Initializes the router from the providers whose keys are available.
+
+        :param api_key: Ignored; every provider loads its own key from the environment.
+        :param providers: Provider names, or API instances keyed by name. Defaults
+                          to PYIMPROVE_ROUTER_PROVIDERS or DEFAULT_PROVIDERS.
+        :param hedge: Whether to send hedged duplicates of slow requests.
+        :param hedge_after: Hedge delay in seconds while a provider has fewer
+                            than `min_samples` latency samples.
+        :param window: Number of recent requests the statistics cover.
+        :param failure_threshold: Consecutive failures that open a breaker.
+        :param cooldown: Seconds an open breaker waits before a trial request.
+        """
+        super().__init__(api_key)
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.providers: Dict[str, API] = {}
+        if isinstance(providers, dict):
+            self.providers.update(providers)
+        else:
+            if providers is None:
+                configured = os.environ.get("PYIMPROVE_ROUTER_PROVIDERS")
+                providers = configured.split(",") if configured else DEFAULT_PROVIDERS
+            for name in providers:
+                name = name.strip()
+                try:
+                    self.providers[name] = create_api_instance(name)
+                except ValueError as e:
+                    logging.info(f"Router: skipping provider {name}: {e}")
+        if not self.providers:
+            raise ValueError(
+                "The router found no usable provider. Set the API key of at least one "
+                "provider in the environment or pass providers explicitly."
+            )
+        self.stats = {name: ProviderStats(window) for name in self.providers}
+        self.breakers = {
+            name: CircuitBreaker(name, failure_threshold, cooldown) for name in self.providers
+        }
+        self.hedged = 0
+        logging.info(f"Router providers: {', '.join(self.providers)}")
+
+    @property
+    def model_capabilities(self) -> ModelCapabilities:
+        """Limits every provider can honor, so any of them can serve a planned request."""
+        limits = [capabilities_for(api) for api in self.providers.values()]
+        return ModelCapabilities(
+            min(c.context_window for c in limits), min(c.max_output_tokens for c in limits)
+        )
+
+    @property
+    def usage_totals(self) -> dict:
+        """Token usage summed over all providers."""
+        totals = {}
+        for api in self.providers.values():
+            for key, value in api.usage_totals.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def _score(self, name: str) -> float:
+        stats = self.stats[name]
+        median = stats.latency(0.5)
+        if median is None:
+            return 0.0  # Untried providers go first so they get measured.
+        return median * (1 + 4 * stats.error_rate)
+
+    def candidates(self) -> List[str]:
+        """Healthy providers from fastest to slowest."""
+        order = list(self.providers)
+        healthy = [name for name in order if self.breakers[name].allows()]
+        return sorted(healthy, key=lambda name: (self._score(name), order.index(name)))
+
+    def _hedge_delay(self, name: str) -> float:
+        stats = self.stats[name]
+        if len(stats.latencies) < self.min_samples:
+            return self.hedge_after
+        return stats.latency(0.95)
+
+    async def _call(self, name: str, prompt, kwargs):
+        breaker = self.breakers[name]
+        breaker.begin()
+        started = time.monotonic()
+        try:
+            response = await self.providers[name].generate_text(prompt, **kwargs)
+            if not response:
+                raise APIError(f"{name} returned an empty response")
+        except asyncio.CancelledError:
+            self.stats[name].cancelled += 1
+            breaker.release()
+            raise
+        except Exception:
+            self.stats[name].record(None, ok=False)
+            breaker.record_failure()
+            raise
+        self.stats[name].record(time.monotonic() - started, ok=True)
+        breaker.record_success()
+        return response
+
+    async def generate_text(self, prompt, timeout=None, **kwargs):
+        """
+        Generates text with the fastest healthy provider, hedging slow requests.
+
+        `model` is provider-specific and therefore ignored.
+
+        Raises:
+            APIError: If no provider is healthy or every attempt failed.
+        """
+        kwargs.pop("model", None)
+        kwargs["timeout"] = timeout
+        queue = self.candidates()
+        if not queue:
+            raise APIError("No healthy provider available; all circuit breakers are open.")
+        pending: Dict[asyncio.Task, str] = {}
+        errors = []
+
+        def launch():
+            name = queue.pop(0)
+            pending[asyncio.ensure_future(self._call(name, prompt, kwargs))] = name
+            return name
+
+        launch()
+        try:
+            while pending:
+                wait = None
+                if self.hedge and queue and len(pending) == 1:
+                    # The request still in flight, which is not the first one
+                    # if that failed while a hedge was running.
+                    (running,) = pending.values()
+                    wait = self._hedge_delay(running)
+                done, _ = await asyncio.wait(
+                    pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedged += 1
+                    logging.info(f"Router: {running} exceeded {wait:.1f}s, hedging.")
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        self.stats[name].wins += 1
+                        return task.result()
+                    errors.append(f"{name}: {task.exception()}")
+                if not pending and queue:
+                    launch()
+            raise APIError("All providers failed: " + "; ".join(errors))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream_text(self, prompt, timeout=None, **kwargs):
+        """
+        Streams from the fastest healthy provider.
+
+        Streams are not hedged. A provider that fails before its first delta
+        is replaced by the next one; a failure mid-stream is raised.
+        """
+        kwargs.pop("model", None)
+        errors = []
+        for name in self.candidates():
+            breaker = self.breakers[name]
+            breaker.begin()
+            started = time.monotonic()
+            stream = self.providers[name].stream_text(prompt, timeout=timeout, **kwargs)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except asyncio.CancelledError:
+                breaker.release()
+                await stream.aclose()
+                raise
+            except Exception as e:
+                self.stats[name].record(None, ok=False)
+                breaker.record_failure()
+                errors.append(f"{name}: {e}")
+                # Frees the provider's generator and HTTP response now, not at GC.
+                await stream.aclose()
+                continue
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            except Exception:
+                self.stats[name].record(None, ok=False)
+                breaker.record_failure()
+                raise
+            finally:
+                breaker.release()
+            self.stats[name].record(time.monotonic() - started, ok=True)
+            self.stats[name].wins += 1
+            breaker.record_success()
+            return
+        raise APIError("All providers failed: " + ("; ".join(errors) or "none healthy"))
+
+    def routing_stats(self) -> dict:
+        """Latency, error rate and breaker state of every provider."""
+        return {
+            "hedged": self.hedged,
+            "providers": {
+                name: {**self.stats[name].as_dict(), "breaker": self.breakers[name].state}
+                for name in self.providers
+            },
+        }
+
+    async def aclose(self):
+        for api in self.providers.values():
+            close = getattr(api, "aclose", None)
+            if close is not None:
+                await close()
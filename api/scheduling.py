@@ -0,0 +1,226 @@
+# api/scheduling.py
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional
+from api.api import TransientAPIError
+
+
+# provider -> (requests per minute, tokens per minute). Override with
+# PYIMPROVE_<PROVIDER>_RPM / PYIMPROVE_<PROVIDER>_TPM, e.g. PYIMPROVE_ALIBABA_QWEN_TPM.
+DEFAULT_LIMITS = {
+    "openai": (500, 200_000),
+    "deepseek": (300, 1_000_000),
+    "alibaba-qwen": (300, 1_000_000),
+    "google": (10, 4_000_000),
+}
+FALLBACK_LIMITS = (60, 100_000)
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `rate_per_minute`.
+
+    Reservations are made immediately and may drive the balance negative;
+    the caller then sleeps for the deficit. This keeps the bucket free of
+    event-loop-bound locks, so it can be shared across loops and threads.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` tokens and returns how long to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Limits a provider to a number of requests and tokens per minute, and
+    pauses all of its requests when the provider asks to back off.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+
+    def pause(self, seconds: float):
+        """Holds back every request of this provider for `seconds`."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Waits until a request of `tokens` tokens may be sent; returns the wait."""
+        delay = max(
+            self.blocked_until - time.monotonic(),
+            self.requests.reserve(1),
+            self.tokens.reserve(tokens),
+            0.0,
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    max_retries: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Returns the wait before retry number `attempt` (starting at 1)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclass
+class SchedulerMetrics:
+    """Counters of one provider's scheduler."""
+
+    requests: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    tokens_reserved: int = 0
+    limiter_wait: float = 0.0
+    backoff_wait: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class RequestScheduler:
+    """
+    Sends a provider's requests through its rate limiter and retries
+    transient failures with jittered exponential backoff, honoring Retry-After.
+    """
+
+    def __init__(self, name: str, limiter: RateLimiter, policy: Optional[RetryPolicy] = None):
+        self.name = name
+        self.limiter = limiter
+        self.policy = policy or RetryPolicy()
+        self.metrics = SchedulerMetrics()
+
+    async def run(self, call: Callable[[], Awaitable], tokens: int = 0):
+        """
+        Awaits `call()` once the limiter allows it, retrying TransientAPIError.
+
+        Raises:
+            TransientAPIError: If the request still fails after the last retry.
+            APIError: For failures that are not worth retrying.
+        """
+        self.metrics.requests += 1
+        self.metrics.tokens_reserved += tokens
+        attempt = 0
+        while True:
+            self.metrics.limiter_wait += await self.limiter.acquire(tokens)
+            try:
+                result = await call()
+                self.metrics.succeeded += 1
+                return result
+            except TransientAPIError as e:
+                attempt += 1
+                if e.status_code == 429:
+                    self.metrics.rate_limited += 1
+                if attempt > self.policy.max_retries:
+                    self.metrics.failed += 1
+                    raise
+                delay = self.policy.delay(attempt, e.retry_after)
+                if e.status_code == 429:
+                    self.limiter.pause(delay)
+                self.metrics.retries += 1
+                self.metrics.backoff_wait += delay
+                logging.warning(
+                    f"{self.name}: {e} (attempt {attempt}/{self.policy.max_retries}); "
+                    f"retrying in {delay:.1f}s."
+                )
+                await asyncio.sleep(delay)
+            except Exception:
+                self.metrics.failed += 1
+                raise
+
+
+_schedulers: Dict[str, RequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def _env_limit(provider: str, kind: str) -> Optional[float]:
+    value = os.environ.get(f"PYIMPROVE_{provider.upper().replace('-', '_')}_{kind}")
+    return float(value) if value else None
+
+
+def get_scheduler(provider: str) -> RequestScheduler:
+    """Returns the process-wide scheduler of a provider, shared by all its instances."""
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            rpm, tpm = DEFAULT_LIMITS.get(provider, FALLBACK_LIMITS)
+            rpm = _env_limit(provider, "RPM") or rpm
+            tpm = _env_limit(provider, "TPM") or tpm
+            _schedulers[provider] = RequestScheduler(provider, RateLimiter(rpm, tpm))
+        return _schedulers[provider]
+
+
+def configure_limits(
+    provider: str,
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    policy: Optional[RetryPolicy] = None,
+):
+    """Replaces the limits (and optionally the retry policy) of a provider."""
+    with _schedulers_lock:
+        _schedulers[provider] = RequestScheduler(
+            provider, RateLimiter(requests_per_minute, tokens_per_minute), policy
+        )
+
+
+def all_metrics() -> Dict[str, dict]:
+    """Returns the metrics of every provider that has sent requests."""
+    return {name: scheduler.metrics.as_dict() for name, scheduler in _schedulers.items()}
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    Reads the wait requested by a provider from `retry-after-ms` or
+    `Retry-After` (seconds or an HTTP date).
+    """
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
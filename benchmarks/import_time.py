@@ -0,0 +1,141 @@
+# benchmarks/import_time.py
+"""
+Measures CLI startup imports with `python -X importtime`.
+
+Runs the import path of `main.py --api mock` in fresh interpreters, reports
+the median total import time and the slowest modules, and fails if a
+provider SDK is imported or the time regresses past the baseline.
+
+The baseline is benchmarks/baselines/import_time.json, committed together
+with the Python version and machine it was measured on; pass --baseline to
+compare against another file (e.g. one measured on the CI runner). Timings
+from a different machine or Python are compared with a warning.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--baseline PATH] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "import_time.json")
+
+STARTUP_CODE = (
+    "import main; "
+    "from api import create_api_instance; "
+    "create_api_instance('mock', 'benchmark-key')"
+)
+
+# Modules that must stay out of a mock run.
+FORBIDDEN_MODULES = ("openai", "httpx", "google.generativeai", "dotenv")
+
+
+def environment() -> dict:
+    """Where a baseline was measured; results only compare on a similar machine."""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(terse=True),
+        "cpus": os.cpu_count(),
+    }
+
+
+def describe(env: dict) -> str:
+    return (
+        f"{env.get('implementation', '?')} {env.get('python', '?')} on "
+        f"{env.get('platform', '?')} {env.get('machine', '?')}, {env.get('cpus', '?')} CPUs"
+    )
+
+
+def warn_if_different(baseline_env: dict):
+    current = environment()
+    print(f"Baseline measured with {describe(baseline_env)}.")
+    if any(baseline_env.get(key) != current[key] for key in ("python", "machine", "cpus")):
+        print(f"WARNING: this run uses {describe(current)}; the comparison is only indicative.")
+
+
+def measure_once():
+    """
+    Runs one interpreter and returns (total microseconds, {module: cumulative us}).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        total += int(self_us)
+        modules[name.strip()] = int(cumulative_us)
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI import-time benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Interpreter runs to take the median of")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest modules to list")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown against the baseline",
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="Baseline file to compare against or update"
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store this result as the new baseline"
+    )
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    median_ms = statistics.median(total for total, _ in runs) / 1000
+    modules = runs[-1][1]
+    print(f"Startup imports: {median_ms:.1f} ms (median of {args.runs} runs)")
+    for name, cumulative in sorted(modules.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = [name for name in FORBIDDEN_MODULES if name in modules]
+    if loaded:
+        print(f"FAIL: provider dependencies imported for --api mock: {', '.join(loaded)}")
+        failed = True
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {"median_ms": round(median_ms, 2), "environment": environment()}, f, indent=2
+            )
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        warn_if_different(baseline.get("environment", {}))
+        baseline_ms = baseline["median_ms"]
+        limit = baseline_ms * (1 + args.tolerance)
+        print(f"Baseline: {baseline_ms:.1f} ms (limit {limit:.1f} ms)")
+        if median_ms > limit:
+            print("FAIL: startup import time regressed.")
+            failed = True
+    else:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
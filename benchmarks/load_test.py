@@ -0,0 +1,177 @@
+# benchmarks/load_test.py
+"""
+Load test of a provider's real HTTP path against the local stand-in server.
+
+Starts benchmarks/standin_server.py in-process (or uses --url), points an
+OpenAI-compatible provider at it and fires concurrent requests through the
+provider's pooled client and scheduler. Reports throughput, latency and
+time-to-first-token percentiles, connection reuse and retry counts.
+
+Usage:
+    python benchmarks/load_test.py [--provider openai] [--requests 500]
+        [--concurrency 50] [--stream] [--max-connections 20]
+        [--ttft 0.1] [--rate-limit-rate 0.05] [--error-rate 0.02]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from api import create_api_instance  # noqa: E402
+from api.api import APIError  # noqa: E402
+from api.scheduling import RetryPolicy, configure_limits, get_scheduler  # noqa: E402
+from standin_server import StandinConfig, StandinServer  # noqa: E402
+
+# A small analyzer prompt, so the stand-in answers with realistic XML.
+PROMPT = (
+    "<function_analyzer><original_script path='bench.py'>"
+    "def add(a, b):\n    return a + b\n\ndef sub(a, b):\n    return a - b\n"
+    "</original_script></function_analyzer>"
+)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {f"p{int(q * 100)}_ms": round(pick(q) * 1000, 1) for q in (0.5, 0.95, 0.99)}
+
+
+async def one_request(api, stream: bool, latencies, ttfts, errors):
+    start = time.perf_counter()
+    try:
+        if stream:
+            first = None
+            async for _ in api.stream_text(PROMPT, max_tokens=1024):
+                if first is None:
+                    first = time.perf_counter() - start
+            ttfts.append(first or 0.0)
+        else:
+            await api.generate_text(PROMPT, max_tokens=1024)
+        latencies.append(time.perf_counter() - start)
+    except APIError as e:
+        errors.append(str(e))
+
+
+async def run_load(api, args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, ttfts, errors = [], [], []
+
+    async def bounded():
+        async with semaphore:
+            await one_request(api, args.stream, latencies, ttfts, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded() for _ in range(args.requests)))
+    wall = time.perf_counter() - start
+    await api.aclose()
+    return wall, latencies, ttfts, errors
+
+
+def server_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url.rstrip("/") + "/stats") as response:
+        return json.load(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provider HTTP-path load test")
+    parser.add_argument("--provider", default="openai", choices=["openai", "deepseek", "alibaba-qwen"])
+    parser.add_argument("--url", help="Use a running stand-in server instead of starting one")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--stream", action="store_true", help="Use streaming requests")
+    parser.add_argument("--max-connections", type=int, default=20, help="Client pool size")
+    parser.add_argument("--max-keepalive", type=int, default=10, help="Idle pooled connections kept")
+    parser.add_argument("--rpm", type=float, default=100_000, help="Scheduler requests per minute")
+    parser.add_argument("--tpm", type=float, default=100_000_000, help="Scheduler tokens per minute")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = StandinServer(
+            config=StandinConfig(
+                latency=args.latency,
+                ttft=args.ttft,
+                tokens_per_second=args.tokens_per_second,
+                jitter=args.jitter,
+                rate_limit_rate=args.rate_limit_rate,
+                error_rate=args.error_rate,
+                retry_after=args.retry_after,
+            )
+        )
+        base_url = server.start()
+
+    configure_limits(
+        args.provider,
+        args.rpm,
+        args.tpm,
+        RetryPolicy(max_retries=args.max_retries, base_delay=0.05, max_delay=2.0),
+    )
+    api = create_api_instance(
+        args.provider,
+        "standin-key",
+        max_connections=args.max_connections,
+        max_keepalive_connections=args.max_keepalive,
+        base_url=base_url,
+    )
+    try:
+        wall, latencies, ttfts, errors = asyncio.run(run_load(api, args))
+        stats = server_stats(base_url)
+    finally:
+        if server is not None:
+            server.stop()
+
+    results = {
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(args.requests / wall, 1),
+        "latency": percentiles(latencies),
+        "ttft": percentiles(ttfts),
+        "server": stats,
+        "connection_reuse": round(stats["requests"] / max(1, stats["connections"]), 1),
+        "scheduler": get_scheduler(args.provider).metrics.as_dict(),
+        "usage": api.usage_totals,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{results['succeeded']}/{args.requests} succeeded in {wall:.2f}s "
+        f"({results['requests_per_s']} req/s, concurrency {args.concurrency})"
+    )
+    print(f"Latency: {results['latency']}")
+    if args.stream:
+        print(f"Time to first token: {results['ttft']}")
+    print(
+        f"Server: {stats['requests']} HTTP requests over {stats['connections']} connections "
+        f"({results['connection_reuse']} per connection), max {stats['max_in_flight']} in flight, "
+        f"{stats['rate_limited']} x 429, {stats['server_errors']} x 5xx"
+    )
+    print(f"Scheduler: {results['scheduler']}")
+    if errors:
+        print(f"First error: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
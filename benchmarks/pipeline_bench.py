@@ -0,0 +1,278 @@
+# benchmarks/pipeline_bench.py
+"""
+End-to-end pipeline benchmark on the schema-valid mock provider.
+
+Builds synthetic git repositories of increasing size, runs the real
+pipeline (FunctionAnalyzer -> FunctionEditorAgent -> parse_actions ->
+GitRepo) over them with a simulated provider latency, and reports
+throughput, per-stage latency percentiles and peak traced memory.
+With --check, fails if throughput, stage p95 or peak memory regress past
+the baseline.
+
+The baseline is benchmarks/baselines/pipeline.json, committed together with
+the Python version and machine it was measured on (default options); pass
+--baseline to compare against another file (e.g. one measured on the CI
+runner). Timings from a different machine or Python are compared with a
+warning.
+
+Usage:
+    python benchmarks/pipeline_bench.py [--sizes 10 50 200] [--latency 0.05]
+        [--jitter 0.3] [--failure-rate 0] [--concurrency 8] [--baseline PATH]
+        [--update-baseline | --check]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import main as cli  # noqa: E402
+import pipeline  # noqa: E402
+import prompt_trace  # noqa: E402
+from agents.function_analyzer.function_analyzer import FunctionAnalyzer  # noqa: E402
+from agents.function_editor.function_editor import FunctionEditorAgent  # noqa: E402
+from api.mock_api import MockAPI  # noqa: E402
+from gitpython import GitRepo  # noqa: E402
+
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "pipeline.json")
+STAGES = ("analyze", "edit", "apply")
+
+FUNCTION_TEMPLATE = '''
+def {name}(values, factor={index}):
+    total = 0
+    for value in values:
+        if value % {mod} == 0:
+            total += value * factor
+    return total
+'''
+
+GIT_IDENTITY = (("user.name", "bench"), ("user.email", "bench@example.com"))
+
+
+def environment() -> dict:
+    """Where a baseline was measured; results only compare on a similar machine."""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(terse=True),
+        "cpus": os.cpu_count(),
+    }
+
+
+def describe(env: dict) -> str:
+    return (
+        f"{env.get('implementation', '?')} {env.get('python', '?')} on "
+        f"{env.get('platform', '?')} {env.get('machine', '?')}, {env.get('cpus', '?')} CPUs"
+    )
+
+
+def warn_if_different(baseline_env: dict):
+    current = environment()
+    print(f"Baseline measured with {describe(baseline_env)}.")
+    if any(baseline_env.get(key) != current[key] for key in ("python", "machine", "cpus")):
+        print(f"WARNING: this run uses {describe(current)}; the comparison is only indicative.")
+
+
+def build_repo(directory: str, files: int, functions: int):
+    """Writes `files` modules of `functions` functions each and commits them."""
+    for i in range(files):
+        package = os.path.join(directory, f"pkg{i % 10}")
+        os.makedirs(package, exist_ok=True)
+        source = "import math\n" + "".join(
+            FUNCTION_TEMPLATE.format(name=f"func_{i}_{j}", index=j, mod=j + 2)
+            for j in range(functions)
+        )
+        with open(os.path.join(package, f"module_{i}.py"), "w", encoding="utf-8") as f:
+            f.write(source)
+    commands = [["init", "-q"]]
+    # A local identity, so the pipeline's own commits work on any machine.
+    commands += [["config", key, value] for key, value in GIT_IDENTITY]
+    commands += [["add", "-A"], ["commit", "-q", "-m", "Synthetic repo"]]
+    for command in commands:
+        subprocess.run(["git", *command], cwd=directory, check=True)
+
+
+class StageTimer:
+    """Collects wall-clock durations per pipeline stage."""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def wrap_async(self, stage, func):
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+
+        return timed
+
+    def wrap(self, stage, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+
+        return timed
+
+    def percentiles(self) -> dict:
+        result = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            result[stage] = {
+                "count": len(values),
+                "p50_ms": round(statistics.median(ordered) * 1000, 2),
+                "p95_ms": round(pick(0.95) * 1000, 2),
+                "p99_ms": round(pick(0.99) * 1000, 2),
+            }
+        return result
+
+
+def run_size(files: int, args) -> dict:
+    """Runs the pipeline over a fresh synthetic repo of `files` files."""
+    with tempfile.TemporaryDirectory(prefix="pyimprove-bench-") as directory:
+        build_repo(directory, files, args.functions)
+        api = MockAPI(
+            latency=args.latency,
+            jitter=args.jitter,
+            failure_rate=args.failure_rate,
+            response_size=args.response_size,
+            seed=args.seed,
+        )
+        repo = GitRepo(directory)
+        ctx = pipeline.RunContext(
+            FunctionAnalyzer(api, chunked=args.chunked), FunctionEditorAgent(api), repo
+        )
+        timer = StageTimer()
+        ctx.analyzer.run_agent_async = timer.wrap_async("analyze", ctx.analyzer.run_agent_async)
+        ctx.editor.run_agent_async = timer.wrap_async("edit", ctx.editor.run_agent_async)
+        original_apply = pipeline.parse_actions
+        pipeline.parse_actions = timer.wrap("apply", original_apply)
+        scripts = cli.collect_scripts([directory])
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            results = asyncio.run(cli.process_scripts(scripts, ctx, args.concurrency))
+        finally:
+            wall = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            pipeline.parse_actions = original_apply
+            repo.close()
+
+    failed = sum(1 for result in results if result.status == "failed")
+    return {
+        "files": files,
+        "failed": failed,
+        "wall_s": round(wall, 3),
+        "files_per_s": round(files / wall, 2),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "stages": timer.percentiles(),
+    }
+
+
+def check_against(baseline: dict, results: dict, tolerance: float) -> list:
+    """Returns a description of every regression past `tolerance`."""
+    problems = []
+    for size, result in results.items():
+        previous = baseline.get(size)
+        if previous is None:
+            continue
+        if result["files_per_s"] < previous["files_per_s"] * (1 - tolerance):
+            problems.append(
+                f"{size} files: throughput {result['files_per_s']}/s "
+                f"< baseline {previous['files_per_s']}/s"
+            )
+        for stage, stats in result["stages"].items():
+            old = previous["stages"].get(stage)
+            if old and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                problems.append(
+                    f"{size} files: {stage} p95 {stats['p95_ms']}ms > baseline {old['p95_ms']}ms"
+                )
+        if result["peak_mb"] > previous["peak_mb"] * (1 + tolerance):
+            problems.append(
+                f"{size} files: peak memory {result['peak_mb']}MB > baseline {previous['peak_mb']}MB"
+            )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="Files per synthetic repo")
+    parser.add_argument("--functions", type=int, default=8, help="Functions per file")
+    parser.add_argument("--latency", type=float, default=0.05, help="Median mock latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Log-normal sigma of the mock latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of failing mock requests")
+    parser.add_argument("--response-size", type=int, default=0, help="Padding per analyzed function")
+    parser.add_argument("--seed", type=int, default=1234, help="Mock random seed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Files processed concurrently")
+    parser.add_argument("--chunked", action="store_true", help="Analyze per function")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to check or update")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--update-baseline", action="store_true", help="Store results as the baseline")
+    group.add_argument("--check", action="store_true", help="Fail on regressions against the baseline")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    prompt_trace.configure(enabled=False)
+
+    results = {str(size): run_size(size, args) for size in args.sizes}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results.values():
+            print(
+                f"{result['files']:>5} files: {result['files_per_s']:>8.2f} files/s, "
+                f"wall {result['wall_s']:.2f}s, peak {result['peak_mb']:.1f} MB, "
+                f"{result['failed']} failed"
+            )
+            for stage, stats in result["stages"].items():
+                print(
+                    f"        {stage:<8} p50 {stats['p50_ms']:>8.1f} ms  "
+                    f"p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms"
+                )
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+            sys.exit(1)
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        warn_if_different(baseline.get("environment", {}))
+        problems = check_against(baseline["results"], results, args.tolerance)
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# benchmarks/standin_server.py
+"""
+Local stand-in for an OpenAI-compatible chat-completions endpoint.
+
+Serves `POST .../chat/completions` (streaming and non-streaming) with
+scripted latency, time to first token and token rate, injects 429 and 5xx
+responses at configurable rates, and reports `usage`. Answers come from
+MockAPI, so analyzer and editor prompts get schema-valid XML. `GET /stats`
+returns request, connection and error counters.
+
+Point a provider at it with `base_url`, or PYIMPROVE_<PROVIDER>_BASE_URL:
+    python benchmarks/standin_server.py --port 8765 --ttft 0.2 --rate-limit-rate 0.05
+    PYIMPROVE_OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python main.py --api openai --api_key x ...
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from api.budget import estimate_tokens  # noqa: E402
+from api.mock_api import MockAPI  # noqa: E402
+
+
+@dataclass
+class StandinConfig:
+    """Scripted behavior of the stand-in server."""
+
+    latency: float = 0.0  # Seconds before a non-streaming response.
+    ttft: float = 0.0  # Seconds before the first streamed token.
+    tokens_per_second: float = 0.0  # Streaming rate; 0 sends as fast as possible.
+    jitter: float = 0.0  # Log-normal sigma applied to latency and ttft.
+    rate_limit_rate: float = 0.0  # Fraction of requests answered with 429.
+    error_rate: float = 0.0  # Fraction of requests answered with 500/502/503.
+    retry_after: Optional[float] = 1.0  # Retry-After sent with 429s; None omits it.
+    chunk_chars: int = 16  # Characters per streamed delta.
+    seed: Optional[int] = None
+
+
+@dataclass
+class StandinStats:
+    requests: int = 0
+    streamed: int = 0
+    connections: int = 0
+    rate_limited: int = 0
+    server_errors: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open, so client-side pooling is measurable.
+    protocol_version = "HTTP/1.1"
+    server: "StandinServer"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats.connections += 1
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.server.lock:
+                body = asdict(self.server.stats)
+            self._send_json(200, body)
+        else:
+            self._send_json(404, _error("Not found", "not_found"))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, _error("Not found", "not_found"))
+            return
+        try:
+            request = json.loads(raw)
+        except ValueError:
+            self._send_json(400, _error("Invalid JSON body", "invalid_request_error"))
+            return
+
+        server = self.server
+        with server.lock:
+            server.stats.requests += 1
+            server.stats.in_flight += 1
+            server.stats.max_in_flight = max(server.stats.max_in_flight, server.stats.in_flight)
+        try:
+            failure = server.draw_failure()
+            if failure == 429:
+                with server.lock:
+                    server.stats.rate_limited += 1
+                headers = {}
+                if server.config.retry_after is not None:
+                    headers["Retry-After"] = f"{server.config.retry_after:g}"
+                self._send_json(429, _error("Rate limit reached", "rate_limit_exceeded"), headers)
+                return
+            if failure:
+                with server.lock:
+                    server.stats.server_errors += 1
+                self._send_json(failure, _error("Upstream failure", "server_error"))
+                return
+
+            prompt = "".join(
+                m.get("content") or "" for m in request.get("messages", [])
+                if isinstance(m.get("content"), str)
+            )
+            content = server.mock.respond(prompt)
+            usage = {
+                "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": estimate_tokens(content),
+                "prompt_tokens_details": {"cached_tokens": 0},
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            model = request.get("model") or "standin"
+            if request.get("stream"):
+                with server.lock:
+                    server.stats.streamed += 1
+                include_usage = (request.get("stream_options") or {}).get("include_usage")
+                self._stream(model, content, usage if include_usage else None)
+            else:
+                time.sleep(server.delay(server.config.latency))
+                self._send_json(200, _completion(model, content, usage))
+        finally:
+            with server.lock:
+                server.stats.in_flight -= 1
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, model, content, usage):
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.server.delay(config.ttft))
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        step = max(1, config.chunk_chars)
+        pause = 0.0
+        if config.tokens_per_second:
+            pause = step / _chars_per_token(content) / config.tokens_per_second
+
+        def event(choices, extra=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **(extra or {}),
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for start in range(0, len(content), step):
+            if pause and start:
+                time.sleep(pause)
+            event([{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            event([], {"usage": usage})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def _chars_per_token(content: str) -> float:
+    return max(1.0, len(content) / max(1, estimate_tokens(content)))
+
+
+def _error(message, code):
+    return {"error": {"message": message, "type": code, "code": code}}
+
+
+def _completion(model, content, usage):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": usage,
+    }
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    The stand-in HTTP server. `start()` serves from a background thread and
+    returns the base URL to give to a provider.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, config: Optional[StandinConfig] = None, verbose=False):
+        super().__init__((host, port), _Handler)
+        self.config = config or StandinConfig()
+        self.verbose = verbose
+        self.stats = StandinStats()
+        self.lock = threading.Lock()
+        self.random = random.Random(self.config.seed)
+        self.mock = MockAPI()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def delay(self, seconds: float) -> float:
+        if seconds and self.config.jitter:
+            with self.lock:
+                return seconds * self.random.lognormvariate(0, self.config.jitter)
+        return seconds
+
+    def draw_failure(self) -> Optional[int]:
+        """Returns the status code of an injected failure, or None."""
+        with self.lock:
+            roll = self.random.random()
+            if roll < self.config.rate_limit_rate:
+                return 429
+            if roll < self.config.rate_limit_rate + self.config.error_rate:
+                return self.random.choice((500, 502, 503))
+        return None
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Non-streaming response time (s)")
+    parser.add_argument("--ttft", type=float, default=0.0, help="Time to first streamed token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Streaming token rate")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Log-normal sigma of latency/ttft")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction answered with 5xx")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of 429s; negative omits it")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        latency=args.latency,
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        jitter=args.jitter,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after if args.retry_after >= 0 else None,
+        seed=args.seed,
+    )
+    server = StandinServer(args.host, args.port, config, verbose=args.verbose)
+    print(f"Serving chat completions at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
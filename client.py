@@ -0,0 +1,220 @@
+# client.py
+"""
+Thin command-line client of server.py.
+
+Usage:
+    python client.py submit INPUTS... [--repo DIR] [--api mock] [--wait] [job options]
+    python client.py status JOB | wait JOB | cancel JOB | jobs | health
+
+The server address is --address (http://host:port or unix:/path/to.sock),
+or PYIMPROVE_SERVER, defaulting to http://127.0.0.1:8765. The server's token
+is --token, or PYIMPROVE_SERVER_TOKEN, or read from --token-file (the file
+the server writes, .pyimprove/server.token by default).
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+DEFAULT_ADDRESS = "http://127.0.0.1:8765"
+DEFAULT_TOKEN_FILE = os.path.join(".pyimprove", "server.token")
+TOKEN_ENV = "PYIMPROVE_SERVER_TOKEN"
+
+
+class ClientError(Exception):
+    """The server rejected a request or could not be reached."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class PyImproveClient:
+    """
+    Client of the PyImprove job server. One connection is kept open and
+    reused for every request.
+    """
+
+    def __init__(
+        self,
+        address: Optional[str] = None,
+        timeout: float = 60.0,
+        token: Optional[str] = None,
+        token_file: str = DEFAULT_TOKEN_FILE,
+    ):
+        self.address = address or os.environ.get("PYIMPROVE_SERVER") or DEFAULT_ADDRESS
+        self.timeout = timeout
+        self.token = token or os.environ.get(TOKEN_ENV) or _read_token(token_file)
+        self._connection = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._connection is None:
+            if self.address.startswith("unix:"):
+                self._connection = _UnixHTTPConnection(self.address[len("unix:"):], self.timeout)
+            else:
+                url = urlparse(self.address)
+                self._connection = http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+        return self._connection
+
+    def _request(self, method: str, path: str, body=None, timeout: Optional[float] = None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for attempt in range(2):
+            connection = self._connect()
+            connection.timeout = timeout or self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                payload = json.loads(response.read() or b"null")
+                break
+            except (ConnectionError, http.client.HTTPException) as e:
+                # A kept-alive connection closed by the server: reconnect once.
+                self.close()
+                if attempt:
+                    raise ClientError(f"Cannot reach the server at {self.address}: {e}")
+            except OSError as e:
+                self.close()
+                raise ClientError(f"Cannot reach the server at {self.address}: {e}")
+        if response.status >= 400:
+            message = payload.get("error") if isinstance(payload, dict) else payload
+            raise ClientError(str(message), response.status)
+        return payload
+
+    def submit(self, inputs, **options) -> dict:
+        """Submits a job; `options` are the server's JobRequest fields."""
+        inputs = [os.path.abspath(item) for item in inputs]
+        if options.get("repo"):
+            options["repo"] = os.path.abspath(options["repo"])
+        return self._request("POST", "/jobs", {"inputs": inputs, **options})
+
+    def status(self, job_id: str) -> dict:
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll: float = 30.0) -> dict:
+        """Waits until a job has finished, or `timeout` seconds have passed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            step = poll if deadline is None else max(0.0, min(poll, deadline - time.monotonic()))
+            job = self._request("GET", f"/jobs/{job_id}/wait?timeout={step}", timeout=step + self.timeout)
+            if job["status"] in ("done", "failed", "cancelled"):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+
+    def cancel(self, job_id: str) -> dict:
+        return self._request("POST", f"/jobs/{job_id}/cancel")
+
+    def jobs(self) -> list:
+        return self._request("GET", "/jobs")
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _read_token(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def print_job(job: dict):
+    """Prints a job's status and per-file results like main.py reports them."""
+    print(f"Job {job['id']}: {job['status']}" + (f" ({job['error']})" if job.get("error") else ""))
+    for result in job.get("results") or []:
+        line = f"[{result['status']}] {result['path']} ({result['elapsed']:.2f}s, {result['actions']} actions)"
+        if result.get("error"):
+            line += f": {result['error']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyImprove job server client")
+    parser.add_argument("--address", help=f"Server address (default: $PYIMPROVE_SERVER or {DEFAULT_ADDRESS})")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON responses")
+    parser.add_argument("--token", help=f"Server token (default: ${TOKEN_ENV} or --token-file)")
+    parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE, help="File the server wrote its token to")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Submit a job")
+    submit.add_argument("inputs", nargs="+", help="Files, directories or glob patterns")
+    submit.add_argument("--api", default="mock")
+    submit.add_argument("--api_key")
+    submit.add_argument("--repo")
+    submit.add_argument("--git-files", action="store_true")
+    submit.add_argument("--concurrency", type=int)
+    submit.add_argument("--edit-concurrency", type=int)
+    submit.add_argument("--chunked", action="store_true")
+    submit.add_argument("--stream", action="store_true")
+    submit.add_argument("--incremental", action="store_true")
+    submit.add_argument("--triage", action="store_true")
+    submit.add_argument("--candidates", type=int)
+    submit.add_argument("--worktrees", type=int)
+    submit.add_argument("--verify", action="store_true")
+    submit.add_argument("--refresh-cache", action="store_true")
+    submit.add_argument("--cache-sampled", action="store_true")
+    submit.add_argument("--wait", action="store_true", help="Wait for the job and print its results")
+    for name in ("status", "wait", "cancel"):
+        commands.add_parser(name, help=f"{name.capitalize()} a job").add_argument("job")
+    commands.add_parser("jobs", help="List jobs")
+    commands.add_parser("health", help="Show the server's state")
+    args = parser.parse_args()
+
+    client = PyImproveClient(args.address, token=args.token, token_file=args.token_file)
+    try:
+        if args.command == "submit":
+            options = {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("address", "json", "token", "token_file", "command", "inputs", "wait")
+                and value not in (None, False)
+            }
+            job = client.submit(args.inputs, **options)
+            if args.wait:
+                job = client.wait(job["id"])
+        elif args.command in ("status", "wait", "cancel"):
+            job = getattr(client, args.command)(args.job)
+        else:
+            print(json.dumps(getattr(client, args.command)(), indent=2))
+            return
+    except ClientError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+    if args.json:
+        print(json.dumps(job, indent=2))
+    else:
+        print_job(job)
+    if job["status"] == "failed":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
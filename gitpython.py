@@ -1,14 +1,118 @@
 # gitpython.py
 
+import itertools
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import sys
 import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+# Attempts at moving HEAD to a new commit when other writers move it first.
+COMMIT_ATTEMPTS = 5
+
+
+@dataclass
+class StatusEntry:
+    """One entry of `git status --porcelain`."""
+
+    index_status: str
+    worktree_status: str
+    path: str
+    orig_path: Optional[str] = None
+
+
+@dataclass
+class DiffHunk:
+    """One hunk of a unified diff."""
+
+    path: str
+    old_start: int
+    old_lines: int
+    new_start: int
+    new_lines: int
+    lines: List[str] = field(default_factory=list)
+
+
+@dataclass
+class LogRecord:
+    """One commit of `git log`."""
+
+    commit: str
+    author: str
+    date: str
+    subject: str
+
+
+class CatFile:
+    """
+    A long-lived `git cat-file --batch` (or `--batch-check`) process for
+    reading objects.
+
+    Each read is a line written to the process' stdin, so reading many blobs
+    costs one process spawn instead of one per object.
+    """
+
+    def __init__(self, cwd: str, check_only=False):
+        self.cwd = cwd
+        self.check_only = check_only
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch-check" if self.check_only else "--batch"],
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self._process
+
+    def read(self, object_name: str):
+        """
+        Returns (object id, type, contents) for `object_name` (e.g. "HEAD",
+        "HEAD:path/to/file.py" or a sha), or None if the object does not exist.
+        In check-only mode the size is returned instead of the contents.
+        """
+        with self._lock:
+            process = self._ensure_process()
+            process.stdin.write(object_name.encode("utf-8") + b"\n")
+            process.stdin.flush()
+            header = process.stdout.readline().decode("utf-8").split()
+            if len(header) != 3:
+                return None  # "<name> missing" or "<name> ambiguous"
+            object_id, object_type, size = header
+            if self.check_only:
+                return object_id, object_type, int(size)
+            contents = process.stdout.read(int(size))
+            process.stdout.read(1)  # trailing newline
+            return object_id, object_type, contents
+
+    def close(self):
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process.stdout.close()
+                self._process = None
+
 
 class GitRepo:
     """Class with system commands for git"""
 
     def __init__(self, repo_path: str, commit=False):
         self.repo_path = repo_path
+        self._discovered = None
+        self._head = None
+        self._cat_file = None
+        self._cat_file_check = None
         self.git_init(commit=commit)
 
     def git_init(self, commit=False):
@@ -18,6 +122,7 @@ class GitRepo:
             return
         try:
             subprocess.run(["git", "init"], cwd=self.repo_path, check=True)
+            self._discovered = None
             print("Git repository initialized.")
             if commit:
                 self.git_add_all()
@@ -47,57 +152,287 @@ class GitRepo:
             subprocess.run(
                 ["git", "commit", "-m", message], cwd=self.repo_path, check=True
             )
+            self._head = None
             print(f"Committed with message: '{message}'")
         except subprocess.CalledProcessError as e:
             print(f"Git commit failed: {e}")
 
-    def git_status(self):
-        """Check status of the repository."""
+    def git_commit_paths(self, paths: list, message="Update"):
+        """
+        Commit only `paths` (added, modified or deleted) on top of HEAD.
+
+        The commit is built with plumbing in a temporary index, so the working
+        tree is never rescanned and unrelated staged changes are left alone.
+        The real index is then refreshed for the committed paths only.
+
+        Returns:
+            The new commit id, or None if the commit failed.
+        """
+        toplevel = self.git_toplevel()
+        rel_paths = [os.path.relpath(os.path.abspath(p), toplevel) for p in paths]
+        self._head = None
+        head = self.git_head()
+        fd, tmp_index = tempfile.mkstemp(prefix="pyimprove-index-")
+        os.close(fd)
+        os.remove(tmp_index)  # git expects either a valid index or no file
+        env = dict(os.environ, GIT_INDEX_FILE=tmp_index)
+
+        def git(*args, input=None, use_env=True):
+            return subprocess.run(
+                ["git"] + list(args),
+                cwd=toplevel,
+                env=env if use_env else None,
+                input=input,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+
+        try:
+            path_list = "\0".join(rel_paths) + "\0"
+            for attempt in range(COMMIT_ATTEMPTS):
+                if head:
+                    git("read-tree", head)
+                else:
+                    git("read-tree", "--empty")
+                git("update-index", "--add", "--remove", "-z", "--stdin", input=path_list)
+                tree = git("write-tree")
+                parents = ["-p", head] if head else []
+                commit = git("commit-tree", tree, *parents, "-m", message)
+                # Passing the old value makes the update fail if HEAD moved meanwhile,
+                # e.g. through another process committing to the same repository;
+                # the commit is then rebuilt on top of the new HEAD.
+                old_head = head or "0" * 40
+                try:
+                    git("update-ref", "-m", f"commit: {message}", "HEAD", commit, old_head, use_env=False)
+                    break
+                except subprocess.CalledProcessError:
+                    self._head = None
+                    moved = self.git_head()
+                    if attempt == COMMIT_ATTEMPTS - 1:
+                        raise
+                    if moved == head:
+                        time.sleep(0.05 * (attempt + 1))  # HEAD is locked by a concurrent update
+                    head = moved
+            try:
+                git(
+                    "update-index", "--add", "--remove", "-z", "--stdin",
+                    input=path_list, use_env=False,
+                )
+            except subprocess.CalledProcessError as e:
+                # The commit exists; a stale index only makes the paths look modified.
+                print(f"Git index refresh failed: {e.stderr if e.stderr else e}")
+            self._head = commit
+            print(f"Committed {len(rel_paths)} files with message: '{message}'")
+            return commit
+        except subprocess.CalledProcessError as e:
+            print(f"Git commit failed: {e.stderr if e.stderr else e}")
+            return None
+        finally:
+            if os.path.exists(tmp_index):
+                os.remove(tmp_index)
+
+    def git_status(self) -> List[StatusEntry]:
+        """Return the status of the repository as structured entries."""
         try:
             result = subprocess.run(
-                ["git", "status"],
+                ["git", "status", "--porcelain", "-z"],
                 cwd=self.repo_path,
                 check=True,
                 capture_output=True,
                 text=True,
             )
-            print("Repository status:")
-            print(result.stdout)
         except subprocess.CalledProcessError as e:
             print(f"Git status failed: {e}")
+            return []
+        entries = []
+        records = iter(result.stdout.split("\0"))
+        for record in records:
+            if len(record) < 4:
+                continue
+            entry = StatusEntry(record[0], record[1], record[3:])
+            if "R" in record[:2] or "C" in record[:2]:
+                entry.orig_path = next(records, None)
+            entries.append(entry)
+        return entries
 
-    def git_log(self):
-        """Show the commit logs."""
+    def git_log(self, max_count=None, rev="HEAD") -> List[LogRecord]:
+        """Return the commit log as structured records, newest first."""
+        args = ["git", "log", "--format=%H%x00%an%x00%aI%x00%s", rev, "--"]
+        if max_count:
+            args.insert(2, f"--max-count={max_count}")
         try:
             result = subprocess.run(
-                ["git", "log", "--oneline"],
+                args,
                 cwd=self.repo_path,
                 check=True,
                 capture_output=True,
                 text=True,
             )
-            print("Commit log (one line per commit):")
-            print(result.stdout)
         except subprocess.CalledProcessError as e:
             print(f"Git log failed: {e}")
+            return []
+        return [
+            LogRecord(*line.split("\0", 3))
+            for line in result.stdout.splitlines()
+            if line.count("\0") >= 3
+        ]
 
-    def git_diff(self):
-        """Show differences between the working directory and the index."""
+    def git_diff(self, rev=None, paths=None) -> List[DiffHunk]:
+        """
+        Return the differences between the working directory and the index
+        (or `rev`, if given) as structured hunks.
+        """
+        args = ["git", "diff", "--no-color", "--no-ext-diff"]
+        if rev:
+            args.append(rev)
+        args += ["--"] + list(paths or [])
         try:
             result = subprocess.run(
-                ["git", "diff"],
+                args,
                 cwd=self.repo_path,
                 check=True,
                 capture_output=True,
                 text=True,
             )
-            if result.stdout:
-                print("Changes not staged for commit:")
-                print(result.stdout)
-            else:
-                print("No changes detected in working directory.")
         except subprocess.CalledProcessError as e:
             print(f"Git diff failed: {e}")
+            return []
+        return parse_unified_diff(result.stdout)
+
+    def git_read_file(self, path: str, rev="HEAD") -> Optional[bytes]:
+        """
+        Return the contents of `path` (relative to the top-level directory) at
+        `rev` without touching the working tree, or None if it does not exist.
+        """
+        if self._cat_file is None:
+            self._cat_file = CatFile(self.git_toplevel())
+        obj = self._cat_file.read(f"{rev}:{path.replace(os.sep, '/')}")
+        if obj is None or obj[1] != "blob":
+            return None
+        return obj[2]
+
+    def git_object_info(self, object_name: str):
+        """
+        Return (object id, type, size) for `object_name`, or None if it does
+        not exist.
+        """
+        if self._cat_file_check is None:
+            self._cat_file_check = CatFile(self.git_toplevel(), check_only=True)
+        return self._cat_file_check.read(object_name)
+
+    def close(self):
+        """Stops the long-lived git processes."""
+        for cat_file in (self._cat_file, self._cat_file_check):
+            if cat_file is not None:
+                cat_file.close()
+        self._cat_file = None
+        self._cat_file_check = None
+
+    def git_ls_files(self, patterns=None) -> list:
+        """List tracked files, optionally filtered by pathspec patterns."""
+        try:
+            result = subprocess.run(
+                ["git", "ls-files", "--"] + list(patterns or []),
+                cwd=self.repo_path,
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            return [line for line in result.stdout.splitlines() if line]
+        except subprocess.CalledProcessError as e:
+            print(f"Git ls-files failed: {e}")
+            return []
+
+    def _rev_parse(self, *args):
+        """Runs `git rev-parse` and returns its output, or None on failure."""
+        try:
+            result = subprocess.run(
+                ["git", "rev-parse"] + list(args),
+                cwd=self.repo_path,
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            return result.stdout.strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def _discover(self):
+        """
+        Finds the top-level directory and git directory by walking up from
+        `repo_path`, without spawning git. The result is cached.
+        """
+        if self._discovered is not None:
+            return self._discovered
+        directory = os.path.abspath(self.repo_path)
+        while True:
+            dot_git = os.path.join(directory, ".git")
+            if os.path.isdir(dot_git):
+                self._discovered = (directory, dot_git)
+                break
+            if os.path.isfile(dot_git):
+                # Worktrees and submodules use a "gitdir: <path>" file.
+                with open(dot_git, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                if content.startswith("gitdir:"):
+                    git_dir = os.path.join(directory, content[len("gitdir:"):].strip())
+                    self._discovered = (directory, os.path.normpath(git_dir))
+                    break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                toplevel = self._rev_parse("--show-toplevel")
+                git_dir = self._rev_parse("--absolute-git-dir")
+                if toplevel and git_dir:
+                    self._discovered = (toplevel, git_dir)
+                break
+            directory = parent
+        return self._discovered
+
+    def git_head(self):
+        """Return the commit id of HEAD, or None if there are no commits yet."""
+        if self._head is None:
+            self._head = self._rev_parse("--verify", "--quiet", "HEAD")
+        return self._head
+
+    def git_toplevel(self) -> str:
+        """Return the absolute path of the repository's top-level directory."""
+        discovered = self._discover()
+        return discovered[0] if discovered else os.path.abspath(self.repo_path)
+
+    def git_dir(self) -> str:
+        """Return the absolute path of the repository's .git directory."""
+        discovered = self._discover()
+        if discovered:
+            return discovered[1]
+        return os.path.join(os.path.abspath(self.repo_path), ".git")
+
+    def git_changed_files(self, since: str) -> list:
+        """
+        List files (relative to the top-level directory) that differ between
+        `since` and the working tree, including untracked files.
+        """
+        toplevel = self.git_toplevel()
+        try:
+            diff = subprocess.run(
+                ["git", "diff", "--name-only", since, "--"],
+                cwd=toplevel,
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            untracked = subprocess.run(
+                ["git", "ls-files", "--others", "--exclude-standard"],
+                cwd=toplevel,
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+        except subprocess.CalledProcessError as e:
+            print(f"Git diff failed: {e}")
+            return []
+        lines = diff.stdout.splitlines() + untracked.stdout.splitlines()
+        return [line for line in lines if line]
 
     def git_reset(self):
         """
@@ -105,6 +440,7 @@ class GitRepo:
         """
         try:
             subprocess.run(["git", "reset", "--hard"], cwd=self.repo_path, check=True)
+            self._head = None
             print("Reset to last commit. All changes discarded.")
         except subprocess.CalledProcessError as e:
             print(f"Git reset failed: {e.stderr if e.stderr else e}")
@@ -112,24 +448,183 @@ class GitRepo:
     def is_git_repo(self) -> bool:
         """Checks if the given directory is a git repository."""
         try:
-            # Check if .git directory exists
-            git_dir = os.path.join(self.repo_path, ".git")
-            if os.path.isdir(git_dir):
-                return True
-            # Check if git command can successfully execute in the directory
-            subprocess.run(
-                ["git", "rev-parse", "--is-inside-work-tree"],
-                cwd=self.repo_path,
-                check=True,
-                capture_output=True,
-            )
-            return True
-        except subprocess.CalledProcessError:
-            return False
+            return self._discover() is not None
         except FileNotFoundError:
             return False
 
 
+@dataclass
+class Worktree:
+    """A linked worktree checked out on a job branch, based on `base`."""
+
+    path: str
+    repo: "GitRepo"
+    branch: Optional[str] = None
+    base: Optional[str] = None
+
+
+class WorktreeManager:
+    """
+    A pool of linked worktrees (`git worktree`) of one repository, so that
+    several jobs can edit, test and commit in parallel without touching the
+    main working tree or each other.
+
+    A job acquires a worktree, which is reset to the main repository's HEAD
+    on a branch of its own, commits there, and `integrate` brings the commits
+    back onto the main branch: a fast-forward if HEAD has not moved, else a
+    cherry-pick. Released worktrees stay checked out, so the next job only
+    pays for the files that changed in between.
+    """
+
+    def __init__(self, repo: GitRepo, size: int = None, root: str = None, prefix="pyimprove/job-"):
+        self.repo = repo
+        self.size = max(1, size or os.cpu_count() or 1)
+        self.root = root or os.path.join(repo.git_dir(), "pyimprove-worktrees")
+        self.prefix = prefix
+        self._idle: List[Worktree] = []
+        self._all: List[Worktree] = []
+        self._jobs = itertools.count(1)
+        self._condition = threading.Condition()
+        self._integrate_lock = threading.Lock()
+        # Forget worktrees left behind by an interrupted run.
+        self._git(repo.git_toplevel(), "worktree", "prune")
+
+    def _git(self, cwd, *args) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ["git"] + list(args), cwd=cwd, check=True, capture_output=True, text=True
+            ).stdout.strip()
+        except subprocess.CalledProcessError as e:
+            print(f"Git {args[0]} failed: {e.stderr.strip() if e.stderr else e}")
+            return None
+
+    def _create(self) -> Worktree:
+        path = os.path.join(self.root, f"wt-{len(self._all)}")
+        if os.path.exists(path):
+            self._git(self.repo.git_toplevel(), "worktree", "remove", "--force", path)
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        if self._git(self.repo.git_toplevel(), "worktree", "add", "--detach", path, "HEAD") is None:
+            raise RuntimeError(f"Could not create a worktree at {path}.")
+        return Worktree(path, GitRepo(path))
+
+    def acquire(self) -> Worktree:
+        """
+        Returns a worktree on a new job branch at the main repository's HEAD,
+        creating one if the pool is not full and waiting otherwise.
+        """
+        with self._condition:
+            while not self._idle and len(self._all) >= self.size:
+                self._condition.wait()
+            if self._idle:
+                worktree = self._idle.pop()
+            else:
+                worktree = self._create()
+                self._all.append(worktree)
+        self.repo._head = None
+        base = self.repo.git_head()
+        branch = f"{self.prefix}{next(self._jobs)}"
+        if base is None or self._git(worktree.path, "checkout", "--force", "-B", branch, base) is None:
+            self.release(worktree)
+            raise RuntimeError(f"Could not check out {branch} in {worktree.path}.")
+        self._git(worktree.path, "clean", "-fdq")
+        worktree.branch, worktree.base = branch, base
+        worktree.repo._head = base
+        return worktree
+
+    def translate(self, worktree: Worktree, path: str) -> str:
+        """Maps a path in the main working tree to the same path in `worktree`."""
+        relative = os.path.relpath(os.path.abspath(path), self.repo.git_toplevel())
+        if relative.startswith(os.pardir):
+            raise ValueError(f"{path} is outside the repository.")
+        return os.path.join(worktree.path, relative)
+
+    def integrate(self, worktree: Worktree) -> Optional[str]:
+        """
+        Brings the commits of the worktree's job branch onto the main branch.
+
+        Returns:
+            The new HEAD of the main repository, or None if the commits
+            conflict with what was committed there meanwhile.
+        """
+        with self._integrate_lock:
+            toplevel = self.repo.git_toplevel()
+            self.repo._head = None
+            head = self.repo.git_head()
+            tip = self._git(worktree.path, "rev-parse", "HEAD")
+            if tip is None or tip == worktree.base:
+                return head
+            if head == worktree.base:
+                merged = self._git(toplevel, "merge", "--ff-only", "--quiet", worktree.branch)
+            else:
+                merged = self._git(toplevel, "cherry-pick", f"{worktree.base}..{worktree.branch}")
+                if merged is None:
+                    self._git(toplevel, "cherry-pick", "--abort")
+            self.repo._head = None
+            if merged is None:
+                return None
+            print(f"Integrated {worktree.branch} into {self.repo.git_head()[:12]}.")
+            return self.repo.git_head()
+
+    def release(self, worktree: Worktree):
+        """Returns a worktree to the pool and deletes its job branch."""
+        if worktree.branch:
+            self._git(worktree.path, "checkout", "--detach", "--quiet")
+            self._git(worktree.path, "branch", "-D", "--quiet", worktree.branch)
+            worktree.branch = None
+        with self._condition:
+            self._idle.append(worktree)
+            self._condition.notify()
+
+    def close(self):
+        """Removes every worktree of the pool."""
+        with self._condition:
+            for worktree in self._all:
+                worktree.repo.close()
+                self._git(self.repo.git_toplevel(), "worktree", "remove", "--force", worktree.path)
+            self._all, self._idle = [], []
+        self._git(self.repo.git_toplevel(), "worktree", "prune")
+
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_unified_diff(text: str) -> List[DiffHunk]:
+    """
+    Parses the output of `git diff` into hunks. Lines are split at "\n" only,
+    as git does; form feeds and other separators stay inside their line.
+    """
+    hunks = []
+    path = None
+    hunk = None
+    for line in text.split("\n"):
+        if line.endswith("\r"):
+            line = line[:-1]
+        if line.startswith("diff --git "):
+            hunk = None
+        elif line.startswith("+++ "):
+            target = line[4:]
+            path = target[2:] if target.startswith("b/") else target
+        elif line.startswith("--- ") and hunk is None:
+            source = line[4:]
+            path = source[2:] if source.startswith("a/") else source
+        elif line.startswith("@@"):
+            match = _HUNK_HEADER_RE.match(line)
+            if not match:
+                continue
+            old_start, old_lines, new_start, new_lines = match.groups()
+            hunk = DiffHunk(
+                path,
+                int(old_start),
+                int(old_lines) if old_lines is not None else 1,
+                int(new_start),
+                int(new_lines) if new_lines is not None else 1,
+            )
+            hunks.append(hunk)
+        elif hunk is not None and line[:1] in (" ", "+", "-", "\\"):
+            hunk.lines.append(line)
+    return hunks
+
 if __name__ == "__main__":
     import os
 
@@ -0,0 +1,129 @@
+# incremental.py
+import ast
+import hashlib
+import json
+import logging
+import os
+import textwrap
+from typing import Dict, List, Optional
+from agents.chunking import split_functions
+from gitpython import GitRepo
+
+
+def fingerprint(source: str) -> str:
+    """
+    Hashes the normalized AST of a function's source.
+
+    Line numbers, formatting and comments do not affect the fingerprint.
+    """
+    tree = ast.parse(textwrap.dedent(source))
+    normalized = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def fingerprint_script(source: str) -> Dict[str, str]:
+    """Returns the fingerprint of every function in a script, by qualified name."""
+    return {chunk.qualified_name: fingerprint(chunk.source) for chunk in split_functions(source)}
+
+
+class FunctionIndex:
+    """
+    Per-function fingerprints of the last processed state of a repository.
+
+    The index lives in the repository's git directory, so it is never committed,
+    and records the commit it was last synchronized with. Files that git reports
+    as unchanged since that commit are skipped without being parsed.
+    """
+
+    def __init__(self, repo: GitRepo, path: Optional[str] = None):
+        self.repo = repo
+        self.toplevel = repo.git_toplevel()
+        self.path = path or os.path.join(repo.git_dir(), "pyimprove", "function_index.json")
+        self.last_commit = None
+        self.files: Dict[str, Dict[str, str]] = {}
+        self.stale = set()
+        self._changed_since_last = None
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable function index {self.path}: {e}")
+            return
+        self.last_commit = data.get("last_commit")
+        self.files = data.get("files", {})
+        self.stale = set(data.get("stale", []))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "last_commit": self.last_commit,
+                    "files": self.files,
+                    "stale": sorted(self.stale),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+    def _key(self, script_path: str) -> str:
+        return os.path.relpath(os.path.abspath(script_path), self.toplevel).replace(os.sep, "/")
+
+    def _changed_files(self) -> Optional[set]:
+        """Files changed since the last processed commit, or None if unknown."""
+        if self._changed_since_last is None and self.last_commit:
+            self._changed_since_last = set(self.repo.git_changed_files(self.last_commit))
+        return self._changed_since_last
+
+    def changed_functions(self, script_path: str) -> List[str]:
+        """
+        Returns the qualified names of functions in `script_path` that are new
+        or modified since they were last recorded.
+        """
+        key = self._key(script_path)
+        changed_files = self._changed_files()
+        if (
+            key in self.files
+            and key not in self.stale
+            and changed_files is not None
+            and key not in changed_files
+        ):
+            return []
+
+        with open(script_path, "r", encoding="utf-8") as f:
+            current = fingerprint_script(f.read())
+        previous = self.files.get(key, {})
+        return [name for name, digest in current.items() if previous.get(name) != digest]
+
+    def update(self, script_path: str):
+        """Records the current fingerprints of `script_path`."""
+        key = self._key(script_path)
+        self.stale.discard(key)
+        if not os.path.exists(script_path):
+            self.files.pop(key, None)
+            return
+        with open(script_path, "r", encoding="utf-8") as f:
+            try:
+                self.files[key] = fingerprint_script(f.read())
+            except SyntaxError as e:
+                logging.warning(f"Not indexing {script_path}: {e}")
+                self.files.pop(key, None)
+
+    def invalidate(self, script_path: str):
+        """
+        Marks `script_path` as not processed, so the next run compares its
+        functions even if git reports no change since the last commit.
+        """
+        self.stale.add(self._key(script_path))
+
+    def mark_processed(self):
+        """Records HEAD as the last processed commit and saves the index."""
+        self.last_commit = self.repo.git_head()
+        self._changed_since_last = None
+        self.save()
@@ -0,0 +1,284 @@
+# job_store.py
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+DEFAULT_JOB_STORE_PATH = os.path.join(".pyimprove", "jobs.sqlite3")
+
+# Checkpoints of a file, in pipeline order.
+STAGES = ("pending", "analyzed", "edited", "verified", "applied")
+
+
+@dataclass
+class JobRecord:
+    """A claimed file and the checkpoints it has already passed."""
+
+    path: str
+    stage: str = "pending"
+    functions: Optional[List[str]] = None
+    analysis: Optional[str] = None
+    actions: List[Dict[str, Any]] = field(default_factory=list)
+    attempts: int = 0
+    # The file's digest when it was analyzed, before any edit.
+    digest: Optional[str] = None
+    # Files a write into the working tree was changing when the run stopped,
+    # with their contents before it (None for files it created).
+    journal: Dict[str, Optional[bytes]] = field(default_factory=dict)
+
+
+def file_digest(path: str) -> Optional[str]:
+    """Returns the SHA-256 of a file's contents, or None if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def default_run_id(directory: str, scripts: List[str]) -> str:
+    """The same inputs on the same repository give the same run, so a rerun resumes it."""
+    payload = "\n".join([os.path.abspath(directory)] + sorted(scripts))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class JobStore:
+    """
+    Durable per-file job queue of a run, backed by SQLite.
+
+    Each file records the last stage it completed together with what that
+    stage produced (the analysis XML, the editor actions), so a restarted run
+    resumes every file from its last checkpoint instead of paying for the
+    generations again. Before edits are written into the working tree, the
+    files they touch are journaled, so a resumed run can tell an edit that
+    was cut short (and undo it) from a change made by someone else, after
+    which the file's checkpoints are dropped (see `reset`).
+
+    Several processes can share a store: `claim` hands out files in a write
+    transaction with a lease, and a file whose lease expires (or whose worker
+    on this host has died) is handed out again.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_JOB_STORE_PATH,
+        lease: float = 1800.0,
+        max_attempts: int = 3,
+    ):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; claims open their own IMMEDIATE transactions.
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                run TEXT NOT NULL,
+                path TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                state TEXT NOT NULL,
+                status TEXT,
+                digest TEXT,
+                functions TEXT,
+                analysis TEXT,
+                actions TEXT,
+                journal TEXT,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (run, path)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (run, state, position)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "journal" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN journal TEXT")
+
+    def enqueue(self, run: str, paths: List[str]) -> int:
+        """Adds the files of a run; files already in the run keep their progress."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (run, path, position, stage, state, updated) "
+                "VALUES (?, ?, ?, 'pending', 'queued', ?)",
+                [(run, os.path.abspath(path), position, now) for position, path in enumerate(paths)],
+            )
+            return cursor.rowcount
+
+    def release_stale(self, run: str) -> int:
+        """Requeues the claims of workers on this host that are no longer running."""
+        host = socket.gethostname()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT worker FROM jobs WHERE run = ? AND state = 'claimed'", (run,)
+            ).fetchall()
+            dead = [worker for (worker,) in rows if _is_dead(worker, host)]
+            for worker in dead:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'queued', worker = NULL, lease_until = NULL "
+                    "WHERE run = ? AND state = 'claimed' AND worker = ?",
+                    (run, worker),
+                )
+        if dead:
+            logging.info(f"Requeued the claims of {len(dead)} stopped workers.")
+        return len(dead)
+
+    def claim(self, run: str, limit: int = 1) -> List[JobRecord]:
+        """
+        Claims up to `limit` files of a run for this worker, in input order:
+        queued files, files whose lease expired, and failed files that have
+        attempts left.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT path, stage, digest, functions, analysis, actions, journal, attempts "
+                    "FROM jobs WHERE run = ? AND (state = 'queued' "
+                    "OR (state = 'claimed' AND lease_until < ?) "
+                    "OR (state = 'failed' AND attempts < ?)) "
+                    "ORDER BY position LIMIT ?",
+                    (run, now, self.max_attempts, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET state = 'claimed', worker = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE run = ? AND path = ?",
+                    [(self.worker, now + self.lease, now, run, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._record(*row) for row in rows]
+
+    @staticmethod
+    def _record(path, stage, digest, functions, analysis, actions, journal, attempts) -> JobRecord:
+        return JobRecord(
+            path,
+            stage,
+            json.loads(functions) if functions else None,
+            analysis,
+            json.loads(actions) if actions else [],
+            attempts + 1,
+            digest,
+            {
+                name: None if contents is None else contents.encode("utf-8", "surrogateescape")
+                for name, contents in (json.loads(journal) if journal else {}).items()
+            },
+        )
+
+    def reset(self, run: str, record: JobRecord) -> JobRecord:
+        """Drops the checkpoints of a file that changed since it was analyzed."""
+        logging.info(f"{record.path} changed since it was analyzed; starting over.")
+        self.checkpoint(run, record.path, "pending")
+        return JobRecord(record.path, attempts=record.attempts)
+
+    def journal(self, run: str, path: str, originals: Dict[str, Optional[bytes]]):
+        """
+        Records the files a write is about to change, with their current
+        contents; cleared once the file is complete or reset.
+        """
+        # surrogateescape keeps non-UTF-8 bytes intact through JSON.
+        originals = {
+            name: None if contents is None else contents.decode("utf-8", "surrogateescape")
+            for name, contents in originals.items()
+        }
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET journal = ?, updated = ? WHERE run = ? AND path = ?",
+                (json.dumps(originals), time.time(), run, os.path.abspath(path)),
+            )
+
+    def checkpoint(
+        self,
+        run: str,
+        path: str,
+        stage: str,
+        functions: Optional[List[str]] = None,
+        analysis: Optional[str] = None,
+        actions: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        Records that a file completed `stage`, with what the stage produced,
+        and renews the lease. Analyzing records the file's digest; later
+        stages keep what earlier ones stored.
+        """
+        now = time.time()
+        assignments = ["stage = ?", "lease_until = ?", "updated = ?"]
+        values: List[Any] = [stage, now + self.lease, now]
+        if stage == "pending":
+            assignments += [
+                "digest = NULL", "functions = NULL", "analysis = NULL", "actions = NULL",
+                "journal = NULL",
+            ]
+        if stage == "analyzed":
+            assignments += ["digest = ?", "functions = ?", "analysis = ?"]
+            values += [file_digest(path), json.dumps(functions) if functions else None, analysis]
+        if actions is not None:
+            assignments.append("actions = ?")
+            values.append(json.dumps(actions))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(assignments)} WHERE run = ? AND path = ?",
+                values + [run, os.path.abspath(path)],
+            )
+
+    def complete(self, run: str, path: str, status: str, error: Optional[str] = None):
+        """Records a file's final status; failed files may be claimed again."""
+        state = "failed" if status == "failed" else "done"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, status = ?, error = ?, worker = NULL, "
+                "lease_until = NULL, journal = NULL, updated = ?, "
+                "stage = CASE WHEN ? = 'edited' THEN 'applied' ELSE stage END "
+                "WHERE run = ? AND path = ?",
+                (state, status, error, time.time(), status, run, os.path.abspath(path)),
+            )
+
+    def progress(self, run: str) -> Dict[str, int]:
+        """Counts the files of a run by state, and the unfinished ones by stage."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, stage, COUNT(*) FROM jobs WHERE run = ? GROUP BY state, stage", (run,)
+            ).fetchall()
+        counts: Dict[str, int] = {}
+        for state, stage, count in rows:
+            counts[state] = counts.get(state, 0) + count
+            if state != "done":
+                counts[f"{state}:{stage}"] = counts.get(f"{state}:{stage}", 0) + count
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _is_dead(worker: Optional[str], host: str) -> bool:
+    """Whether `worker` ("host:pid") ran on this host and its process is gone."""
+    if not worker or ":" not in worker:
+        return False
+    worker_host, _, pid = worker.rpartition(":")
+    if worker_host != host or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
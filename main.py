@@ -1,11 +1,27 @@
 # main.py
 import argparse
+import contextlib
+import cProfile
+import glob
 import os
 import logging
+import time
+import pstats
+from typing import List, Optional
 from agents.function_analyzer.function_analyzer import FunctionAnalyzer
 from agents.function_editor.function_editor import FunctionEditorAgent
-from gitpython import GitRepo
-from api import create_api_instance
+from agents.triage import Triage, TriageThresholds
+from gitpython import GitRepo, WorktreeManager
+from incremental import FunctionIndex
+from job_store import DEFAULT_JOB_STORE_PATH, JobStore, default_run_id
+import metrics
+import prompt_trace
+from pipeline import FileResult, Pipeline, RunContext
+from verification import Verifier
+from api import available_apis, create_api_instance
+from api.api import run_sync
+from api.cache import DEFAULT_CACHE_PATH, CachedAPI, ResponseCache
+from api.scheduling import all_metrics
 
 
 logging.basicConfig(
@@ -13,23 +29,106 @@ logging.basicConfig(
 )
 
 
-def parse_actions(actions, repo):
-    for action in actions:
-        if action["type"] == "create_file" or action["type"] == "edit_file":
-            with open(action["file_path"], "w", encoding="utf-8") as f:
-                f.write(action["file_contents"])
-            repo.git_add_all()
-            repo.git_commit()
-            logging.info(f"Created or edited file {action['file_path']}.")
+def collect_scripts(inputs: List[str], repo: Optional[GitRepo] = None) -> List[str]:
+    """
+    Expands files, directories and glob patterns into a sorted list of Python files.
+
+    If `repo` is given, the selection comes from `git ls-files` instead, using
+    `inputs` as pathspecs relative to the repository.
+    """
+    scripts = set()
+    if repo is not None:
+        pathspecs = [os.path.relpath(os.path.abspath(p), repo.repo_path) for p in inputs]
+        for path in repo.git_ls_files(pathspecs or None):
+            if path.endswith(".py"):
+                scripts.add(os.path.join(repo.repo_path, path))
+        return sorted(scripts)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                scripts.update(
+                    os.path.join(root, name) for name in files if name.endswith(".py")
+                )
+        elif os.path.isfile(item):
+            scripts.add(item)
+        else:
+            scripts.update(
+                path
+                for path in glob.glob(item, recursive=True)
+                if path.endswith(".py") and os.path.isfile(path)
+            )
+    return sorted(os.path.abspath(path) for path in scripts)
+
+
+def _input_base_dir(item: str) -> str:
+    """Returns the directory an input refers to, ignoring any glob components."""
+    if os.path.isdir(item):
+        return os.path.abspath(item)
+    parts = []
+    for part in os.path.dirname(item).split(os.sep):
+        if any(char in part for char in "*?["):
+            break
+        parts.append(part)
+    return os.path.abspath(os.sep.join(parts) or ".")
+
+
+def _single_file(inputs: List[str], git_files=False) -> bool:
+    return len(inputs) == 1 and os.path.isfile(inputs[0]) and not git_files
+
+
+def resolve_directory(inputs: List[str], repo: Optional[str] = None, git_files=False) -> str:
+    """Returns the repository directory for a run: `repo`, or the inputs' common base."""
+    if repo:
+        return os.path.abspath(repo)
+    if _single_file(inputs, git_files):
+        return os.path.abspath(os.path.dirname(inputs[0]))
+    return os.path.commonpath([_input_base_dir(item) for item in inputs])
+
+
+def select_scripts(inputs: List[str], repo: GitRepo, git_files=False) -> List[str]:
+    """Returns the scripts a run processes, in order."""
+    if _single_file(inputs, git_files):
+        return [inputs[0]]
+    return collect_scripts(inputs, repo if git_files else None)
 
-        elif action["type"] == "delete_file":
-            if os.path.exists(action["file_path"]):
-                os.remove(action["file_path"])
-                logging.info(f"Deleted file {action['file_path']}.")
-                repo.git_add_all()
-                repo.git_commit()
-            else:
-                logging.warning(f"File {action['file_path']} not found for deletion.")
+
+async def process_scripts(
+    scripts: List[str],
+    ctx: RunContext,
+    concurrency: int,
+    edit_concurrency: Optional[int] = None,
+    validate_concurrency: int = 2,
+    queue_size: Optional[int] = None,
+) -> List[FileResult]:
+    """
+    Processes every script through the staged pipeline. `concurrency` bounds
+    the analyze stage and, unless given separately, the edit stage.
+    """
+    pipeline = Pipeline(
+        ctx,
+        analyze_concurrency=concurrency,
+        edit_concurrency=edit_concurrency or concurrency,
+        validate_concurrency=validate_concurrency,
+        queue_size=queue_size or 2 * max(1, concurrency),
+    )
+    return await pipeline.run(scripts)
+
+
+def report_results(results: List[FileResult], wall_time: float):
+    """Logs per-file status and a summary line."""
+    for result in results:
+        line = f"[{result.status}] {result.path} ({result.elapsed:.2f}s, {result.actions} actions)"
+        if result.error:
+            line += f": {result.error}"
+        logging.info(line)
+    failed = sum(1 for result in results if result.status == "failed")
+    rejected = sum(1 for result in results if result.status == "rejected")
+    logging.info(
+        f"Processed {len(results)} files ({failed} failed, {rejected} rejected by verification) "
+        f"in {wall_time:.2f}s wall time."
+    )
 
 
 def main():
@@ -40,46 +139,327 @@ def main():
     parser.add_argument(
         "input_script",
         type=str,
-        help="Path to the input script",
+        nargs="+",
+        help="Path to the input script, or directories/glob patterns of scripts",
     )
     parser.add_argument(
         "--api",
         type=str,
         default="google",
-        choices=["deepseek", "openai", "google", "alibaba-qwen", "mock"],
+        choices=available_apis(),
         help="API to use (openai, google)",
     )
     parser.add_argument("--api_key", type=str, help="API key for the selected API")
+    parser.add_argument(
+        "--repo",
+        type=str,
+        help="Repository root (defaults to the common directory of the inputs)",
+    )
+    parser.add_argument(
+        "--git-files",
+        action="store_true",
+        help="Select scripts with `git ls-files`, using the inputs as pathspecs",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Files analyzed concurrently (and edited, unless --edit-concurrency is set)",
+    )
+    parser.add_argument(
+        "--edit-concurrency",
+        type=int,
+        help="Files edited concurrently (defaults to --concurrency)",
+    )
+    parser.add_argument(
+        "--validate-concurrency",
+        type=int,
+        default=2,
+        help="Files validated concurrently before being applied",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        help="Files buffered between pipeline stages (defaults to 2x --concurrency)",
+    )
+    parser.add_argument(
+        "--chunked",
+        action="store_true",
+        help="Analyze each function in its own request, in parallel",
+    )
+    parser.add_argument(
+        "--chunk-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of per-function analysis requests in flight",
+    )
+    parser.add_argument(
+        "--triage",
+        action="store_true",
+        help="Only analyze functions with static smells or above the size/complexity thresholds",
+    )
+    parser.add_argument(
+        "--triage-lines",
+        type=int,
+        default=TriageThresholds.lines,
+        help="Functions with at least this many lines are always analyzed",
+    )
+    parser.add_argument(
+        "--triage-complexity",
+        type=int,
+        default=TriageThresholds.complexity,
+        help="Functions with at least this cyclomatic complexity are always analyzed",
+    )
+    parser.add_argument(
+        "--triage-workers",
+        type=int,
+        help="Processes computing the static metrics (defaults to the CPU count)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream editor responses and apply each action as soon as it arrives "
+        "(with --verify or --worktrees, actions are only written once verified)",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Editor generations run concurrently per file; the first valid one is used (not with --stream)",
+    )
+    parser.add_argument(
+        "--candidate-temperatures",
+        type=float,
+        nargs="+",
+        help="Temperature of each editor candidate (defaults to a spread from 0.2 to 1.0)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only analyze functions that changed since the last processed commit",
+    )
+    parser.add_argument(
+        "--worktrees",
+        type=int,
+        default=0,
+        help="Apply and verify this many files in parallel, each in its own git worktree",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Run the tests affected by each edit before committing it; reject edits that fail",
+    )
+    parser.add_argument(
+        "--verify-command",
+        type=str,
+        help="Command running one test file, with {test} as placeholder (default: pytest, else unittest)",
+    )
+    parser.add_argument(
+        "--verify-workers",
+        type=int,
+        help="Test files run in parallel during verification (defaults to the CPU count)",
+    )
+    parser.add_argument(
+        "--test-timeout",
+        type=float,
+        default=300.0,
+        help="Seconds before a test file run is killed and counted as failed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Checkpoint every file's stages in the job store and resume an interrupted run",
+    )
+    parser.add_argument(
+        "--job-store",
+        type=str,
+        default=DEFAULT_JOB_STORE_PATH,
+        help="SQLite file holding the checkpoints of resumable runs",
+    )
+    parser.add_argument(
+        "--run-id",
+        type=str,
+        help="Name of the resumable run; processes sharing it split its files "
+        "(defaults to a hash of the repository and inputs)",
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file used to cache LLM responses",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the response cache entirely",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Ignore cached responses and overwrite them with fresh ones",
+    )
+    parser.add_argument(
+        "--cache-sampled",
+        action="store_true",
+        help="Also cache responses sampled at a temperature above 0 "
+        "(by default only reproducible responses are cached)",
+    )
+    parser.add_argument(
+        "--trace-dir",
+        type=str,
+        default=prompt_trace.DEFAULT_TRACE_DIR,
+        help="Directory for the prompt/response trace files",
+    )
+    parser.add_argument(
+        "--trace-sample",
+        type=float,
+        default=1.0,
+        help="Fraction of LLM requests to trace (0.0-1.0)",
+    )
+    parser.add_argument(
+        "--no-trace",
+        action="store_true",
+        help="Do not record prompts and responses",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        help="Write run metrics to this file (Prometheus text if it ends in .prom, else JSON)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Profile the run with cProfile and write the stats to this file",
+    )
     args = parser.parse_args()
+    if args.stream and args.candidates > 1:
+        parser.error("--candidates cannot be combined with --stream")
 
     logging.basicConfig(level=logging.INFO)
     logging.info("Starting Function Analyzer...")
 
-    script_path = args.input_script
-    directory = os.path.dirname(script_path)
-    directory = os.path.abspath(os.path.dirname(script_path))
-    if not os.path.exists(script_path):
-        raise ValueError
+    directory = resolve_directory(args.input_script, args.repo, args.git_files)
 
     try:
         api = create_api_instance(args.api, args.api_key)
     except ValueError as e:
         logging.error(f"Failed to create API instance: {e}")
         return
+    # Closes every resource opened below, in reverse order, however the run ends.
+    with contextlib.ExitStack() as cleanup:
+        cache = None
+        if not args.no_cache:
+            cache = ResponseCache(args.cache_path)
+            cleanup.callback(cache.close)
+            api = CachedAPI(
+                api, cache, refresh=args.refresh_cache, cache_sampled=args.cache_sampled
+            )
+
+        prompt_trace.configure(
+            enabled=not args.no_trace,
+            directory=args.trace_dir,
+            sample_rate=args.trace_sample,
+        )
+        cleanup.callback(prompt_trace.shutdown)
+
+        # Initialize agents and tools
+        analyzer = FunctionAnalyzer(
+            api, chunked=args.chunked, max_concurrency=args.chunk_concurrency
+        )
+        editor = FunctionEditorAgent(
+            api, candidates=args.candidates, temperatures=args.candidate_temperatures
+        )
+        repo = GitRepo(directory, commit=True)
+        cleanup.callback(repo.close)
 
-    # Initialize agents and tools
-    analyzer = FunctionAnalyzer(api)
-    editor = FunctionEditorAgent(api)
-    repo = GitRepo(directory, commit=True)
+        index = FunctionIndex(repo) if args.incremental else None
+        verifier = None
+        if args.verify:
+            verifier = Verifier(
+                repo.repo_path,
+                test_command=args.verify_command,
+                max_workers=args.verify_workers,
+                timeout=args.test_timeout,
+            )
+        worktrees = None
+        if args.worktrees > 0:
+            worktrees = WorktreeManager(repo, args.worktrees)
+            cleanup.callback(worktrees.close)
+        triage = None
+        if args.triage:
+            triage = Triage(
+                TriageThresholds(lines=args.triage_lines, complexity=args.triage_complexity),
+                max_workers=args.triage_workers,
+            )
+            cleanup.callback(triage.close)
+        ctx = RunContext(
+            analyzer,
+            editor,
+            repo,
+            index,
+            stream=args.stream,
+            verifier=verifier,
+            worktrees=worktrees,
+            triage=triage,
+        )
 
-    # Generate the function analysis
-    analysis = analyzer.run_agent(script_path)
-    # Edit the function
-    actions = editor.run_agent(script_path, analysis)
-    # Parse actions and apply them to the script
-    if actions:
-        parse_actions(actions, repo)
+        scripts = select_scripts(args.input_script, repo, args.git_files)
+        if not scripts:
+            logging.warning("No Python files matched the given inputs.")
+            return
+        store = None
+        if args.resume:
+            store = JobStore(args.job_store)
+            cleanup.callback(store.close)
+            ctx.store, ctx.run_id = store, args.run_id or default_run_id(directory, scripts)
+            store.enqueue(ctx.run_id, scripts)
+            store.release_stale(ctx.run_id)
+            logging.info(f"Resumable run {ctx.run_id}: {store.progress(ctx.run_id)}")
+        logging.info(f"Processing {len(scripts)} files with concurrency {args.concurrency}.")
+        start = time.perf_counter()
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            results = run_sync(
+                api,
+                process_scripts(
+                    scripts,
+                    ctx,
+                    args.concurrency,
+                    edit_concurrency=args.edit_concurrency,
+                    validate_concurrency=args.validate_concurrency,
+                    queue_size=args.queue_size,
+                ),
+            )
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+                logging.info(f"Profile written to {args.profile}; top functions by cumulative time:")
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        report_results(results, time.perf_counter() - start)
+        if index is not None:
+            index.mark_processed()
+        if store is not None:
+            logging.info(f"Resumable run {ctx.run_id}: {store.progress(ctx.run_id)}")
+        if cache is not None:
+            logging.info(f"Response cache: {cache.stats()}")
 
+    if api.usage_totals["requests"]:
+        logging.info(f"Token usage: {api.usage_totals}")
+    if hasattr(api, "routing_stats"):
+        logging.info(f"Routing: {api.routing_stats()}")
+    for provider, scheduler_metrics in all_metrics().items():
+        logging.info(f"Scheduler ({provider}): {scheduler_metrics}")
+    if args.metrics_out:
+        metrics.get_registry().write(
+            args.metrics_out,
+            run=prompt_trace.RUN_ID,
+            usage=api.usage_totals,
+            schedulers=all_metrics(),
+        )
+        logging.info(f"Metrics written to {args.metrics_out}")
     logging.info("\nFunction analysis process finished.")
 
 
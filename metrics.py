@@ -0,0 +1,264 @@
+# metrics.py
+import bisect
+import contextlib
+import contextvars
+import json
+import math
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+
+# Seconds; covers a prompt render (sub-millisecond) up to a slow provider call.
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+# The file being processed by the current task; measurements are also
+# attributed to it. asyncio tasks and asyncio.to_thread inherit it.
+current_file: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_file", default=None
+)
+
+# A registry that also receives the measurements of the current task, such
+# as one job of the server; set with `scope`.
+current_registry: contextvars.ContextVar[Optional["MetricsRegistry"]] = contextvars.ContextVar(
+    "current_registry", default=None
+)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum, min and max of observed values."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimates a quantile by interpolating inside its bucket, like Prometheus does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_text(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms for a run, also broken down per file.
+
+    Names follow Prometheus conventions: histograms of durations end in
+    `_seconds`, counters end in `_total`. With `per_file` False no per-file
+    breakdown is kept, so a long-running process does not grow with every
+    file it processes.
+    """
+
+    def __init__(self, prefix: str = "pyimprove", per_file: bool = True):
+        self.prefix = prefix
+        self.per_file = per_file
+        self.started = time.time()
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.files: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _per_file(self, name: str, labels: Labels, value: float):
+        path = current_file.get()
+        if path is not None and self.per_file:
+            key = name + _label_text(labels).replace('"', "")
+            totals = self.files.setdefault(path, {})
+            totals[key] = totals.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Adds a value to a histogram."""
+        with self._lock:
+            key = (name, _labels(labels))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+            self._per_file(name, key[1], value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increments a counter."""
+        if not value:
+            return
+        with self._lock:
+            key = (name, _labels(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._per_file(name, key[1], value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observes the duration of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def record_usage(self, usage: Optional[dict], **labels):
+        """Counts the prompt, completion and cached tokens of a request."""
+        if not usage:
+            return
+        for kind in ("prompt", "completion", "cached"):
+            self.inc("tokens_total", usage.get(f"{kind}_tokens", 0), kind=kind, **labels)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed": round(time.time() - self.started, 3),
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.as_dict()}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "files": {path: dict(totals) for path, totals in sorted(self.files.items())},
+            }
+
+    def to_json(self, **extra) -> str:
+        return json.dumps({**extra, **self.as_dict()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for (other, labels), value in sorted(self.counters.items()):
+                    if other == name:
+                        lines.append(f"{metric}{_label_text(labels)} {value:g}")
+            for name in sorted({name for name, _ in self.histograms}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (other, labels), histogram in sorted(self.histograms.items()):
+                    if other != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else f"{bound:g}"
+                        le_label = f'le="{le}"'
+                        lines.append(f"{metric}_bucket{_label_text(labels, le_label)} {cumulative}")
+                    lines.append(f"{metric}_sum{_label_text(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{_label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, **extra):
+        """Writes Prometheus text if `path` ends in .prom, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json(**extra)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Returns the process-wide registry."""
+    return _registry
+
+
+def reset(**options) -> MetricsRegistry:
+    """Replaces the process-wide registry with an empty one, built with `options`."""
+    global _registry
+    _registry = MetricsRegistry(**options)
+    return _registry
+
+
+def _registries():
+    scoped = current_registry.get()
+    return (_registry,) if scoped is None else (_registry, scoped)
+
+
+def observe(name: str, value: float, **labels):
+    for registry in _registries():
+        registry.observe(name, value, **labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    for registry in _registries():
+        registry.inc(name, value, **labels)
+
+
+@contextlib.contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Observes the duration of the block, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def record_usage(usage: Optional[dict], **labels):
+    for registry in _registries():
+        registry.record_usage(usage, **labels)
+
+
+@contextlib.contextmanager
+def scope(registry: MetricsRegistry) -> Iterator[MetricsRegistry]:
+    """Also records the measurements made inside the block in `registry`."""
+    token = current_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        current_registry.reset(token)
+
+
+@contextlib.contextmanager
+def file_scope(path: str) -> Iterator[None]:
+    """Attributes measurements made inside the block to `path`."""
+    token = current_file.set(path)
+    try:
+        yield
+    finally:
+        current_file.reset(token)
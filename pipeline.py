@@ -0,0 +1,503 @@
+# pipeline.py
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import metrics
+from actions import ActionError, ActionTransaction, apply_actions, validate_actions
+from agents.function_analyzer.function_analyzer import FunctionAnalyzer
+from agents.function_editor.function_editor import FunctionEditorAgent
+from agents.triage import Triage, add_metrics_to_report
+from gitpython import GitRepo, WorktreeManager
+from incremental import FunctionIndex
+from job_store import JobRecord, JobStore, file_digest
+from verification import Verifier
+
+
+@dataclass
+class FileResult:
+    """Outcome of processing a single file in multi-file mode."""
+
+    path: str
+    status: str
+    elapsed: float
+    actions: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class RunContext:
+    """Shared state for processing a set of scripts."""
+
+    analyzer: FunctionAnalyzer
+    editor: FunctionEditorAgent
+    repo: GitRepo
+    index: Optional[FunctionIndex] = None
+    stream: bool = False
+    verifier: Optional[Verifier] = None
+    # With worktrees, files are applied and verified in parallel, each job in
+    # its own worktree, and the commits are integrated into the main branch.
+    worktrees: Optional[WorktreeManager] = None
+    # With a job store, files are claimed from the store's run `run_id` and
+    # every completed stage is checkpointed there, so a rerun resumes.
+    store: Optional[JobStore] = None
+    run_id: Optional[str] = None
+    # With triage, only functions with static smells or above its thresholds
+    # are sent to the analyzer.
+    triage: Optional[Triage] = None
+
+
+@dataclass
+class Job:
+    """A file moving through the pipeline, with what each stage produced."""
+
+    path: str
+    started: float
+    functions: Optional[List[str]] = None
+    analysis: Optional[str] = None
+    actions: List[Dict[str, Any]] = field(default_factory=list)
+    # Set in streaming mode, where actions are written while the editor runs.
+    transaction: Optional[ActionTransaction] = None
+    # The last completed stage, as recorded in the job store.
+    stage: str = "pending"
+    # The files journaled in the job store before being written.
+    journaled: Dict[str, Optional[bytes]] = field(default_factory=dict)
+
+    @property
+    def message(self) -> str:
+        return f"Apply improvements to {os.path.basename(self.path)}"
+
+
+# Tells a stage worker that no more jobs will arrive.
+_DONE = object()
+
+
+def parse_actions(actions, repo, message="Update"):
+    """
+    Applies the editor's actions and records them as a single commit that
+    contains only the touched paths. If any action fails, the working tree
+    is rolled back and nothing is committed.
+    """
+    commit = apply_actions(actions, repo, message)
+    if commit:
+        logging.info(f"Applied {len(actions)} actions in commit {commit[:12]}.")
+    return commit
+
+
+def _write(transaction: ActionTransaction, actions):
+    """Writes `actions` through `transaction`, rolling back if one fails."""
+    try:
+        for action in actions:
+            transaction.apply(action)
+    except Exception:
+        transaction.rollback()
+        raise
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+async def _in_thread(function, *args):
+    """
+    Runs `function` in a worker thread. A cancellation waits for the thread
+    to finish before it is raised, so no file is written or committed after
+    the job's edits were rolled back.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(function, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+class Pipeline:
+    """
+    Runs analyze -> edit -> validate -> apply as separate stages connected by
+    bounded queues, so the editor works on one file while the analyzer
+    works on the next.
+
+    Every stage has its own number of workers. A full queue blocks the stage
+    before it, which keeps the number of files in memory bounded on large
+    trees. The apply stage has a single worker, so git commits never overlap.
+    With a verifier, apply writes the actions, runs the affected tests and
+    commits only if they pass; tests of one file run in parallel, but files
+    are verified one at a time, and only apply writes to the tree (streamed
+    edits included), so a failure is never blamed on another edit.
+    With a worktree pool, apply runs one worker per worktree instead.
+    """
+
+    def __init__(
+        self,
+        ctx: RunContext,
+        analyze_concurrency: int = 4,
+        edit_concurrency: int = 4,
+        validate_concurrency: int = 2,
+        queue_size: int = 8,
+    ):
+        self.ctx = ctx
+        self.analyze_concurrency = max(1, analyze_concurrency)
+        self.edit_concurrency = max(1, edit_concurrency)
+        self.validate_concurrency = max(1, validate_concurrency)
+        self.queue_size = max(1, queue_size)
+        self.apply_concurrency = ctx.worktrees.size if ctx.worktrees is not None else 1
+        # The final outcome of every file; a failed file retried from the
+        # job store replaces its earlier result.
+        self.results: Dict[str, FileResult] = {}
+
+    async def run(self, scripts: List[str]) -> List[FileResult]:
+        """Processes every script and returns the results in input order."""
+        self.results = {}
+        to_analyze = asyncio.Queue(self.queue_size)
+        to_edit = asyncio.Queue(self.queue_size)
+        to_validate = asyncio.Queue(self.queue_size)
+        to_apply = asyncio.Queue(self.queue_size)
+
+        async def feed():
+            if self.ctx.store is None:
+                for path in scripts:
+                    await to_analyze.put(Job(path, time.perf_counter()))
+            else:
+                await self._feed_from_store(to_analyze)
+            for _ in range(self.analyze_concurrency):
+                await to_analyze.put(_DONE)
+
+        try:
+            await asyncio.gather(
+                feed(),
+                self._stage("analyze", self._analyze, to_analyze, to_edit,
+                            self.analyze_concurrency, self.edit_concurrency),
+                self._stage("edit", self._edit, to_edit, to_validate,
+                            self.edit_concurrency, self.validate_concurrency),
+                self._stage("validate", self._validate, to_validate, to_apply,
+                            self.validate_concurrency, self.apply_concurrency),
+                self._stage("apply", self._apply, to_apply, None, self.apply_concurrency, 0),
+            )
+        except asyncio.CancelledError:
+            # Streamed edits of queued files are in the tree too.
+            for queue in (to_edit, to_validate, to_apply):
+                while not queue.empty():
+                    job = queue.get_nowait()
+                    if job is not _DONE:
+                        self._abort(job)
+            raise
+        order = {path: i for i, path in enumerate(scripts)}
+        return sorted(
+            self.results.values(), key=lambda result: order.get(result.path, len(order))
+        )
+
+    async def _stage(self, name, handler, inbox, outbox, workers, next_workers):
+        """
+        Runs `workers` copies of `handler` over `inbox`. A handler returns True
+        to pass the job on to `outbox`; otherwise it has finished the job.
+        """
+
+        async def work():
+            while True:
+                job = await inbox.get()
+                if job is _DONE:
+                    return
+                with metrics.file_scope(job.path):
+                    try:
+                        with metrics.timer("stage_seconds", stage=name):
+                            forward = await handler(job)
+                    except asyncio.CancelledError:
+                        self._abort(job)
+                        raise
+                    except Exception as e:
+                        self._fail(job, e)
+                        forward = False
+                if forward and outbox is not None:
+                    try:
+                        await outbox.put(job)
+                    except asyncio.CancelledError:
+                        self._abort(job)
+                        raise
+
+        await asyncio.gather(*(work() for _ in range(workers)))
+        if outbox is not None:
+            for _ in range(next_workers):
+                await outbox.put(_DONE)
+
+    async def _feed_from_store(self, to_analyze: asyncio.Queue):
+        """Claims files from the job store until the run has none left."""
+        store = self.ctx.store
+        while True:
+            records = await asyncio.to_thread(store.claim, self.ctx.run_id, self.queue_size)
+            if not records:
+                return
+            for record in records:
+                job = Job(record.path, time.perf_counter(), actions=record.actions)
+                record = await asyncio.to_thread(self._recover, record)
+                if record is None:
+                    with metrics.file_scope(job.path):
+                        self._finish(job, "edited")
+                    continue
+                if record.stage != "pending":
+                    logging.info(f"{record.path}: resuming after the '{record.stage}' checkpoint.")
+                await to_analyze.put(
+                    Job(
+                        record.path,
+                        job.started,
+                        functions=record.functions,
+                        analysis=record.analysis,
+                        actions=record.actions,
+                        stage=record.stage,
+                    )
+                )
+
+    def _recover(self, record: JobRecord) -> Optional[JobRecord]:
+        """
+        Undoes the write a stopped run left in the working tree, using the
+        journal, and drops the checkpoints of a file that has changed since it
+        was analyzed. Returns None if the write was committed and only its
+        completion is missing.
+        """
+        store = self.ctx.store
+        toplevel = self.ctx.repo.git_toplevel()
+        for path, original in record.journal.items():
+            current = _read(path)
+            if current == original:
+                continue
+            if current is not None and current == self.ctx.repo.git_read_file(
+                os.path.relpath(path, toplevel)
+            ):
+                logging.info(f"{record.path}: the edits were committed before the run stopped.")
+                return None
+            logging.info(f"{record.path}: undoing the partial write to {path}.")
+            if original is None:
+                os.remove(path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(original)
+        if record.journal:
+            store.journal(self.ctx.run_id, record.path, {})
+        if record.stage != "pending" and record.digest != file_digest(record.path):
+            return store.reset(self.ctx.run_id, record)
+        return record
+
+    def _checkpoint(self, job: Job, stage: str, **data):
+        job.stage = stage
+        if self.ctx.store is not None:
+            self.ctx.store.checkpoint(self.ctx.run_id, job.path, stage, **data)
+
+    def _journal(self, job: Job, paths: List[str]):
+        """
+        Records the current contents of `paths` in the job store before they
+        are written in the main tree, so a resumed run can undo the write.
+        """
+        if self.ctx.store is None:
+            return
+        paths = [os.path.abspath(path) for path in paths if path]
+        if all(path in job.journaled for path in paths):
+            return
+        for path in paths:
+            job.journaled.setdefault(path, _read(path))
+        self.ctx.store.journal(self.ctx.run_id, job.path, job.journaled)
+
+    async def _analyze(self, job: Job) -> bool:
+        if job.stage != "pending":
+            return True
+        index = self.ctx.index
+        if index is not None:
+            job.functions = index.changed_functions(job.path)
+            if not job.functions:
+                self._finish(job, "unchanged")
+                return False
+            logging.info(f"{job.path}: {len(job.functions)} new or modified functions.")
+        triaged = None
+        if self.ctx.triage is not None:
+            triaged = await self.ctx.triage.run(job.path)
+            if triaged.error is None:
+                selected = triaged.selected
+                if job.functions is not None:
+                    changed = set(job.functions)
+                    selected = [name for name in selected if name in changed]
+                considered = len(triaged.functions) if job.functions is None else len(job.functions)
+                metrics.inc("triage_functions_total", len(selected), decision="forwarded")
+                metrics.inc("triage_functions_total", considered - len(selected), decision="skipped")
+                if not selected:
+                    self._finish(job, "triaged")
+                    return False
+                logging.info(
+                    f"{job.path}: triage forwards {len(selected)} of {considered} functions."
+                )
+                job.functions = selected
+        job.analysis = await self.ctx.analyzer.run_agent_async(job.path, job.functions)
+        if triaged is not None and triaged.error is None:
+            job.analysis = add_metrics_to_report(job.analysis, triaged)
+        self._checkpoint(job, "analyzed", functions=job.functions, analysis=job.analysis)
+        return True
+
+    async def _edit(self, job: Job) -> bool:
+        if job.stage == "analyzed":
+            if self.ctx.stream:
+                await self._stream_edit(job)
+            else:
+                job.actions = await self.ctx.editor.run_agent_async(job.path, job.analysis) or []
+            self._checkpoint(job, "edited", actions=job.actions)
+        job.analysis = None
+        if not job.actions:
+            self._finish(job, "no_actions")
+            return False
+        return True
+
+    async def _stream_edit(self, job: Job):
+        """
+        Streams the editor response, writing and validating each action as
+        soon as it is complete; the apply stage commits them. With worktrees
+        or a verifier the main tree is left alone and the actions are only
+        collected: apply writes them, so tests never see another file's
+        unverified edits.
+        """
+        if self.ctx.worktrees is not None or self.ctx.verifier is not None:
+            async for action in self.ctx.editor.stream_actions(job.path, job.analysis):
+                job.actions.append(action)
+            return
+        transaction = ActionTransaction(self.ctx.repo)
+        try:
+            async for action in self.ctx.editor.stream_actions(job.path, job.analysis):
+                self._journal(job, [action.get("file_path")])
+                transaction.apply(action, validate=True)
+                job.actions.append(action)
+                if len(job.actions) == 1:
+                    logging.info(f"{job.path}: first action applied while streaming.")
+        except BaseException:
+            # Cancellation included: no half-streamed edit stays in the tree.
+            transaction.rollback()
+            raise
+        job.transaction = transaction
+
+    async def _validate(self, job: Job) -> bool:
+        if job.transaction is None:
+            # Compiling and patching are CPU-bound; keep them off the event loop.
+            await asyncio.to_thread(validate_actions, job.actions)
+        return True
+
+    async def _apply(self, job: Job) -> bool:
+        if self.ctx.worktrees is not None:
+            if not await self._apply_in_worktree(job):
+                return False
+            self._finish(job, "edited")
+            return False
+        transaction = job.transaction
+        if transaction is None:
+            await asyncio.to_thread(
+                self._journal, job, [action.get("file_path") for action in job.actions]
+            )
+        if transaction is None and self.ctx.verifier is not None:
+            transaction = job.transaction = ActionTransaction(self.ctx.repo)
+            await _in_thread(_write, transaction, job.actions)
+        if transaction is not None:
+            if self._needs_verification(job) and not await self._verify(job):
+                return False
+            commit = await _in_thread(transaction.commit, job.message)
+            if commit:
+                logging.info(f"Applied {len(job.actions)} actions in commit {commit[:12]}.")
+        else:
+            await _in_thread(parse_actions, job.actions, self.ctx.repo, job.message)
+        self._finish(job, "edited")
+        return False
+
+    async def _apply_in_worktree(self, job: Job) -> bool:
+        """
+        Writes, verifies and commits the actions in a worktree of the pool,
+        then integrates the commit into the main branch. Returns False if the
+        job was rejected.
+        """
+        manager = self.ctx.worktrees
+        worktree = await asyncio.to_thread(manager.acquire)
+        try:
+            actions = [
+                dict(action, file_path=manager.translate(worktree, action["file_path"]))
+                if action.get("file_path") else action
+                for action in job.actions
+            ]
+            job.transaction = ActionTransaction(worktree.repo)
+            await _in_thread(_write, job.transaction, actions)
+            if self._needs_verification(job) and not await self._verify(job, worktree.path):
+                return False
+            commit = await _in_thread(job.transaction.commit, job.message)
+            job.transaction = None
+            if commit is None:
+                return True
+            await asyncio.to_thread(
+                self._journal, job, [action.get("file_path") for action in job.actions]
+            )
+            head = await asyncio.to_thread(manager.integrate, worktree)
+            if head is None:
+                raise ActionError(f"{worktree.branch} conflicts with the main branch.")
+            logging.info(f"Applied {len(job.actions)} actions in commit {head[:12]}.")
+            return True
+        finally:
+            if job.transaction is not None:
+                job.transaction.rollback()
+                job.transaction = None
+            await asyncio.to_thread(manager.release, worktree)
+
+    def _update_index(self, job: Job):
+        """
+        Records the fingerprints of a cleanly finished file, and of the files
+        its actions touched, so the next incremental run skips them whether or
+        not they were edited.
+        """
+        index = self.ctx.index
+        if index is not None:
+            index.update(job.path)
+            for action in job.actions:
+                if action.get("file_path", "").endswith(".py"):
+                    index.update(action["file_path"])
+
+    def _needs_verification(self, job: Job) -> bool:
+        return self.ctx.verifier is not None and job.stage != "verified"
+
+    async def _verify(self, job: Job, root: Optional[str] = None) -> bool:
+        """Verifies the written actions; rolls them back and rejects the job on failure."""
+        result = await self.ctx.verifier.verify(job.transaction.originals(), root)
+        if result.ok:
+            if result.tests:
+                logging.info(f"{job.path}: {result.summary()}.")
+            self._checkpoint(job, "verified")
+            return True
+        for test, output in result.failures.items():
+            logging.warning(f"{job.path}: {test} failed after the edit:\n{output}")
+        job.transaction.rollback()
+        if self.ctx.index is not None:
+            self.ctx.index.invalidate(job.path)
+        logging.error(f"Rejected the edits to {job.path}: {result.summary()}")
+        self._finish(job, "rejected", result.summary())
+        return False
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        if status not in ("failed", "rejected"):
+            self._update_index(job)
+        elapsed = time.perf_counter() - job.started
+        applied = 0 if status in ("failed", "rejected") else len(job.actions)
+        self.results[job.path] = FileResult(job.path, status, elapsed, applied, error)
+        if self.ctx.store is not None:
+            self.ctx.store.complete(self.ctx.run_id, job.path, status, error)
+        metrics.observe("file_seconds", elapsed, status=status)
+
+    def _abort(self, job: Job):
+        """Rolls back the uncommitted edits of a cancelled job."""
+        logging.warning(f"Cancelled while processing {job.path}.")
+        if job.transaction is not None:
+            job.transaction.rollback()
+            job.transaction = None
+        if self.ctx.index is not None:
+            self.ctx.index.invalidate(job.path)
+
+    def _fail(self, job: Job, error: Exception):
+        logging.error(f"Failed to process {job.path}: {error}")
+        if job.transaction is not None:
+            job.transaction.rollback()
+        if self.ctx.index is not None:
+            self.ctx.index.invalidate(job.path)
+        self._finish(job, "failed", str(error))
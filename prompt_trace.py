@@ -0,0 +1,261 @@
+# prompt_trace.py
+import argparse
+import contextlib
+import contextvars
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import uuid
+from typing import Iterator, Optional
+
+
+DEFAULT_TRACE_DIR = os.path.join(".pyimprove", "traces")
+# Each process appends to its own active file, so processes sharing a trace
+# directory never rotate a file another one is writing. ACTIVE_FILE is the
+# name used before that, still read.
+ACTIVE_PATTERN = "traces.{pid}.jsonl"
+ACTIVE_FILE = "traces.jsonl"
+
+# Identifies every record written by this process.
+RUN_ID = uuid.uuid4().hex[:12]
+
+# The run of the current task when one process runs several, such as the
+# jobs of the server; records are tagged with it instead of RUN_ID.
+current_run: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_run", default=None
+)
+
+_STOP = object()
+
+
+class TraceWriter:
+    """
+    Records prompts, responses and timings as JSON lines from a background thread.
+
+    `record` only enqueues, so callers never block on disk I/O. The active
+    file of this process is rotated once it exceeds `max_bytes`; rotated
+    files are gzipped and only the newest `backup_count` are kept. With
+    `sample_rate` below 1.0, only that fraction of requests is recorded.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_TRACE_DIR,
+        max_bytes: int = 20 * 1024 * 1024,
+        backup_count: int = 10,
+        compress: bool = True,
+        sample_rate: float = 1.0,
+        queue_size: int = 10000,
+        run_id: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.sample_rate = sample_rate
+        self.run_id = run_id or RUN_ID
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._size = 0
+        self._rotations = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def sampled(self) -> bool:
+        """Decides whether the next request should be recorded."""
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(self, **fields):
+        """Enqueues a record; drops it if the writer has fallen behind."""
+        fields.setdefault("ts", time.time())
+        fields.setdefault("run", current_run.get() or self.run_id)
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Flushes pending records and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Drain whatever else is queued so it is written in one go.
+            while item is not _STOP:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            try:
+                self._write([r for r in batch if r is not _STOP])
+            except OSError as e:
+                logging.warning(f"Could not write prompt traces: {e}")
+            if batch[-1] is _STOP:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, records):
+        if not records:
+            return
+        if self._file is None:
+            path = os.path.join(self.directory, ACTIVE_PATTERN.format(pid=os.getpid()))
+            self._file = open(path, "a", encoding="utf-8")
+            self._size = self._file.tell()
+        data = "".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+            for r in records
+        )
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data.encode("utf-8"))
+        if self._size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        self._rotations += 1
+        active = os.path.join(self.directory, ACTIVE_PATTERN.format(pid=os.getpid()))
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = os.path.join(
+            self.directory, f"traces-{stamp}-{os.getpid()}-{self._rotations}.jsonl"
+        )
+        os.replace(active, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        backups = sorted(_rotated_files(self.directory), key=_mtime)
+        for old in backups[: max(0, len(backups) - self.backup_count)]:
+            # Another process may be pruning the same backups.
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(old)
+
+
+def _rotated_files(directory: str):
+    """Rotated trace files, compressed or not, of every process."""
+    return glob.glob(os.path.join(directory, "traces-*.jsonl*"))
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+
+class TraceReader:
+    """Reads trace records back, including rotated and compressed files."""
+
+    def __init__(self, directory: str = DEFAULT_TRACE_DIR):
+        self.directory = directory
+
+    def files(self):
+        """Trace files from oldest to newest; the active files of every process come last."""
+        rotated = sorted(_rotated_files(self.directory), key=_mtime)
+        active = sorted(
+            glob.glob(os.path.join(self.directory, ACTIVE_PATTERN.format(pid="*")))
+            + glob.glob(os.path.join(self.directory, ACTIVE_FILE)),
+            key=_mtime,
+        )
+        return rotated + active
+
+    def records(
+        self,
+        run: Optional[str] = None,
+        file: Optional[str] = None,
+        agent: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """Yields records matching the given run id, file (substring) and agent."""
+        for path in self.files():
+            opener = gzip.open if path.endswith(".gz") else open
+            try:
+                f = opener(path, "rt", encoding="utf-8")
+            except FileNotFoundError:
+                continue  # rotated or pruned by a writer meanwhile
+            with f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # partially written line
+                    if run and record.get("run") != run:
+                        continue
+                    if file and file not in (record.get("file") or ""):
+                        continue
+                    if agent and record.get("agent") != agent:
+                        continue
+                    yield record
+
+
+_default_writer = None
+_default_config = {}
+
+
+def configure(**kwargs):
+    """Sets the options of the process-wide writer; call before first use."""
+    global _default_writer
+    if _default_writer is not None:
+        _default_writer.close()
+        _default_writer = None
+    _default_config.clear()
+    _default_config.update(kwargs)
+
+
+def get_tracer() -> Optional[TraceWriter]:
+    """Returns the process-wide writer, or None if tracing is disabled."""
+    global _default_writer
+    if _default_config.get("enabled", True) is False:
+        return None
+    if _default_writer is None:
+        options = {k: v for k, v in _default_config.items() if k != "enabled"}
+        _default_writer = TraceWriter(**options)
+    return _default_writer
+
+
+def shutdown():
+    """Flushes and stops the process-wide writer."""
+    global _default_writer
+    if _default_writer is not None:
+        _default_writer.close()
+        _default_writer = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query prompt/response traces")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_TRACE_DIR)
+    parser.add_argument("--run", type=str, help="Only records of this run id")
+    parser.add_argument("--file", type=str, help="Only records whose file contains this")
+    parser.add_argument("--agent", type=str, help="Only records of this agent")
+    parser.add_argument(
+        "--full", action="store_true", help="Print complete records, including prompts"
+    )
+    args = parser.parse_args()
+
+    for record in TraceReader(args.directory).records(args.run, args.file, args.agent):
+        if args.full:
+            print(json.dumps(record, ensure_ascii=False))
+        else:
+            print(
+                f"{record.get('run')} {record.get('agent')} {record.get('file')} "
+                f"{record.get('elapsed', 0):.2f}s "
+                f"prompt={len(record.get('prompt') or '')} "
+                f"response={len(record.get('response') or '')}"
+                + (f" error={record['error']}" if record.get("error") else "")
+            )
@@ -0,0 +1,634 @@
+# server.py
+"""
+Long-running PyImprove service.
+
+Keeps provider clients (and their connection pools), repositories, the
+response cache and worktree pools warm between runs, and accepts jobs over
+a local HTTP API, on a TCP port or a Unix socket. Every request must carry
+the server's token as "Authorization: Bearer <token>", and job bodies must
+be sent as application/json:
+
+    POST /jobs               submit a job (JSON body, see JobRequest)
+    GET  /jobs               list jobs
+    GET  /jobs/<id>          job status and per-file results
+    GET  /jobs/<id>/wait     wait for a job to finish (?timeout=seconds, at most 300)
+    POST /jobs/<id>/cancel   cancel a queued or running job
+    GET  /health             uptime, job counts and warm resources
+    GET  /metrics            run metrics in the Prometheus text format
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8765] [--socket PATH] [--max-jobs 2]
+                     [--token-file PATH] [--allow-root DIR] [--allow-verify-command CMD]
+
+The token is taken from PYIMPROVE_SERVER_TOKEN, or generated at startup; it
+is written to --token-file (readable only by its owner), where client.py
+reads it. SIGTERM stops accepting requests and lets running jobs finish.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import dataclasses
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import signal
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+import metrics
+import prompt_trace
+from agents.function_analyzer.function_analyzer import FunctionAnalyzer
+from agents.function_editor.function_editor import FunctionEditorAgent
+from agents.triage import Triage
+from api import create_api_instance
+from api.api import API
+from api.cache import DEFAULT_CACHE_PATH, CachedAPI, ResponseCache
+from gitpython import GitRepo, WorktreeManager
+from incremental import FunctionIndex
+from main import process_scripts, resolve_directory, select_scripts
+from pipeline import RunContext
+from verification import Verifier
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_TOKEN_FILE = os.path.join(".pyimprove", "server.token")
+TOKEN_ENV = "PYIMPROVE_SERVER_TOKEN"
+
+# Finished jobs kept for status queries; older ones are forgotten first.
+MAX_FINISHED_JOBS = 500
+
+FINISHED = ("done", "failed", "cancelled")
+
+# Longest a /jobs/<id>/wait request may hold its handler thread, in seconds.
+MAX_WAIT_TIMEOUT = 300.0
+
+
+@dataclass
+class JobRequest:
+    """
+    A run of the pipeline, with the options of the matching main.py flags.
+    `verify_command` must be one the server allows (--allow-verify-command),
+    since the server runs it.
+    """
+
+    inputs: List[str]
+    api: str = "mock"
+    api_key: Optional[str] = None
+    repo: Optional[str] = None
+    git_files: bool = False
+    concurrency: int = 4
+    edit_concurrency: Optional[int] = None
+    validate_concurrency: int = 2
+    queue_size: Optional[int] = None
+    chunked: bool = False
+    chunk_concurrency: int = 8
+    stream: bool = False
+    incremental: bool = False
+    triage: bool = False
+    candidates: int = 1
+    candidate_temperatures: Optional[List[float]] = None
+    worktrees: int = 0
+    verify: bool = False
+    verify_command: Optional[str] = None
+    verify_workers: Optional[int] = None
+    test_timeout: float = 300.0
+    refresh_cache: bool = False
+    cache_sampled: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "JobRequest":
+        """
+        Raises:
+            ValueError: If `data` has unknown options, no inputs, or combines
+                stream with several candidates.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("The job must be a JSON object.")
+        known = {f.name for f in dataclasses.fields(cls)}
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise ValueError(f"Unknown job options: {', '.join(unknown)}")
+        inputs = data.get("inputs")
+        if not inputs or not isinstance(inputs, list):
+            raise ValueError("The job needs a non-empty list of inputs.")
+        if data.get("stream") and (data.get("candidates") or 1) > 1:
+            raise ValueError("candidates cannot be combined with stream.")
+        return cls(**data)
+
+
+@dataclass
+class Job:
+    """A submitted job and its outcome."""
+
+    id: str
+    request: JobRequest
+    status: str = "queued"
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    results: list = field(default_factory=list)
+    error: Optional[str] = None
+    # Measurements of this job only, with their per-file breakdown.
+    registry: metrics.MetricsRegistry = field(default_factory=metrics.MetricsRegistry, repr=False)
+    future: Optional[concurrent.futures.Future] = field(default=None, repr=False)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def as_dict(self, results=True) -> dict:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "inputs": self.request.inputs,
+            "api": self.request.api,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+        if results:
+            data["results"] = [dataclasses.asdict(result) for result in self.results]
+            data["metrics"] = self.registry.as_dict()
+        return data
+
+
+class PyImproveService:
+    """
+    Runs jobs on a background event loop and keeps what they share warm:
+    provider instances, GitRepo objects (with their git cat-file processes),
+    per-repository function indexes and worktree pools, the triage process
+    pool and the response cache. Jobs on the same repository run one at a
+    time; at most `max_jobs` run at once.
+
+    Jobs may only name files under `roots` (anywhere if empty), and only the
+    test commands in `verify_commands`.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int = 2,
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        roots: Sequence[str] = (),
+        verify_commands: Sequence[str] = (),
+    ):
+        self.max_jobs = max(1, max_jobs)
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.verify_commands = set(verify_commands)
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.started = time.time()
+        self.jobs: Dict[str, Job] = {}
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="pyimprove-jobs", daemon=True)
+        self._lock = threading.Lock()
+        self._apis: Dict[Tuple[str, Optional[str]], API] = {}
+        self._repos: Dict[str, GitRepo] = {}
+        self._repo_locks: Dict[str, asyncio.Lock] = {}
+        self._indexes: Dict[str, FunctionIndex] = {}
+        self._worktrees: Dict[str, WorktreeManager] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._triage = Triage()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._slots = asyncio.Semaphore(self.max_jobs)
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, drain_timeout: float = 0.0):
+        """
+        Waits up to `drain_timeout` seconds for unfinished jobs, cancels the
+        rest (rolling back their uncommitted edits) and releases every warm
+        resource.
+        """
+        deadline = time.monotonic() + drain_timeout
+        unfinished = [job for job in list(self.jobs.values()) if job.status not in FINISHED]
+        if unfinished and drain_timeout > 0:
+            logging.info(f"Waiting up to {drain_timeout:.0f}s for {len(unfinished)} jobs.")
+        for job in unfinished:
+            job.done.wait(max(0.0, deadline - time.monotonic()))
+        for job in unfinished:
+            if job.status not in FINISHED:
+                self.cancel(job.id)
+                job.done.wait(30)
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout=30)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+        if self.cache is not None:
+            self.cache.close()
+
+    async def _close(self):
+        for api in self._apis.values():
+            if hasattr(api, "aclose"):
+                await api.aclose()
+        for manager in self._worktrees.values():
+            await asyncio.to_thread(manager.close)
+        for repo in self._repos.values():
+            repo.close()
+        await asyncio.to_thread(self._triage.close)
+
+    def submit(self, data: dict) -> Job:
+        """
+        Queues a job and returns it.
+
+        Raises:
+            ValueError: If the request is invalid.
+        """
+        request = JobRequest.from_dict(data)
+        self._check(request)
+        job = Job(uuid.uuid4().hex[:12], request)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+        job.future.add_done_callback(lambda future: self._settle(job, future))
+        logging.info(f"Job {job.id} queued: {len(request.inputs)} inputs, api {request.api}.")
+        return job
+
+    def _check(self, request: JobRequest):
+        """
+        Raises:
+            ValueError: If the request names a path or test command the server does not allow.
+        """
+        if request.verify_command and request.verify_command not in self.verify_commands:
+            raise ValueError(
+                "verify_command is not allowed; start the server with --allow-verify-command."
+            )
+        if self.roots:
+            for path in request.inputs + ([request.repo] if request.repo else []):
+                if not isinstance(path, str) or not os.path.isabs(path):
+                    raise ValueError(f"Paths must be absolute: {path!r}")
+                # A glob pattern is checked by its literal leading part.
+                real = os.path.realpath(re.split(r"[*?[]", path)[0] or os.sep)
+                if not any(real == root or real.startswith(root + os.sep) for root in self.roots):
+                    raise ValueError(f"{path} is outside the directories the server allows.")
+
+    @staticmethod
+    def _settle(job: Job, future: concurrent.futures.Future):
+        """
+        Marks a job cancelled before it started running. A running job is
+        finished by `_run` once it has unwound and rolled back its edits; the
+        future reports the cancellation as soon as it is requested.
+        """
+        if future.cancelled() and job.status == "queued":
+            job.status, job.finished = "cancelled", time.time()
+            job.done.set()
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        for job in sorted(finished, key=lambda job: job.finished)[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancels a job; a running job stops at its next await."""
+        job = self.jobs.get(job_id)
+        if job is not None and job.status not in FINISHED and job.future is not None:
+            job.future.cancel()
+        return job
+
+    def health(self) -> dict:
+        counts: Dict[str, int] = {}
+        for job in list(self.jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "uptime": round(time.time() - self.started, 3),
+            "jobs": counts,
+            "max_jobs": self.max_jobs,
+            "apis": sorted({name for name, _ in self._apis}),
+            "repos": sorted(self._repos),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    async def _run(self, job: Job):
+        # This task runs in its own context: its traces and metrics are the job's.
+        prompt_trace.current_run.set(job.id)
+        metrics.current_registry.set(job.registry)
+        try:
+            async with self._slots:
+                request = job.request
+                directory = resolve_directory(request.inputs, request.repo, request.git_files)
+                async with self._repo_locks.setdefault(directory, asyncio.Lock()):
+                    job.status, job.started = "running", time.time()
+                    logging.info(f"Job {job.id} started on {directory}.")
+                    job.results = await self._process(job, directory)
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            logging.info(f"Job {job.id} cancelled.")
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+            logging.error(f"Job {job.id} failed: {e}")
+        finally:
+            job.finished = time.time()
+            job.done.set()
+
+    async def _process(self, job: Job, directory: str) -> list:
+        request = job.request
+        api = self._api(request.api, request.api_key)
+        if self.cache is not None:
+            api = CachedAPI(
+                api, self.cache, refresh=request.refresh_cache, cache_sampled=request.cache_sampled
+            )
+        repo = self._repos.get(directory)
+        if repo is None:
+            repo = self._repos[directory] = await asyncio.to_thread(GitRepo, directory, True)
+        index = None
+        if request.incremental:
+            index = self._indexes.get(directory)
+            if index is None:
+                index = self._indexes[directory] = FunctionIndex(repo)
+        verifier = None
+        if request.verify:
+            # Built per job, since the tests may have changed since the last one.
+            verifier = await asyncio.to_thread(
+                Verifier,
+                repo.repo_path,
+                test_command=request.verify_command,
+                max_workers=request.verify_workers,
+                timeout=request.test_timeout,
+            )
+        ctx = RunContext(
+            FunctionAnalyzer(api, chunked=request.chunked, max_concurrency=request.chunk_concurrency),
+            FunctionEditorAgent(
+                api, candidates=request.candidates, temperatures=request.candidate_temperatures
+            ),
+            repo,
+            index,
+            stream=request.stream,
+            verifier=verifier,
+            worktrees=self._worktree_pool(directory, repo, request.worktrees),
+            triage=self._triage if request.triage else None,
+        )
+        scripts = await asyncio.to_thread(select_scripts, request.inputs, repo, request.git_files)
+        results = await process_scripts(
+            scripts,
+            ctx,
+            request.concurrency,
+            edit_concurrency=request.edit_concurrency,
+            validate_concurrency=request.validate_concurrency,
+            queue_size=request.queue_size,
+        )
+        if index is not None:
+            await asyncio.to_thread(index.mark_processed)
+        return results
+
+    def _api(self, api_type: str, api_key: Optional[str]) -> API:
+        """Returns the warm provider instance, creating it on first use."""
+        key = (api_type, api_key)
+        api = self._apis.get(key)
+        if api is None:
+            api = self._apis[key] = create_api_instance(api_type, api_key)
+        return api
+
+    def _worktree_pool(self, directory: str, repo: GitRepo, size: int) -> Optional[WorktreeManager]:
+        """Returns the repository's worktree pool, kept between jobs of the same size."""
+        if size <= 0:
+            return None
+        manager = self._worktrees.get(directory)
+        if manager is not None and manager.size != size:
+            manager.close()
+            manager = None
+        if manager is None:
+            manager = self._worktrees[directory] = WorktreeManager(repo, size)
+        return manager
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PyImprove"
+
+    @property
+    def service(self) -> PyImproveService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logging.debug("%s %s", self.command, format % args)
+
+    def _send(self, status: int, body, content_type="application/json"):
+        data = (json.dumps(body, indent=2) if content_type == "application/json" else body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str):
+        self._send(status, {"error": message})
+
+    def _authorized(self) -> bool:
+        """Checks the request's token; answers 401 if it is missing or wrong."""
+        header = self.headers.get("Authorization") or ""
+        scheme, _, token = header.partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(
+            token.strip().encode("utf-8"), self.server.token.encode("utf-8")
+        ):
+            return True
+        # The body, if any, is left unread; the connection cannot be reused.
+        self.close_connection = True
+        self._error(401, "Missing or invalid token.")
+        return False
+
+    def _job(self, job_id: str) -> Optional[Job]:
+        job = self.service.get(job_id)
+        if job is None:
+            self._error(404, f"No job {job_id}.")
+        return job
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["health"]:
+            self._send(200, self.service.health())
+        elif parts == ["metrics"]:
+            self._send(200, metrics.get_registry().to_prometheus(), "text/plain; version=0.0.4")
+        elif parts == ["jobs"]:
+            jobs = sorted(list(self.service.jobs.values()), key=lambda job: job.created)
+            self._send(200, [job.as_dict(results=False) for job in jobs])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job is not None:
+                self._send(200, job.as_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "wait":
+            job = self._job(parts[1])
+            if job is None:
+                return
+            try:
+                timeout = float(parse_qs(url.query).get("timeout", ["30"])[0])
+                if not 0 <= timeout:  # also refuses nan
+                    raise ValueError(timeout)
+            except ValueError:
+                self._error(400, "timeout must be a non-negative number of seconds.")
+                return
+            job.done.wait(min(timeout, MAX_WAIT_TIMEOUT))
+            self._send(200, job.as_dict())
+        else:
+            self._error(404, f"Unknown path {url.path}.")
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.close_connection = True
+            self._error(400, "Invalid Content-Length.")
+            return
+        raw = self.rfile.read(length) if length > 0 else b""
+        if parts == ["jobs"]:
+            # Browsers send cross-origin "simple" requests as text/plain or
+            # form data only; a JSON content type needs a preflight.
+            content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                self._error(415, "Jobs must be sent as application/json.")
+                return
+            try:
+                job = self.service.submit(json.loads(raw or b"{}"))
+            except (ValueError, TypeError) as e:
+                self._error(400, str(e))
+                return
+            self._send(202, job.as_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            job = self._job(parts[1])
+            if job is not None:
+                self.service.cancel(job.id)
+                self._send(202, job.as_dict(results=False))
+        else:
+            self._error(404, f"Unknown path {self.path}.")
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: PyImproveService, token: str):
+        self.service = service
+        self.token = token
+        super().__init__(address, _Handler)
+
+
+class UnixServiceHTTPServer(ServiceHTTPServer):
+    """The HTTP API on a Unix socket, reachable only through the file system."""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        os.chmod(self.server_address, 0o600)
+        self.server_name, self.server_port = "localhost", 0
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request, ("unix", 0)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def load_token(path: str) -> str:
+    """
+    Returns the server token from PYIMPROVE_SERVER_TOKEN, or a new random
+    one, and writes it to `path` readable only by its owner.
+    """
+    token = os.environ.get(TOKEN_ENV) or secrets.token_urlsafe(32)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.chmod(path, 0o600)
+    return token
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyImprove job server")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--max-jobs", type=int, default=2, help="Jobs run concurrently")
+    parser.add_argument(
+        "--token-file", default=DEFAULT_TOKEN_FILE, help="Where the client token is written"
+    )
+    parser.add_argument(
+        "--allow-root",
+        action="append",
+        default=[],
+        help="Only accept jobs on files under this directory (repeatable)",
+    )
+    parser.add_argument(
+        "--allow-verify-command",
+        action="append",
+        default=[],
+        help="A test command jobs may pass as verify_command (repeatable)",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=300.0,
+        help="Seconds running jobs get to finish on shutdown before they are cancelled",
+    )
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite response cache")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    parser.add_argument("--trace-dir", default=prompt_trace.DEFAULT_TRACE_DIR)
+    parser.add_argument("--trace-sample", type=float, default=1.0)
+    parser.add_argument("--no-trace", action="store_true", help="Do not record prompts and responses")
+    args = parser.parse_args()
+
+    prompt_trace.configure(
+        enabled=not args.no_trace, directory=args.trace_dir, sample_rate=args.trace_sample
+    )
+    # Per-file breakdowns are kept per job; the server-wide registry would
+    # otherwise grow with every file ever processed.
+    metrics.reset(per_file=False)
+    token = load_token(args.token_file)
+    service = PyImproveService(
+        args.max_jobs,
+        None if args.no_cache else args.cache_path,
+        roots=args.allow_root,
+        verify_commands=args.allow_verify_command,
+    )
+    service.start()
+    if args.socket:
+        server = UnixServiceHTTPServer(args.socket, service, token)
+        logging.info(f"PyImprove server listening on unix:{args.socket}")
+    else:
+        server = ServiceHTTPServer((args.host, args.port), service, token)
+        logging.info(f"PyImprove server listening on http://{args.host}:{server.server_port}")
+    logging.info(f"Client token written to {args.token_file}")
+
+    def terminate(signum, frame):
+        logging.info("SIGTERM received; shutting down.")
+        # shutdown() waits for serve_forever(), which runs in this thread.
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down.")
+    finally:
+        server.server_close()
+        service.stop(args.drain_timeout)
+        prompt_trace.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# tests/conftest.py
+import os
+import subprocess
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gitpython import GitRepo  # noqa: E402
+
+
+def git(cwd, *args) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def write(path, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def read(path) -> str:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch) -> GitRepo:
+    """A git repository with one committed module, `mod.py`, as the working directory."""
+    root = tmp_path / "repo"
+    root.mkdir()
+    git(root, "init", "-q")
+    git(root, "config", "user.email", "tests@example.com")
+    git(root, "config", "user.name", "Tests")
+    write(root / "mod.py", "def double(x):\n    return x * 2\n")
+    git(root, "add", "mod.py")
+    git(root, "commit", "-q", "-m", "init")
+    monkeypatch.chdir(root)
+    return GitRepo(str(root))
+
+
+class StubAnalyzer:
+    """Stands in for FunctionAnalyzer; records the functions it was asked about."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def run_agent_async(self, script_path, functions=None):
+        self.calls.append((script_path, functions))
+        return "<analysis/>"
+
+
+class StubEditor:
+    """Stands in for FunctionEditorAgent, returning fixed actions for each file."""
+
+    def __init__(self, actions=None):
+        self.actions = actions or {}
+        self.calls = []
+
+    async def run_agent_async(self, script_path, analysis_report):
+        self.calls.append(script_path)
+        return [dict(action) for action in self.actions.get(script_path, [])]
+
+    async def stream_actions(self, script_path, analysis_report):
+        self.calls.append(script_path)
+        for action in self.actions.get(script_path, []):
+            yield dict(action)
@@ -0,0 +1,105 @@
+# tests/test_actions.py
+import os
+import pytest
+from actions import ActionError, ActionTransaction, apply_actions
+from conftest import git, read, write
+
+
+def edit(path, contents):
+    return {"type": "edit_file", "file_path": str(path), "file_contents": contents}
+
+
+def test_apply_actions_commits_touched_paths_only(repo):
+    root = repo.git_toplevel()
+    write(os.path.join(root, "unrelated.py"), "x = 1\n")
+    head = repo.git_head()
+
+    commit = apply_actions(
+        [
+            edit(os.path.join(root, "mod.py"), "def double(x):\n    return x + x\n"),
+            {"type": "create_file", "file_path": os.path.join(root, "new.py"),
+             "file_contents": "y = 2\n"},
+        ],
+        repo,
+        "Two files",
+    )
+
+    assert commit == git(root, "rev-parse", "HEAD")
+    assert git(root, "rev-parse", "HEAD~1") == head
+    assert git(root, "show", "--name-only", "--format=", "HEAD").split() == ["mod.py", "new.py"]
+    assert git(root, "status", "--porcelain") == "?? unrelated.py"
+
+
+def test_apply_actions_deletes_files(repo):
+    root = repo.git_toplevel()
+    apply_actions([{"type": "delete_file", "file_path": os.path.join(root, "mod.py")}], repo)
+
+    assert not os.path.exists(os.path.join(root, "mod.py"))
+    assert git(root, "ls-tree", "--name-only", "HEAD") == ""
+
+
+def test_failing_action_rolls_back_everything(repo):
+    root = repo.git_toplevel()
+    head = repo.git_head()
+    original = read(os.path.join(root, "mod.py"))
+
+    with pytest.raises(ActionError):
+        apply_actions(
+            [
+                edit(os.path.join(root, "mod.py"), "def double(x):\n    return 0\n"),
+                {"type": "create_file", "file_path": os.path.join(root, "new.py"),
+                 "file_contents": "z = 3\n"},
+                {"type": "edit_file", "file_path": os.path.join(root, "broken.py")},
+            ],
+            repo,
+        )
+
+    assert read(os.path.join(root, "mod.py")) == original
+    assert not os.path.exists(os.path.join(root, "new.py"))
+    assert git(root, "rev-parse", "HEAD") == head
+    assert git(root, "status", "--porcelain") == ""
+
+
+def test_transaction_rolls_back_when_the_commit_fails(repo, monkeypatch):
+    root = repo.git_toplevel()
+    path = os.path.join(root, "mod.py")
+    original = read(path)
+    transaction = ActionTransaction(repo)
+    transaction.apply(edit(path, "def double(x):\n    return 2 * x\n"))
+    monkeypatch.setattr(repo, "git_commit_paths", lambda paths, message="Update": None)
+
+    with pytest.raises(ActionError):
+        transaction.commit()
+
+    assert read(path) == original
+
+
+def test_validated_apply_refuses_a_syntax_error(repo):
+    path = os.path.join(repo.git_toplevel(), "mod.py")
+    original = read(path)
+    transaction = ActionTransaction(repo)
+
+    with pytest.raises(ActionError):
+        transaction.apply(edit(path, "def double(x)\n    return x\n"), validate=True)
+
+    assert read(path) == original
+    assert transaction.touched_paths == []
+
+
+def test_commit_is_rebuilt_when_head_moved(repo, monkeypatch):
+    root = repo.git_toplevel()
+    stale = repo.git_head()
+    write(os.path.join(root, "other.py"), "w = 4\n")
+    git(root, "add", "other.py")
+    git(root, "commit", "-q", "-m", "concurrent")
+    moved = git(root, "rev-parse", "HEAD")
+    heads = iter([stale])
+    real_head = repo.git_head
+    monkeypatch.setattr(repo, "git_head", lambda: next(heads, None) or real_head())
+    write(os.path.join(root, "mod.py"), "def double(x):\n    return x << 1\n")
+
+    commit = repo.git_commit_paths(["mod.py"], "After the concurrent commit")
+
+    assert commit == git(root, "rev-parse", "HEAD")
+    assert git(root, "rev-parse", "HEAD~1") == moved
+    assert git(root, "ls-tree", "--name-only", "HEAD").split() == ["mod.py", "other.py"]
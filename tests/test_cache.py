@@ -0,0 +1,170 @@
+# tests/test_cache.py
+import asyncio
+import pytest
+from api import cache as cache_module
+from api.cache import CachedAPI, ResponseCache
+from api.mock_api import MockAPI
+
+
+class CountingAPI(MockAPI):
+    """A mock provider whose every response is new, so replays are visible."""
+
+    def __init__(self, default_temperature=0.0):
+        super().__init__()
+        self.DEFAULT_TEMPERATURE = default_temperature
+        self.calls = 0
+
+    def respond(self, prompt):
+        self.calls += 1
+        return f"response {self.calls}"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(cache_module.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def store(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache" / "responses.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def generate(api, prompt, **kwargs):
+    return asyncio.run(api.generate_text(prompt, **kwargs))
+
+
+def stream(api, prompt, **kwargs):
+    async def collect():
+        return [chunk async for chunk in api.stream_text(prompt, **kwargs)]
+
+    return asyncio.run(collect())
+
+
+def test_key_covers_provider_model_params_and_prompt():
+    key = ResponseCache.make_key("openai", "gpt", {"temperature": 0, "max_tokens": 10}, "hi")
+    assert key == ResponseCache.make_key("openai", "gpt", {"max_tokens": 10, "temperature": 0}, "hi")
+    assert key == ResponseCache.make_key(
+        "openai", "gpt", {"temperature": 0, "max_tokens": 10, "timeout": 5}, "hi"
+    )
+    for other in [
+        ResponseCache.make_key("deepseek", "gpt", {"temperature": 0, "max_tokens": 10}, "hi"),
+        ResponseCache.make_key("openai", "o1", {"temperature": 0, "max_tokens": 10}, "hi"),
+        ResponseCache.make_key("openai", "gpt", {"temperature": 0.5, "max_tokens": 10}, "hi"),
+        ResponseCache.make_key("openai", "gpt", {"temperature": 0, "max_tokens": 10}, "hi!"),
+    ]:
+        assert other != key
+    messages = [{"role": "user", "content": "hi"}]
+    assert ResponseCache.make_key("openai", "gpt", {}, messages) == ResponseCache.make_key(
+        "openai", "gpt", {}, [{"content": "hi", "role": "user"}]
+    )
+
+
+def test_key_uses_the_effective_temperature(store):
+    api = CachedAPI(CountingAPI(), store)
+    assert generate(api, "prompt") == "response 1"
+    # No temperature means the provider's default of 0.
+    assert generate(api, "prompt", temperature=0.0) == "response 1"
+    assert generate(api, "prompt", temperature=None) == "response 1"
+    assert store.stats()["entries"] == 1
+
+
+def test_hits_are_persisted_across_instances(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    first = ResponseCache(path)
+    assert generate(CachedAPI(CountingAPI(), first), "prompt") == "response 1"
+    first.close()
+    second = ResponseCache(path)
+    provider = CountingAPI()
+    assert generate(CachedAPI(provider, second), "prompt") == "response 1"
+    assert provider.calls == 0
+    assert (second.hits, second.misses) == (1, 0)
+    second.close()
+
+
+def test_bypass_neither_reads_nor_writes(store):
+    generate(CachedAPI(CountingAPI(), store), "prompt")
+    provider = CountingAPI()
+    api = CachedAPI(provider, store, bypass=True)
+    assert generate(api, "prompt") == "response 1"
+    assert generate(api, "other") == "response 2"
+    assert provider.calls == 2
+    assert store.stats()["entries"] == 1
+
+
+def test_refresh_overwrites_cached_entries(store):
+    generate(CachedAPI(CountingAPI(), store), "prompt")
+    provider = CountingAPI()
+    provider.calls = 10
+    assert generate(CachedAPI(provider, store, refresh=True), "prompt") == "response 11"
+    assert generate(CachedAPI(CountingAPI(), store), "prompt") == "response 11"
+
+
+def test_sampled_requests_skip_the_cache_unless_enabled(store):
+    provider = CountingAPI(default_temperature=1.0)
+    api = CachedAPI(provider, store)
+    assert generate(api, "prompt") == "response 1"
+    assert generate(api, "prompt") == "response 2"
+    assert generate(api, "prompt", temperature=0.7) == "response 3"
+    assert store.stats()["entries"] == 0
+    # An explicit temperature of 0 is reproducible, whatever the default.
+    assert generate(api, "prompt", temperature=0) == "response 4"
+    assert generate(api, "prompt", temperature=0) == "response 4"
+
+    sampled = CachedAPI(provider, store, cache_sampled=True)
+    assert generate(sampled, "prompt") == "response 5"
+    assert generate(sampled, "prompt") == "response 5"
+
+
+def test_streams_are_stored_whole_and_replayed_in_one_chunk(store):
+    provider = CountingAPI()
+    api = CachedAPI(provider, store)
+    assert stream(api, "prompt", chunk_size=4) == ["resp", "onse", " 1"]
+    assert stream(api, "prompt", chunk_size=4) == ["response 1"]
+    assert generate(api, "prompt", chunk_size=4) == "response 1"
+    assert provider.calls == 1
+
+
+def test_expired_entries_miss_and_are_evicted(store, clock):
+    store.max_age = 100
+    store.put("old", "x")
+    clock.now += 50
+    assert store.get("old") == "x"
+    clock.now += 100
+    assert store.get("old") is None
+    store.evict()
+    assert store.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_dropped_over_max_bytes(store, clock):
+    store.max_bytes = 20
+    for key in ("a", "b", "c"):
+        store.put(key, "x" * 8)
+    assert store.get("a") == "x" * 8
+    store.evict()
+    assert store.get("b") is None
+    assert store.get("a") == store.get("c") == "x" * 8
+    assert store.stats()["bytes"] == 16
+
+
+def test_eviction_runs_every_n_writes(store, clock):
+    store.max_bytes = 10
+    store.evict_every = 3
+    store.put("a", "x" * 8)
+    store.put("b", "x" * 8)
+    assert store.stats()["entries"] == 2
+    store.put("c", "x" * 8)
+    assert store.stats()["entries"] == 1
+    assert store.get("c") == "x" * 8
@@ -0,0 +1,59 @@
+# tests/test_function_editor.py
+import asyncio
+import os
+import pytest
+from agents.function_editor.function_editor import FunctionEditorAgent
+from api.budget import RequestPlan
+from api.mock_api import MockAPI
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def response(path, contents):
+    return (
+        f"<functions><action><type>edit_file</type><file_path>{path}</file_path>"
+        f"<file_contents><![CDATA[{contents}]]></file_contents></action></functions>"
+    )
+
+
+@pytest.fixture
+def editor(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)  # the role and structure files are relative paths
+    return FunctionEditorAgent(MockAPI(), candidates=3, temperatures=[0.2, 0.6, 1.0])
+
+
+def test_best_of_returns_the_first_valid_candidate_and_cancels_the_rest(editor, tmp_path):
+    path = str(tmp_path / "mod.py")
+    # temperature: (delay, response)
+    script = {
+        0.2: (0.01, response(path, "def broken(:\n")),  # first, but does not compile
+        0.6: (0.05, response(path, "x = 1\n")),
+        1.0: (5.0, response(path, "x = 2\n")),
+    }
+    cancelled = []
+
+    async def generate(prompt, file_path, max_tokens=None, temperature=None):
+        delay, text = script[temperature]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(temperature)
+            raise
+        return text
+
+    editor._generate = generate
+
+    actions = asyncio.run(editor._best_of(path, "prompt", RequestPlan(100, 1000, 8000)))
+
+    assert [action["file_contents"] for action in actions] == ["x = 1\n"]
+    assert cancelled == [1.0]
+
+
+def test_best_of_raises_when_every_candidate_failed(editor, tmp_path):
+    async def generate(prompt, file_path, max_tokens=None, temperature=None):
+        raise RuntimeError(f"failed at {temperature}")
+
+    editor._generate = generate
+
+    with pytest.raises(RuntimeError, match="failed at"):
+        asyncio.run(editor._best_of(str(tmp_path / "mod.py"), "prompt", RequestPlan(100, 1000, 8000)))
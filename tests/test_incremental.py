@@ -0,0 +1,86 @@
+# tests/test_incremental.py
+import asyncio
+import os
+from agents.triage import Triage
+from conftest import StubAnalyzer, StubEditor, git, write
+from incremental import FunctionIndex, fingerprint
+from pipeline import Pipeline, RunContext
+
+
+SCRIPT = "def double(x):\n    return x * 2\n\n\nclass Box:\n    def get(self):\n        return 1\n"
+
+
+def test_fingerprint_ignores_formatting_and_comments():
+    assert fingerprint("def f(a):\n    return a\n") == fingerprint("def f( a ):  # identity\n\n    return (a)\n")
+    assert fingerprint("def f(a):\n    return a\n") != fingerprint("def f(a):\n    return -a\n")
+
+
+def test_index_reports_new_and_modified_functions(repo):
+    root = repo.git_toplevel()
+    path = os.path.join(root, "box.py")
+    write(path, SCRIPT)
+    index = FunctionIndex(repo)
+
+    assert index.changed_functions(path) == ["double", "Box.get"]
+    index.update(path)
+    assert index.changed_functions(path) == []
+
+    write(path, SCRIPT.replace("return 1", "return 2") + "\n\ndef extra():\n    pass\n")
+    assert index.changed_functions(path) == ["Box.get", "extra"]
+
+
+def test_index_skips_files_git_reports_unchanged(repo):
+    root = repo.git_toplevel()
+    path = os.path.join(root, "box.py")
+    write(path, SCRIPT)
+    git(root, "add", "box.py")
+    git(root, "commit", "-q", "-m", "box")
+    index = FunctionIndex(repo)
+    index.update(path)
+    index.mark_processed()
+
+    reloaded = FunctionIndex(repo)
+    assert reloaded.last_commit == repo.git_head()
+    assert reloaded.changed_functions(path) == []
+
+    reloaded.invalidate(path)
+    assert reloaded.changed_functions(path) == []
+    reloaded.files.clear()
+    assert reloaded.changed_functions(path) == ["double", "Box.get"]
+
+
+def _run(repo, paths, editor=None, triage=None):
+    index = FunctionIndex(repo)
+    ctx = RunContext(StubAnalyzer(), editor or StubEditor(), repo, index=index, triage=triage)
+    results = asyncio.run(Pipeline(ctx).run(paths))
+    index.mark_processed()
+    return {os.path.basename(result.path): result.status for result in results}
+
+
+def test_clean_outcomes_are_indexed_and_skipped_next_time(repo):
+    root = repo.git_toplevel()
+    mod = os.path.join(root, "mod.py")
+    box = os.path.join(root, "box.py")
+    write(box, SCRIPT)
+    edit = {"type": "edit_file", "file_path": mod, "file_contents": "def double(x):\n    return x + x\n"}
+
+    assert _run(repo, [mod, box], StubEditor({mod: [edit]})) == {"mod.py": "edited", "box.py": "no_actions"}
+    assert _run(repo, [mod, box]) == {"mod.py": "unchanged", "box.py": "unchanged"}
+
+
+def test_triaged_files_are_indexed(repo):
+    mod = os.path.join(repo.git_toplevel(), "mod.py")
+    triage = Triage(max_workers=1)
+    try:
+        assert _run(repo, [mod], triage=triage) == {"mod.py": "triaged"}
+        assert _run(repo, [mod], triage=triage) == {"mod.py": "unchanged"}
+    finally:
+        triage.close()
+
+
+def test_failed_files_are_processed_again(repo):
+    mod = os.path.join(repo.git_toplevel(), "mod.py")
+    broken = {"type": "edit_file", "file_path": mod, "file_contents": "def double(x)\n"}
+
+    assert _run(repo, [mod], StubEditor({mod: [broken]})) == {"mod.py": "failed"}
+    assert _run(repo, [mod]) == {"mod.py": "no_actions"}
@@ -0,0 +1,161 @@
+# tests/test_job_store.py
+import asyncio
+import os
+import time
+import pytest
+from conftest import StubAnalyzer, StubEditor, git, read, write
+from job_store import JobStore
+from pipeline import Pipeline, RunContext
+
+
+RUN = "run"
+EDITED = "def double(x):\n    return x + x\n"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def mod(repo):
+    return os.path.join(repo.git_toplevel(), "mod.py")
+
+
+def edit(path, contents=EDITED):
+    return {"type": "edit_file", "file_path": path, "file_contents": contents}
+
+
+def run(repo, store, paths, analyzer=None, editor=None):
+    ctx = RunContext(analyzer or StubAnalyzer(), editor or StubEditor(), repo, store=store, run_id=RUN)
+    return asyncio.run(Pipeline(ctx).run(paths))
+
+
+def stop_after(store, path, stage, **data):
+    """Leaves `path` as a stopped run would after completing `stage`; its lease has expired."""
+    lease, store.lease = store.lease, 0
+    store.enqueue(RUN, [path])
+    assert [record.path for record in store.claim(RUN)] == [path]
+    store.checkpoint(RUN, path, "analyzed", functions=["double"], analysis="<analysis/>")
+    if stage == "edited":
+        store.checkpoint(RUN, path, "edited", **data)
+    store.lease = lease
+
+
+def test_claims_follow_input_order_and_leases(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease=60)
+    paths = [str(tmp_path / name) for name in ("b.py", "a.py", "c.py")]
+    store.enqueue(RUN, paths)
+    store.enqueue(RUN, paths[:1])
+
+    assert [record.path for record in store.claim(RUN, 2)] == paths[:2]
+    assert [record.path for record in store.claim(RUN, 2)] == paths[2:]
+    assert store.claim(RUN, 2) == []
+    store.lease = 0
+    store.checkpoint(RUN, paths[0], "analyzed", analysis="<analysis/>")
+    store.complete(RUN, paths[1], "edited")
+
+    [expired] = store.claim(RUN, 5)
+    assert (expired.path, expired.stage, expired.analysis) == (paths[0], "analyzed", "<analysis/>")
+    assert store.progress(RUN) == {"claimed": 2, "claimed:analyzed": 1, "claimed:pending": 1, "done": 1}
+    store.close()
+
+
+def test_failed_files_are_retried_until_attempts_run_out(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+    store.enqueue(RUN, ["a.py"])
+    store.claim(RUN)
+    store.complete(RUN, "a.py", "failed", "boom")
+
+    [record] = store.claim(RUN)
+    assert record.attempts == 2
+    store.complete(RUN, "a.py", "failed", "boom")
+    assert store.claim(RUN) == []
+    store.close()
+
+
+def test_resume_reuses_checkpoints(repo, store, mod):
+    stop_after(store, mod, "edited", actions=[edit(mod)])
+    analyzer, editor = StubAnalyzer(), StubEditor()
+
+    [result] = run(repo, store, [mod], analyzer, editor)
+
+    assert (result.status, result.actions) == ("edited", 1)
+    assert analyzer.calls == [] and editor.calls == []
+    assert git(repo.git_toplevel(), "show", "HEAD:mod.py") + "\n" == EDITED
+
+
+def test_resume_undoes_a_partial_write(repo, store, mod):
+    stop_after(store, mod, "edited", actions=[edit(mod)])
+    original = read(mod)
+    created = os.path.join(repo.git_toplevel(), "created.py")
+    store.journal(RUN, mod, {mod: original.encode("utf-8"), created: None})
+    write(mod, "def double(x):\n    return x +")
+    write(created, "x = 1\n")
+    editor = StubEditor()
+
+    [result] = run(repo, store, [mod], editor=editor)
+
+    assert result.status == "edited"
+    assert editor.calls == []
+    assert not os.path.exists(created)
+    assert read(mod) == EDITED
+
+
+def test_resume_finishes_a_write_that_was_committed(repo, store, mod):
+    stop_after(store, mod, "edited", actions=[edit(mod)])
+    store.journal(RUN, mod, {mod: read(mod).encode("utf-8")})
+    write(mod, EDITED)
+    git(repo.git_toplevel(), "commit", "-q", "-am", "edited")
+    head = git(repo.git_toplevel(), "rev-parse", "HEAD")
+
+    [result] = run(repo, store, [mod])
+
+    assert (result.status, result.actions) == ("edited", 1)
+    assert git(repo.git_toplevel(), "rev-parse", "HEAD") == head
+
+
+def test_resume_starts_over_when_the_file_changed(repo, store, mod):
+    stop_after(store, mod, "edited", actions=[edit(mod)])
+    write(mod, "def double(x):\n    return 2 * x\n")
+    analyzer = StubAnalyzer()
+
+    [result] = run(repo, store, [mod], analyzer)
+
+    assert result.status == "no_actions"
+    assert analyzer.calls == [(mod, None)]
+    assert read(mod) == "def double(x):\n    return 2 * x\n"
+
+
+class FlakyEditor(StubEditor):
+    async def run_agent_async(self, script_path, analysis_report):
+        if not self.calls:
+            self.calls.append(script_path)
+            raise RuntimeError("provider error")
+        return await super().run_agent_async(script_path, analysis_report)
+
+
+class PatientStore(JobStore):
+    """Waits for claimed files to finish before reporting that none are left."""
+
+    def claim(self, run, limit=1):
+        deadline = time.monotonic() + 10
+        while True:
+            records = super().claim(run, limit)
+            if records or "claimed" not in self.progress(run) or time.monotonic() > deadline:
+                return records
+            time.sleep(0.01)
+
+
+def test_a_retried_file_has_one_result(repo, tmp_path, mod):
+    store = PatientStore(str(tmp_path / "patient.sqlite3"))
+    store.enqueue(RUN, [mod])
+    editor = FlakyEditor({mod: [edit(mod)]})
+
+    results = run(repo, store, [mod], editor=editor)
+    store.close()
+
+    assert [(r.path, r.status) for r in results] == [(mod, "edited")]
+    assert len(editor.calls) == 2
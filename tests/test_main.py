@@ -0,0 +1,45 @@
+# tests/test_main.py
+import sys
+import pytest
+import main
+import prompt_trace
+from agents.triage import Triage
+from gitpython import GitRepo
+
+
+@pytest.fixture
+def closed(monkeypatch):
+    """Records which resources main() closes."""
+    calls = []
+    for owner, name in [(GitRepo, "close"), (Triage, "close")]:
+        original = getattr(owner, name)
+
+        def close(self, original=original, label=f"{owner.__name__}.{name}"):
+            calls.append(label)
+            return original(self)
+
+        monkeypatch.setattr(owner, name, close)
+    monkeypatch.setattr(prompt_trace, "shutdown", lambda: calls.append("prompt_trace.shutdown"))
+    return calls
+
+
+def run_main(monkeypatch, tmp_path, *args):
+    argv = ["main.py", *args, "--api", "mock", "--triage", "--cache-path", str(tmp_path / "c.db")]
+    monkeypatch.setattr(sys, "argv", argv)
+    main.main()
+
+
+def test_resources_are_closed_when_the_run_fails(repo, closed, monkeypatch, tmp_path):
+    def fail(api, coroutine):
+        coroutine.close()
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(main, "run_sync", fail)
+    with pytest.raises(RuntimeError):
+        run_main(monkeypatch, tmp_path, "mod.py")
+    assert closed == ["Triage.close", "GitRepo.close", "prompt_trace.shutdown"]
+
+
+def test_resources_are_closed_when_no_file_matches(repo, closed, monkeypatch, tmp_path):
+    run_main(monkeypatch, tmp_path, "missing.py")
+    assert closed == ["Triage.close", "GitRepo.close", "prompt_trace.shutdown"]
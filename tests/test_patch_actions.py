@@ -0,0 +1,212 @@
+# tests/test_patch_actions.py
+import os
+import pytest
+from actions import ActionError, ActionTransaction, apply_unified_diff, replace_function, validate_actions
+from agents.function_editor.function_editor import ActionStreamParser
+from conftest import read, write
+
+
+SOURCE = '''import functools
+
+
+class Counter:
+    def __init__(self):
+        self._count = 0
+
+    @property
+    def count(self):
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        self._count = value
+
+    @functools.lru_cache(maxsize=None)
+    def total(self, n):
+        return sum(range(n))
+'''
+
+
+def test_replace_method_reindents_and_keeps_decorators():
+    result = replace_function(SOURCE, "Counter.total", "def total(self, n):\n    return n * (n - 1) // 2\n")
+
+    assert "    @functools.lru_cache(maxsize=None)\n    def total(self, n):\n" in result
+    assert "        return n * (n - 1) // 2\n" in result
+    assert "sum(range(n))" not in result
+    assert result.startswith(SOURCE[: SOURCE.index("    @functools")])
+
+
+def test_replace_with_decorators_replaces_them():
+    result = replace_function(SOURCE, "Counter.total", "@staticmethod\ndef total(n):\n    return n\n")
+
+    assert "lru_cache" not in result
+    assert "    @staticmethod\n    def total(n):\n" in result
+
+
+def test_duplicate_names_need_matching_decorators():
+    with pytest.raises(ActionError, match="defined 2 times"):
+        replace_function(SOURCE, "Counter.count", "def count(self):\n    return 0\n")
+
+    result = replace_function(
+        SOURCE, "Counter.count", "@count.setter\ndef count(self, value):\n    self._count = int(value)\n"
+    )
+
+    assert "self._count = int(value)" in result
+    assert "        return self._count\n" in result
+
+
+def test_replace_missing_function_raises():
+    with pytest.raises(ActionError, match="not found"):
+        replace_function(SOURCE, "Counter.missing", "def missing(self):\n    pass\n")
+
+
+def test_replace_function_keeps_crlf():
+    source = SOURCE.replace("\n", "\r\n")
+    result = replace_function(source, "Counter.total", "def total(self, n):\n    return 0\n")
+
+    assert result.count("\r\n") == result.count("\n")
+
+
+DIFF = """@@ -5,2 +5,2 @@
+     def __init__(self):
+-        self._count = 0
++        self._count = 1
+"""
+
+
+def test_diff_with_drifted_line_numbers_is_located_by_context():
+    source = "# header\n# more\n" + SOURCE
+
+    assert "self._count = 1" in apply_unified_diff(source, DIFF)
+
+
+def test_diff_keeps_crlf():
+    result = apply_unified_diff(SOURCE.replace("\n", "\r\n"), DIFF)
+
+    assert "self._count = 1\r\n" in result
+    assert result.count("\r\n") == result.count("\n")
+
+
+def test_diff_with_unknown_context_raises():
+    with pytest.raises(ActionError, match="does not match"):
+        apply_unified_diff(SOURCE, DIFF.replace("_count = 0", "_total = 0"))
+
+
+def test_patch_actions_apply_in_order_and_keep_line_endings(repo):
+    path = os.path.join(repo.git_toplevel(), "counter.py")
+    write(path, SOURCE.replace("\n", "\r\n"))
+    transaction = ActionTransaction(repo)
+
+    transaction.apply({"type": "apply_diff", "file_path": path, "diff": DIFF})
+    transaction.apply({
+        "type": "replace_function",
+        "file_path": path,
+        "qualified_name": "Counter.total",
+        "function_code": "def total(self, n):\n    return 0\n",
+    })
+
+    contents = read(path)
+    assert "self._count = 1\r\n" in contents
+    assert "        return 0\r\n" in contents
+    assert contents.count("\r\n") == contents.count("\n")
+    transaction.rollback()
+    assert read(path) == SOURCE.replace("\n", "\r\n")
+
+
+def test_validate_actions_checks_patches_without_writing(tmp_path):
+    path = str(tmp_path / "counter.py")
+    write(path, SOURCE)
+    broken = {
+        "type": "replace_function",
+        "file_path": path,
+        "qualified_name": "Counter.total",
+        "function_code": "def total(self, n):\nreturn n\n",
+    }
+
+    with pytest.raises(ActionError):
+        validate_actions([{"type": "apply_diff", "file_path": path, "diff": DIFF}, broken])
+    assert read(path) == SOURCE
+
+
+RESPONSE = """```xml
+<functions>
+    <action>
+        <type>replace_function</type>
+        <file_path> counter.py </file_path>
+        <qualified_name>Counter.total</qualified_name>
+        <function_code><![CDATA[def total(self, n):
+    return 0]]></function_code>
+    </action>
+    <action>
+        <type>delete_file</type>
+        <file_path>old.py</file_path>
+    </action>
+</functions>
+```"""
+
+
+def test_stream_parser_yields_each_action_once_complete():
+    parser = ActionStreamParser()
+    actions = []
+    for start in range(0, len(RESPONSE), 7):
+        actions.extend(parser.feed(RESPONSE[start : start + 7]))
+    parser.close()
+
+    assert [action["type"] for action in actions] == ["replace_function", "delete_file"]
+    assert actions[0]["file_path"] == "counter.py"
+    assert actions[0]["function_code"] == "def total(self, n):\n    return 0"
+
+
+def test_stream_parser_refuses_a_truncated_response():
+    parser = ActionStreamParser()
+    actions = parser.feed(RESPONSE[: RESPONSE.index("<type>delete_file")])
+
+    assert len(actions) == 1
+    with pytest.raises(ActionError, match="ended before"):
+        parser.close()
+
+
+def test_replace_function_leaves_multiline_strings_alone():
+    code = 'def total(self, n):\n    text = """a\nb"""\n    return text\n'
+
+    result = replace_function(SOURCE, "Counter.total", code)
+
+    namespace = {}
+    exec(result, namespace)
+    assert namespace["Counter"]().total(1) == "a\nb"
+
+
+def test_replace_indented_function_code_keeps_string_contents():
+    code = '    def total(self, n):\n        return f"""x\n  {n}"""\n'
+
+    result = replace_function(SOURCE, "Counter.total", code)
+
+    namespace = {}
+    exec(result, namespace)
+    assert namespace["Counter"]().total(1) == "x\n  1"
+
+
+def test_replace_function_counts_lines_like_python():
+    source = "x = 1\x0c\n" + SOURCE
+
+    result = replace_function(source, "Counter.total", "def total(self, n):\n    return 0\n")
+
+    assert result.startswith("x = 1\x0c\n")
+    assert "        return 0\n" in result and "sum(range(n))" not in result
+
+
+def test_diff_splits_lines_like_git():
+    source = "a = '\x0c'\ny = 2\n"
+
+    assert apply_unified_diff(source, "@@ -2 +2 @@\n-y = 2\n+y = 3\n") == "a = '\x0c'\ny = 3\n"
+
+
+def test_diff_keeps_a_missing_final_newline_unless_the_hunk_adds_one():
+    diff = "@@ -2 +2 @@\n-y = 2\n+y = 3\n"
+    adds_newline = "@@ -2 +2 @@\n-y = 2\n\\ No newline at end of file\n+y = 3\n"
+    drops_newline = "@@ -2 +2 @@\n-y = 2\n+y = 3\n\\ No newline at end of file\n"
+
+    assert apply_unified_diff("x = 1\ny = 2", diff) == "x = 1\ny = 3"
+    assert apply_unified_diff("x = 1\ny = 2", adds_newline) == "x = 1\ny = 3\n"
+    assert apply_unified_diff("x = 1\ny = 2\n", drops_newline) == "x = 1\ny = 3"
+    assert apply_unified_diff("x = 1\ny = 2\n", diff) == "x = 1\ny = 3\n"
@@ -0,0 +1,143 @@
+# tests/test_router.py
+import asyncio
+import time
+import pytest
+from api.api import APIError, TransientAPIError
+from api.mock_api import MockAPI
+from api.router_api import CircuitBreaker, RouterAPI
+
+
+class ScriptedAPI(MockAPI):
+    """A mock provider whose calls take the scripted (delay, ok) steps; the last one repeats."""
+
+    def __init__(self, name, *steps):
+        super().__init__()
+        self.name = name
+        self.steps = list(steps) or [(0.0, True)]
+        self.calls = 0
+
+    async def _simulate_request(self):
+        delay, ok = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        if not ok:
+            raise TransientAPIError(f"{self.name} failed", status_code=503)
+
+    def respond(self, prompt):
+        return self.name
+
+
+def router(*providers, **options):
+    return RouterAPI(providers={p.name: p for p in providers}, **options)
+
+
+def prime(router, name, latency, samples=5):
+    for _ in range(samples):
+        router.stats[name].record(latency, ok=True)
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers_through_a_trial():
+    breaker = CircuitBreaker("a", failure_threshold=2, cooldown=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allows()
+
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allows()
+
+    breaker.opened_at -= 30
+    assert breaker.state == "half-open" and breaker.allows()
+    breaker.begin()
+    assert not breaker.allows()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.opened_at -= 30
+    breaker.begin()
+    breaker.release()  # a cancelled trial frees the slot
+    assert breaker.allows()
+    breaker.begin()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_fails_over_and_skips_a_provider_whose_breaker_is_open():
+    bad, good = ScriptedAPI("bad", (0.0, False)), ScriptedAPI("good")
+    routed = router(bad, good, failure_threshold=2)
+
+    async def requests():
+        return [await routed.generate_text("hi") for _ in range(4)]
+
+    assert asyncio.run(requests()) == ["good"] * 4
+    assert bad.calls == 2
+    assert routed.breakers["bad"].state == "open"
+    assert routed.stats["bad"].error_rate == 1.0
+
+
+def test_raises_when_every_provider_fails():
+    routed = router(ScriptedAPI("a", (0.0, False)), ScriptedAPI("b", (0.0, False)), failure_threshold=1)
+
+    with pytest.raises(APIError, match="All providers failed"):
+        asyncio.run(routed.generate_text("hi"))
+    with pytest.raises(APIError, match="No healthy provider"):
+        asyncio.run(routed.generate_text("hi"))
+
+
+def test_hedges_a_slow_request_and_cancels_the_loser():
+    slow, fast = ScriptedAPI("slow", (1.0, True)), ScriptedAPI("fast", (0.01, True))
+    routed = router(slow, fast, hedge_after=0.05)
+
+    started = time.monotonic()
+    assert asyncio.run(routed.generate_text("hi")) == "fast"
+
+    assert time.monotonic() - started < 0.5
+    assert routed.hedged == 1
+    assert routed.stats["slow"].cancelled == 1
+    assert routed.stats["fast"].wins == 1
+
+
+def test_hedge_delay_follows_the_request_still_in_flight():
+    first = ScriptedAPI("first", (0.1, False))
+    second = ScriptedAPI("second", (0.15, True))
+    third = ScriptedAPI("third")
+    routed = router(first, second, third)
+    prime(routed, "first", 0.05)
+    prime(routed, "second", 0.2)
+    prime(routed, "third", 0.3)
+
+    # first is hedged after its p95 (0.05s) and fails at 0.1s; second, still in
+    # flight, answers at 0.2s, within its own p95, so third is never needed.
+    assert asyncio.run(routed.generate_text("hi")) == "second"
+    assert routed.hedged == 1
+    assert third.calls == 0
+
+
+class FailingStream:
+    """A provider stream that fails before its first delta and records being closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise TransientAPIError("stream failed", status_code=503)
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_stream_fails_over_and_closes_the_failed_stream():
+    broken, good = ScriptedAPI("broken"), ScriptedAPI("good")
+    stream = FailingStream()
+    broken.stream_text = lambda prompt, **kwargs: stream
+    routed = router(broken, good)
+
+    async def collect():
+        return "".join([chunk async for chunk in routed.stream_text("hi")])
+
+    assert asyncio.run(collect()) == "good"
+    assert stream.closed
+    assert routed.stats["broken"].error_rate == 1.0
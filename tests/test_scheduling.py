@@ -0,0 +1,161 @@
+# tests/test_scheduling.py
+import asyncio
+import email.utils
+import time
+import pytest
+from api import scheduling
+from api.api import APIError, TransientAPIError
+from api.scheduling import (
+    RateLimiter,
+    RequestScheduler,
+    RetryPolicy,
+    TokenBucket,
+    parse_retry_after,
+)
+
+
+class FakeClock:
+    """Replaces the scheduler's monotonic clock and sleeps; sleeping advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduling.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(scheduling.asyncio, "sleep", fake.sleep)
+    return fake
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after": "-5"}) == 0.0
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+    assert parse_retry_after(None) is None
+
+
+def test_parse_retry_after_http_date():
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= parse_retry_after({"retry-after": when}) <= 30
+    past = email.utils.formatdate(time.time() - 30, usegmt=True)
+    assert parse_retry_after({"retry-after": past}) == 0.0
+
+
+def test_parse_retry_after_prefers_milliseconds():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert parse_retry_after({"retry-after-ms": "bad", "retry-after": "9"}) == 9.0
+
+
+def test_token_bucket_refills_continuously_up_to_its_capacity(clock):
+    bucket = TokenBucket(60)  # one token per second
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now += 3
+    # The deficit of one token is repaid first.
+    assert bucket.reserve(2) == 0.0
+    clock.now += 3600
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_token_bucket_clamps_requests_larger_than_its_capacity(clock):
+    bucket = TokenBucket(60)
+    assert bucket.reserve(500) == 0.0
+    assert bucket.tokens == 0
+
+
+def test_rate_limiter_enforces_requests_per_minute(clock):
+    limiter = RateLimiter(requests_per_minute=120, tokens_per_minute=1_000_000)
+
+    async def burst():
+        return [await limiter.acquire() for _ in range(122)]
+
+    waits = asyncio.run(burst())
+    assert waits[:120] == [0.0] * 120
+    assert waits[120:] == [pytest.approx(0.5), pytest.approx(0.5)]
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_rate_limiter_enforces_tokens_per_minute(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+
+    async def requests():
+        return [await limiter.acquire(600), await limiter.acquire(60)]
+
+    assert asyncio.run(requests()) == [0.0, pytest.approx(6.0)]
+
+
+def test_rate_limiter_pause_holds_back_every_request(clock):
+    limiter = RateLimiter(1000, 1_000_000)
+    limiter.pause(10)
+    limiter.pause(2)
+    assert asyncio.run(limiter.acquire()) == pytest.approx(10.0)
+
+
+def test_retry_policy_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(scheduling.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    assert [policy.delay(attempt) for attempt in range(1, 7)] == [1, 2, 4, 8, 10, 10]
+    assert policy.delay(1, retry_after=3.5) == 3.5
+    assert policy.delay(1, retry_after=120) == 10.0
+
+
+def test_scheduler_gives_up_after_max_retries(clock, monkeypatch):
+    monkeypatch.setattr(scheduling.random, "uniform", lambda low, high: high)
+    scheduler = RequestScheduler(
+        "test", RateLimiter(1000, 1_000_000), RetryPolicy(max_retries=2, base_delay=1.0)
+    )
+    calls = []
+
+    async def call():
+        calls.append(clock.now)
+        raise TransientAPIError("busy", status_code=503)
+
+    with pytest.raises(TransientAPIError):
+        asyncio.run(scheduler.run(call))
+    assert len(calls) == 3
+    assert clock.sleeps == [1.0, 2.0]
+    assert scheduler.metrics.retries == 2
+    assert scheduler.metrics.failed == 1
+
+
+def test_scheduler_honors_retry_after_and_pauses_the_provider_on_429(clock):
+    limiter = RateLimiter(1000, 1_000_000)
+    scheduler = RequestScheduler("test", limiter, RetryPolicy(max_retries=3))
+    outcomes = [TransientAPIError("slow down", status_code=429, retry_after=4.0), "ok"]
+
+    async def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert asyncio.run(scheduler.run(call)) == "ok"
+    assert clock.sleeps == [4.0]
+    assert limiter.blocked_until == pytest.approx(clock.now)
+    assert scheduler.metrics.rate_limited == 1
+
+
+def test_scheduler_does_not_retry_permanent_errors(clock):
+    scheduler = RequestScheduler("test", RateLimiter(1000, 1_000_000))
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise APIError("bad request", 400)
+
+    with pytest.raises(APIError):
+        asyncio.run(scheduler.run(call))
+    assert calls == [1]
+    assert scheduler.metrics.failed == 1
@@ -0,0 +1,123 @@
+# tests/test_server.py
+import asyncio
+import http.client
+import json
+import os
+import threading
+import time
+import pytest
+from actions import ActionTransaction
+from conftest import StubAnalyzer, StubEditor, read
+from pipeline import Pipeline, RunContext
+from server import PyImproveService, ServiceHTTPServer
+
+
+TOKEN = "secret"
+
+
+class StallingEditor(StubEditor):
+    """Streams its actions, then never finishes the response."""
+
+    async def stream_actions(self, script_path, analysis_report):
+        async for action in super().stream_actions(script_path, analysis_report):
+            yield action
+        await asyncio.sleep(3600)
+
+
+@pytest.fixture
+def service():
+    service = PyImproveService(cache_path=None)
+    service.start()
+    yield service
+    service.stop()
+
+
+def test_cancelled_job_is_done_only_after_rolling_back(repo, service, monkeypatch):
+    mod = os.path.join(repo.git_toplevel(), "mod.py")
+    original = read(mod)
+    editor = StallingEditor({mod: [{"type": "edit_file", "file_path": mod, "file_contents": "x = 1\n"}]})
+
+    async def process(job, directory):
+        ctx = RunContext(StubAnalyzer(), editor, repo, stream=True)
+        return await Pipeline(ctx).run([mod])
+
+    rollback = ActionTransaction.rollback
+
+    def slow_rollback(transaction):
+        time.sleep(0.3)
+        rollback(transaction)
+
+    monkeypatch.setattr(service, "_process", process)
+    monkeypatch.setattr(ActionTransaction, "rollback", slow_rollback)
+    job = service.submit({"inputs": [mod], "repo": repo.git_toplevel()})
+    deadline = time.monotonic() + 10
+    while read(mod) == original and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == "running"
+
+    service.cancel(job.id)
+
+    assert job.status == "running" and not job.done.is_set()
+    assert job.done.wait(10)
+    assert job.status == "cancelled"
+    assert read(mod) == original
+
+
+def test_a_job_cancelled_while_queued_is_done_at_once(repo, service):
+    blocker = threading.Event()
+    service.loop.call_soon_threadsafe(blocker.wait, 2)  # keeps the loop from starting jobs
+    job = service.submit({"inputs": [os.path.join(repo.git_toplevel(), "mod.py")]})
+
+    service.cancel(job.id)
+
+    assert job.done.is_set() and job.status == "cancelled"
+    blocker.set()
+
+
+@pytest.fixture
+def server(service):
+    server = ServiceHTTPServer(("127.0.0.1", 0), service, TOKEN)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, token=TOKEN, content_type="application/json"):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    headers = {"Content-Type": content_type}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    data = json.loads(response.read() or b"null")
+    connection.close()
+    return response.status, data
+
+
+def test_requests_need_the_token(server):
+    assert request(server, "GET", "/health", token=None)[0] == 401
+    assert request(server, "GET", "/health", token="wrong")[0] == 401
+    assert request(server, "POST", "/jobs", b"{}", token=None)[0] == 401
+    assert request(server, "GET", "/health")[0] == 200
+
+
+def test_jobs_must_be_json(server):
+    status, _ = request(server, "POST", "/jobs", b'{"inputs": ["a.py"]}', content_type="text/plain")
+
+    assert status == 415
+
+
+def test_wait_refuses_a_bad_timeout(repo, server, service):
+    blocker = threading.Event()
+    service.loop.call_soon_threadsafe(blocker.wait, 2)
+    body = json.dumps({"inputs": [os.path.join(repo.git_toplevel(), "mod.py")]}).encode("utf-8")
+    status, job = request(server, "POST", "/jobs", body)
+    assert status == 202
+
+    for timeout in ("abc", "-1", "nan"):
+        status, data = request(server, "GET", f"/jobs/{job['id']}/wait?timeout={timeout}")
+        assert status == 400, timeout
+    service.cancel(job["id"])
+    blocker.set()
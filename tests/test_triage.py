@@ -0,0 +1,185 @@
+# tests/test_triage.py
+import ast
+import asyncio
+import textwrap
+import pytest
+from agents.triage import (
+    Triage,
+    TriageResult,
+    TriageThresholds,
+    add_metrics_to_report,
+    function_metrics,
+    triage_source,
+)
+
+
+def metrics_of(source, thresholds=None):
+    node = ast.parse(textwrap.dedent(source)).body[0]
+    return function_metrics(node, node.name, thresholds or TriageThresholds())
+
+
+def function_with_lines(name, lines):
+    """A straight-line function spanning exactly `lines` lines."""
+    body = "".join(f"    x{i} = {i}\n" for i in range(lines - 2))
+    return f"def {name}():\n{body}    return 0\n"
+
+
+def function_with_complexity(name, complexity):
+    body = "".join(f"    if x == {i}:\n        return {i}\n" for i in range(complexity - 1))
+    return f"def {name}(x):\n{body}    return x\n"
+
+
+def test_visitor_counts_branches_boolean_operators_and_comprehension_filters():
+    metrics = metrics_of(
+        """
+        def f(xs, a, b, c):
+            if a and b or c:
+                pass
+            return [x for x in xs if x if not x]
+        """
+    )
+    # 1 + if + 2 for the boolean operators + 1 for the comprehension + 2 filters
+    assert metrics.complexity == 7
+    assert metrics.loop_depth == 1
+    assert metrics.lines == 4
+
+
+def test_visitor_tracks_loop_depth_through_comprehensions_and_nested_functions():
+    metrics = metrics_of(
+        """
+        def f(rows):
+            for row in rows:
+                def g(cells):
+                    return [c for c in cells for _ in c]
+            return g
+        """
+    )
+    assert metrics.loop_depth == 3
+
+
+def test_visitor_flags_string_concatenation_in_loops_only():
+    metrics = metrics_of(
+        """
+        def f(items):
+            out = ""
+            out += "header"
+            for item in items:
+                out += item
+                total = 0
+                total += 1
+            return out
+        """
+    )
+    assert metrics.string_concat_in_loop == 1
+    assert "string_concat_in_loop" in metrics.smells
+
+
+def test_visitor_counts_eval_and_exec():
+    metrics = metrics_of(
+        """
+        def f(code):
+            exec(code)
+            return eval(code)
+        """
+    )
+    assert metrics.eval_calls == 2
+    assert metrics.smells == ["eval"]
+
+
+def test_loop_depth_threshold():
+    single = metrics_of(
+        """
+        def f(xs):
+            for x in xs:
+                print(x)
+        """
+    )
+    nested = metrics_of(
+        """
+        def f(xs):
+            for x in xs:
+                for y in x:
+                    print(y)
+        """
+    )
+    assert single.loop_depth == 1 and "nested_loops" not in single.smells
+    assert nested.loop_depth == 2 and "nested_loops" in nested.smells
+
+
+def test_repeated_lookups_threshold():
+    twice = metrics_of(
+        """
+        def f(obj, xs):
+            for x in xs:
+                obj.items.append(obj.items[0])
+        """
+    )
+    three_times = metrics_of(
+        """
+        def f(obj, xs):
+            for x in xs:
+                obj.items.append(obj.items[0] + obj.items[-1])
+        """
+    )
+    assert twice.repeated_lookups == 2 and "repeated_lookups" not in twice.smells
+    assert three_times.repeated_lookups == 3 and "repeated_lookups" in three_times.smells
+
+
+@pytest.mark.parametrize(
+    "below, at",
+    [
+        (function_with_lines("f", 24), function_with_lines("g", 25)),
+        (function_with_complexity("f", 5), function_with_complexity("g", 6)),
+    ],
+)
+def test_size_thresholds_decide_the_selection(below, at):
+    result = triage_source(below + "\n" + at)
+    assert [m.smells for m in result.functions] == [[], []]
+    assert result.selected == ["g"]
+
+
+def test_methods_are_qualified_and_generated_files_are_not_selected():
+    source = "class A:\n" + textwrap.indent(function_with_complexity("m", 6), "    ")
+    assert triage_source(source).selected == ["A.m"]
+    generated = triage_source("# @generated by a tool\n" + source)
+    assert generated.generated
+    assert [m.qualified_name for m in generated.functions] == ["A.m"]
+    assert generated.selected == []
+
+
+def test_syntax_errors_are_reported():
+    result = triage_source("def f(:\n")
+    assert result.error and result.functions == []
+
+
+def test_static_metrics_block_lists_only_selected_functions_inside_the_root():
+    result = triage_source(function_with_lines("small", 3) + "\n" + function_with_lines("big", 30))
+    report = add_metrics_to_report("<structure>\n<function name='big'/>\n</structure>", result)
+    head, block = report.split("<static_metrics>")
+    assert head == "<structure>\n<function name='big'/>\n"
+    assert block.endswith("</static_metrics>\n</structure>")
+    assert "name=\"big\"" in block and "lines='30'" in block
+    assert "small" not in block
+
+
+def test_static_metrics_block_is_appended_without_a_root():
+    report = add_metrics_to_report("free text", TriageResult("x.py"))
+    assert report == "free text\n<static_metrics>\n</static_metrics>"
+
+
+def test_triage_runs_in_a_spawned_pool_and_close_shuts_it_down(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(function_with_complexity("f", 6), encoding="utf-8")
+    triage = Triage(max_workers=1)
+    try:
+        result = asyncio.run(triage.run(str(script)))
+        pool = triage._pool
+        assert result.selected == ["f"]
+        assert pool._mp_context.get_start_method() == "spawn"
+        processes = list(pool._processes.values())
+        assert processes
+    finally:
+        triage.close()
+    assert triage._pool is None
+    assert all(not process.is_alive() for process in processes)
+    triage.close()
@@ -0,0 +1,129 @@
+# tests/test_verification.py
+import asyncio
+import os
+import pytest
+from conftest import StubAnalyzer, StubEditor, git, read, write
+from pipeline import Pipeline, RunContext
+import verification
+from verification import Verifier, changed_functions
+
+
+CALC = "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n"
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    write(root / "calc.py", CALC)
+    write(root / "tests" / "test_add.py", "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n")
+    write(root / "tests" / "test_sub.py", "import calc\n\n\ndef test_sub():\n    assert calc.sub(3, 2) == 1\n")
+    write(root / "tests" / "test_other.py", "def test_other():\n    assert True\n")
+    return root
+
+
+def test_changed_functions_names_edited_functions():
+    assert changed_functions(CALC, CALC.replace("a + b", "b + a")) == {"add"}
+    assert changed_functions(CALC, "import os\n" + CALC) is None
+    assert changed_functions(None, CALC) is None
+
+
+def test_test_map_selects_importers_that_call_the_changed_functions(project):
+    test_map = verification.TestMap(str(project)).build()
+    calc = str(project / "calc.py")
+
+    assert [os.path.basename(t) for t in test_map.select({calc: {"add"}})] == ["test_add.py"]
+    assert [os.path.basename(t) for t in test_map.select({calc: {"sub"}})] == ["test_sub.py"]
+    assert [os.path.basename(t) for t in test_map.select({calc: None})] == ["test_add.py", "test_sub.py"]
+
+
+def test_verifier_runs_only_affected_tests(project):
+    verifier = Verifier(str(project))
+    calc = str(project / "calc.py")
+    write(calc, CALC.replace("a - b", "b - a"))
+
+    result = asyncio.run(verifier.verify({calc: CALC}))
+
+    assert not result.ok
+    assert [os.path.basename(t) for t in result.tests] == ["test_sub.py"]
+
+
+def test_verifier_rejects_files_that_do_not_compile(project):
+    calc = str(project / "calc.py")
+    write(calc, "def add(a, b)\n")
+
+    result = asyncio.run(Verifier(str(project)).verify({calc: CALC}))
+
+    assert not result.ok
+    assert "does not compile" in result.error
+
+
+def _pipeline(repo, actions, stream=False):
+    verifier = Verifier(repo.git_toplevel())
+    ctx = RunContext(StubAnalyzer(), StubEditor(actions), repo, stream=stream, verifier=verifier)
+    return Pipeline(ctx)
+
+
+@pytest.fixture
+def calc_repo(repo):
+    root = repo.git_toplevel()
+    write(os.path.join(root, "calc.py"), CALC)
+    write(os.path.join(root, "test_calc.py"), "from calc import sub\n\n\ndef test_sub():\n    assert sub(3, 2) == 1\n")
+    git(root, "add", ".")
+    git(root, "commit", "-q", "-m", "calc")
+    return repo
+
+
+def test_failing_edit_is_rolled_back_and_rejected(calc_repo):
+    root = calc_repo.git_toplevel()
+    calc = os.path.join(root, "calc.py")
+    head = calc_repo.git_head()
+    edit = {"type": "edit_file", "file_path": calc, "file_contents": CALC.replace("a - b", "b - a")}
+
+    [result] = asyncio.run(_pipeline(calc_repo, {calc: [edit]}).run([calc]))
+
+    assert result.status == "rejected"
+    assert read(calc) == CALC
+    assert git(root, "rev-parse", "HEAD") == head
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_passing_edit_is_committed(calc_repo, stream):
+    root = calc_repo.git_toplevel()
+    calc = os.path.join(root, "calc.py")
+    fixed = CALC.replace("a + b", "b + a")
+    edit = {"type": "edit_file", "file_path": calc, "file_contents": fixed}
+
+    [result] = asyncio.run(_pipeline(calc_repo, {calc: [edit]}, stream).run([calc]))
+
+    assert result.status == "edited"
+    assert git(root, "show", "HEAD:calc.py") + "\n" == fixed
+    assert git(root, "status", "--porcelain") == ""
+
+
+def test_streamed_edits_stay_out_of_the_tree_until_verified(calc_repo):
+    root = calc_repo.git_toplevel()
+    calc = os.path.join(root, "calc.py")
+    other = os.path.join(root, "other.py")
+    dirty = []
+    pipeline = _pipeline(
+        calc_repo,
+        {other: [{"type": "create_file", "file_path": other, "file_contents": "x = 1\n"}]},
+        stream=True,
+    )
+    verify = pipeline.ctx.verifier.verify
+
+    async def spy(edits, root=None):
+        checkout = root or pipeline.ctx.verifier.root
+        status = git(checkout, "status", "--porcelain").splitlines()
+        dirty.append((set(edits), {os.path.join(checkout, line.split(maxsplit=1)[1]) for line in status}))
+        return await verify(edits, root)
+
+    pipeline.ctx.verifier.verify = spy
+    calc_edit = {"type": "edit_file", "file_path": calc, "file_contents": CALC.replace("a + b", "b + a")}
+    pipeline.ctx.editor.actions[calc] = [calc_edit]
+
+    results = asyncio.run(pipeline.run([calc, other]))
+
+    assert [r.status for r in results] == ["edited", "edited"]
+    # Only the files being verified are modified while their tests run.
+    assert dirty and all(changed <= set(edits) for edits, changed in dirty)
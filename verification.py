@@ -0,0 +1,274 @@
+# verification.py
+import ast
+import asyncio
+import fnmatch
+import importlib.util
+import logging
+import os
+import shlex
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+import metrics
+from agents.chunking import split_functions
+
+TEST_PATTERNS = ("test_*.py", "*_test.py")
+SKIP_DIRS = {"__pycache__", "node_modules", "venv", "env", "build", "dist", "site-packages"}
+
+# pytest exits with 5 when a file collects no tests; that is not a failure.
+PYTEST_NO_TESTS = 5
+
+
+@dataclass
+class TestFileInfo:
+    """What a test file imports and which names it calls or references."""
+
+    path: str
+    modules: Set[str] = field(default_factory=set)
+    names: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class VerificationResult:
+    """Outcome of verifying one set of edits."""
+
+    ok: bool
+    tests: List[str] = field(default_factory=list)
+    failures: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def summary(self) -> str:
+        if self.error:
+            return self.error
+        if self.failures:
+            return f"{len(self.failures)} of {len(self.tests)} test files failed: " + ", ".join(
+                os.path.basename(path) for path in self.failures
+            )
+        return f"{len(self.tests)} test files passed"
+
+
+def module_names(path: str, root: str) -> List[str]:
+    """
+    Returns the dotted names a file may be imported as, longest first:
+    `src/pkg/mod.py` gives ["src.pkg.mod", "pkg.mod", "mod"], to cover
+    source layouts where a subdirectory is on sys.path.
+    """
+    relative = os.path.relpath(os.path.abspath(path), root)
+    parts = relative[: -len(".py")].split(os.sep) if relative.endswith(".py") else relative.split(os.sep)
+    if parts and parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts)) if parts[i:]]
+
+
+class TestMap:
+    """
+    A static map from test files to the modules they import and the names
+    they call, used to select the tests affected by an edit.
+    """
+
+    def __init__(self, root: str, patterns=TEST_PATTERNS):
+        self.root = os.path.abspath(root)
+        self.patterns = patterns
+        self.tests: Dict[str, TestFileInfo] = {}
+
+    def is_test_file(self, path: str) -> bool:
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def build(self) -> "TestMap":
+        """Scans the tree for test files and parses each one."""
+        self.tests = {}
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith(".") and d not in SKIP_DIRS]
+            for name in files:
+                path = os.path.join(directory, name)
+                if self.is_test_file(path):
+                    info = self._scan(path)
+                    if info is not None:
+                        self.tests[path] = info
+        return self
+
+    def _scan(self, path: str) -> Optional[TestFileInfo]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), path)
+        except (OSError, SyntaxError, ValueError) as e:
+            logging.warning(f"Skipping unparsable test file {path}: {e}")
+            return None
+        info = TestFileInfo(path)
+        package = module_names(os.path.dirname(path), self.root)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                info.modules.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level and package:
+                    parent = package[0].split(".")[: len(package[0].split(".")) - node.level + 1]
+                    base = ".".join(parent + ([base] if base else []))
+                if base:
+                    info.modules.add(base)
+                for alias in node.names:
+                    # `from pkg import mod` imports a module; `from mod import f` a name.
+                    info.modules.add(f"{base}.{alias.name}" if base else alias.name)
+                    info.names.add(alias.name)
+            elif isinstance(node, ast.Call):
+                if isinstance(node.func, ast.Name):
+                    info.names.add(node.func.id)
+                elif isinstance(node.func, ast.Attribute):
+                    info.names.add(node.func.attr)
+            elif isinstance(node, ast.Attribute):
+                info.names.add(node.attr)
+        return info
+
+    def select(self, changes: Dict[str, Optional[Set[str]]]) -> List[str]:
+        """
+        Returns the test files affected by `changes`, which maps each edited
+        file to the names of its changed functions, or None if module-level
+        code changed and every importer is affected.
+        """
+        selected = set()
+        for path, functions in changes.items():
+            path = os.path.abspath(path)
+            if path in self.tests:
+                selected.add(path)
+                continue
+            candidates = module_names(path, self.root)
+            for test, info in self.tests.items():
+                imports = any(
+                    module == candidate
+                    or module.startswith(candidate + ".")
+                    or candidate.startswith(module + ".")
+                    for module in info.modules
+                    for candidate in candidates
+                )
+                if imports and (functions is None or functions & info.names):
+                    selected.add(test)
+        return sorted(selected)
+
+
+def changed_functions(old: Optional[str], new: Optional[str]) -> Optional[Set[str]]:
+    """
+    Returns the names of functions and classes whose code differs between
+    two versions of a file, or None if code outside functions changed too.
+    """
+    if old is None or new is None:
+        return None
+    try:
+        old_chunks = {chunk.qualified_name: chunk for chunk in split_functions(old)}
+        new_chunks = {chunk.qualified_name: chunk for chunk in split_functions(new)}
+    except SyntaxError:
+        return None
+    if _skeleton(old, old_chunks.values()) != _skeleton(new, new_chunks.values()):
+        return None
+    names = set()
+    for qualified_name in set(old_chunks) | set(new_chunks):
+        before, after = old_chunks.get(qualified_name), new_chunks.get(qualified_name)
+        if before is None or after is None or before.source != after.source:
+            # Tests reach a method through its class as often as by its name.
+            names.update(qualified_name.split("."))
+    return names
+
+
+def _skeleton(source: str, chunks) -> str:
+    """The source with every function removed."""
+    lines = source.splitlines()
+    for chunk in chunks:
+        for number in range(chunk.lineno - 1, chunk.end_lineno):
+            lines[number] = ""
+    return "\n".join(line for line in lines if line.strip())
+
+
+def default_test_command() -> List[str]:
+    if importlib.util.find_spec("pytest") is not None:
+        return [sys.executable, "-m", "pytest", "-q", "-x", "-p", "no:cacheprovider", "{test}"]
+    return [sys.executable, "-m", "unittest", "{test}"]
+
+
+class Verifier:
+    """
+    Verifies edits before they are committed: every edited Python file must
+    compile, and the test files that import and call the changed functions
+    must pass. Test files run in separate interpreter processes, at most
+    `max_workers` at a time, so module state never leaks between edits.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        test_command: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        timeout: float = 300.0,
+    ):
+        self.root = os.path.abspath(root)
+        self.command = shlex.split(test_command) if test_command else default_test_command()
+        if not any("{test}" in part for part in self.command):
+            self.command.append("{test}")
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.timeout = timeout
+        self.test_map = TestMap(self.root).build()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        logging.info(f"Verification: {len(self.test_map.tests)} test files mapped.")
+
+    async def verify(
+        self, edits: Dict[str, Optional[str]], root: Optional[str] = None
+    ) -> VerificationResult:
+        """
+        Verifies the working tree after edits. `edits` maps each touched path
+        to its contents before the edit (None for new files). `root` is the
+        checkout the edits were made in, if not the mapped tree itself (e.g.
+        a worktree of it); tests are selected by their relative paths and run
+        there.
+        """
+        root = os.path.abspath(root or self.root)
+        with metrics.timer("verify_seconds"):
+            changes = {}
+            for path, old in edits.items():
+                if not path.endswith(".py") or not os.path.exists(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    new = f.read()
+                try:
+                    compile(new, path, "exec")
+                except SyntaxError as e:
+                    return VerificationResult(False, error=f"{path} does not compile: {e}")
+                mapped = os.path.join(self.root, os.path.relpath(os.path.abspath(path), root))
+                changes[mapped] = changed_functions(old, new)
+
+            tests = [
+                os.path.join(root, os.path.relpath(test, self.root))
+                for test in self.test_map.select(changes)
+            ]
+            if not tests:
+                return VerificationResult(True)
+            logging.info(f"Verification: running {len(tests)} test files.")
+            outcomes = await asyncio.gather(*(self._run(test, root) for test in tests))
+            failures = {test: output for test, output in zip(tests, outcomes) if output is not None}
+            metrics.inc("tests_run_total", len(tests))
+            metrics.inc("tests_failed_total", len(failures))
+            return VerificationResult(not failures, tests, failures)
+
+    async def _run(self, test: str, root: str) -> Optional[str]:
+        """Runs one test file; returns its output if it failed, else None."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        command = [part.replace("{test}", test) for part in self.command]
+        async with self._semaphore:
+            started = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=root,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+            try:
+                output, _ = await asyncio.wait_for(process.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return f"Timed out after {self.timeout:.0f}s"
+            finally:
+                metrics.observe("test_file_seconds", time.perf_counter() - started)
+        if process.returncode in (0, PYTEST_NO_TESTS):
+            return None
+        return output.decode("utf-8", errors="replace")[-4000:]